@@ -1,4 +1,3 @@
-import pandas as pd
 import os
 import sys
 from datetime import datetime
@@ -6,13 +5,24 @@ import time
 import random
 import re
 import json
-import requests
-from bs4 import BeautifulSoup
+
+from ceniki import log, options, pipeline, profiling, refresh, sampling, trace
+from ceniki.archive import RawArchive, archive_dir
+from ceniki.export import export_records, read_excel_records, selected_formats, base_path, RecordSource
+from ceniki.fetch import Fetcher, CircuitOpenError, fetch_detail, parse_html
+from ceniki.health import ExtractionHealthError, HealthMonitor
+from ceniki.pagecache import PageCache, cache_path
+from ceniki.pagesize import PageSize
+from ceniki.persist import BackgroundSaver
+from ceniki.pending import pending_path, resume_work, save_pending, clear_pending
+from ceniki.priority import change_scores
+from ceniki.schedule import Deadline, Scheduler
 
 # --- Konfiguracija ---
 SHOP_NAME = "Merkur"
 BASE_URL = "https://www.merkur.si"
 DDV_RATE = 0.22
+ENCODING = "utf-8"  # če strežnik ne pošlje charset v Content-Type
 
 # --- Varnostne nastavitve ---
 USER_AGENTS = [
@@ -49,23 +59,17 @@ MERKUR_CATEGORIES = {
 }
 
 # --- Globalne spremenljivke ---
-_log_file = None
 _global_item_counter = 0
 
+_options = options.parse_args()
+# JSON piše save_to_json, save_to_excel pa ostale izbrane formate (xlsx, csv, ...).
+_export_formats = [f for f in selected_formats(_options) if f != "json"]
+
 
 # --- Standardne pomožne funkcije ---
 
 def log_and_print(message, to_file=True):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    full_message = f"[{timestamp}] {message}"
-    print(full_message)
-    if to_file and _log_file:
-        try:
-            _log_file.write(full_message + '\n')
-            _log_file.flush()
-        except Exception as e:
-            print(f"NAPAKA: Ni mogoče zapisati v log datoteko: {e}")
-
+    log.info(message, to_file=to_file)
 
 def create_output_and_log_paths(shop_name):
     """Ustvari poti za output (excel+json) in log.
@@ -102,6 +106,7 @@ def create_output_and_log_paths(shop_name):
 
 
 
+@profiling.phase("persist")
 def save_to_json(data, filepath):
     """Shrani podatke v JSON (UTF-8, pretty)."""
     if not data:
@@ -114,50 +119,40 @@ def save_to_json(data, filepath):
     except Exception as e:
         log_and_print(f"Napaka pri shranjevanju v JSON: {e}", to_file=True)
 
+def _zap_value(item):
+    try:
+        return float(item.get('Zap'))
+    except (TypeError, ValueError):
+        return None
+
+
+@profiling.phase("persist")
 def save_to_excel(data, filepath):
+    """Izvozi podatke v izbrane formate (privzeto xlsx), urejene po Zap."""
     if not data:
         log_and_print("Ni novih podatkov za shranjevanje v Excel.", to_file=True)
         return
+    if not _export_formats:
+        return
 
-    df_new = pd.DataFrame(data)
+    # Zadnji zapis za posamezen URL zmaga, nato uredimo po Zap in oštevilčimo na novo.
+    by_url = {}
+    for item in data:
+        by_url[item.get('URL')] = item
+    ordered = sorted(by_url.values(), key=lambda item: (_zap_value(item) is None, _zap_value(item) or 0))
+    rows = RecordSource(lambda: (dict(item, Zap=i) for i, item in enumerate(ordered, start=1)))
+
+    export_records(rows, base_path(filepath), _export_formats, log=log_and_print)
 
-    try:
-        if os.path.exists(filepath):
-            existing_df = pd.read_excel(filepath)
-            combined_df = pd.concat([existing_df, df_new], ignore_index=True)
-        else:
-            combined_df = df_new
-
-        combined_df.drop_duplicates(subset=['URL'], keep='last', inplace=True)
-
-        desired_columns = ["Skupina", "Zap", "Oznaka / naziv", "EAN", "Opis", "EM", "Valuta", "DDV", "Proizvajalec",
-                           "Veljavnost od", "Dobava", "Cena / EM (z DDV)", "Akcijska cena / EM (z DDV)",
-                           "Cena / EM (brez DDV)", "Akcijska cena / EM (brez DDV)", "URL", "SLIKA URL"]
-        for col in desired_columns:
-            if col not in combined_df.columns:
-                combined_df[col] = ''
-
-        df_final = combined_df[desired_columns].sort_values(by="Zap").reset_index(drop=True)
-        df_final['Zap'] = df_final.index + 1
-
-        df_final.to_excel(filepath, index=False)
-        log_and_print(f"Podatki uspešno shranjeni/posodobljeni v: {filepath}", to_file=True)
-    except Exception as e:
-        error_msg = f"Napaka pri shranjevanju v Excel: {e}"
-        log_and_print(error_msg, to_file=True)
-        # TUKAJ SMO ZAMENJALI MESSAGEBOX S PRINTOM
-        print(f"CRITICAL ERROR: {error_msg}")
+
+_fetcher = Fetcher(user_agents=USER_AGENTS, timeout=20, encoding=ENCODING, log=log_and_print,
+                   hedge=_options.hedge)
+# Število izdelkov na strani seznama (limit=, kot pri Magentu); preveri se med zajemom.
+_page_size = PageSize("limit", (96, 48), log=log_and_print)
 
 
 def get_page_content(url):
-    headers = {'User-Agent': random.choice(USER_AGENTS)}
-    try:
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException as e:
-        log_and_print(f"Napaka pri dostopu do URL-ja {url}: {e}", to_file=True)
-        return None
+    return _fetcher.get(url)
 
 
 def convert_price_to_without_vat(price_str, vat_rate):
@@ -178,10 +173,26 @@ def clean_price_string(price_str):
 
 # --- Funkcije, specifične za Merkur ---
 
-def get_product_details(product_url, group_name, query_date, item_html):
-    """Pridobi podrobnosti o izdelku."""
-    global _global_item_counter
+# Polja, ki jih bere extract_product_details (za delni prenos s STREAM_DETAILS=1)
+STREAM_FIELDS = {"Oznaka / naziv": "div.product-id"}
+
+
+@profiling.phase("extract")
+def extract_product_details(page):
+    """Iz strani izdelka prebere šifro (ostalo je že na seznamu)."""
+    soup2 = parse_html(page, 'html.parser')
+    details = {}
+
+    sifra_tag = soup2.find("div", class_="product-id")
+    if sifra_tag:
+        sifraint = re.findall(r'\d+', sifra_tag.text)
+        details['Oznaka / naziv'] = sifraint[0] if sifraint else ''
+
+    return details
+
 
+def listing_data(item_html, product_url):
+    """Podatki, ki so že na seznamu izdelkov (opis, cena, slika)."""
     opis = item_html.h3.text.strip() if item_html.h3 else ""
     cena = ""
     cenastri_tag = item_html.span
@@ -190,16 +201,69 @@ def get_product_details(product_url, group_name, query_date, item_html):
         if cenaint:
             cena = cenaint[0] if len(cenaint) == 1 else cenaint[1]
 
-    if not opis and not cena:
-        log_and_print(f"      Preskakujem izdelek brez opisa in cene: {product_url}", to_file=True)
-        return None
-
-    log_and_print(f"    - Zajemanje podrobnosti za: {opis}", to_file=True)
+    slikca_tag = item_html.find("img")
+    return {"URL": product_url, "Opis": opis, "Cena / EM (z DDV)": cena,
+            "SLIKA URL": slikca_tag.get("src") if slikca_tag else ''}
+
+
+@profiling.phase("discovery")
+def get_products_from_category(sub_cat_url):
+    """Vsi izdelki s strani seznama podkategorije."""
+    products = []
+    stariprvi = "star"
+    n = 1
+
+    while True:
+        paginated_url = _page_size.url(f"{sub_cat_url}?p={n}#section-products")
+        log_and_print(f"    Obdelujem stran {n}: {paginated_url}", to_file=True)
+
+        # Premor pred vsako stranjo seznama, tudi med kategorijami.
+        trace.sleep(random.uniform(2.0, 5.0))
+        page = get_page_content(paginated_url)
+        if not page: break
+
+        soup1 = parse_html(page, 'lxml')
+        item_container = soup1.find("div", class_="list-items")
+        izdelek_list = item_container.find_all("div", class_="item") if item_container else []
+        if n == 1 and not _page_size.first_page(len(izdelek_list), bool(soup1.select_one('a.next'))):
+            return get_products_from_category(sub_cat_url)
+        if not izdelek_list: break
+        log.event("listing_page", url=paginated_url, page=n, products=len(izdelek_list))
+
+        noviprvi = izdelek_list[0].h3.text.strip() if izdelek_list[0].h3 else None
+        if n > 1 and noviprvi == stariprvi:
+            log_and_print(f"      Vsebina strani {n} se ponavlja. Zaključujem.", to_file=True)
+            break
+        stariprvi = noviprvi
+
+        for i in izdelek_list:
+            link_tag = i.find("a")
+            if not (link_tag and link_tag.get("href")): continue
+            products.append(listing_data(i, link_tag.get("href")))
+
+        if not soup1.select_one('a.next'): break
+        n += 1
+    return products
+
+
+def worth_fetching(listing, group_name):
+    if not listing["Opis"] and not listing["Cena / EM (z DDV)"]:
+        log.item(f"      Preskakujem izdelek brez opisa in cene: {listing['URL']}", url=listing["URL"],
+                 category=group_name)
+        return False
+    return True
+
+
+def finish_product(listing, details, group_name, query_date, elapsed_ms):
+    """Zapis izdelka iz podatkov s seznama in detajlov s strani izdelka."""
+    global _global_item_counter
 
-    details_html = get_page_content(product_url)
-    if not details_html: return None
+    product_url = listing["URL"]
+    opis = listing["Opis"]
+    cena = listing["Cena / EM (z DDV)"]
 
-    soup2 = BeautifulSoup(details_html, "html.parser")
+    log.event("product", category=group_name, url=product_url, ok=details is not None, elapsed_ms=elapsed_ms)
+    if details is None: return None
 
     _global_item_counter += 1
     product_data = {
@@ -207,43 +271,123 @@ def get_product_details(product_url, group_name, query_date, item_html):
         "Veljavnost od": query_date, "Valuta": "EUR", "DDV": "22", "EM": "KOS",
         "Opis": opis, "Cena / EM (z DDV)": cena
     }
+    product_data.update(details)
 
-    sifra_tag = soup2.find("div", class_="product-id")
-    if sifra_tag:
-        sifraint = re.findall(r'\d+', sifra_tag.text)
-        product_data['Oznaka / naziv'] = sifraint[0] if sifraint else ''
-
-    slikca_tag = item_html.find("img")
-    product_data['SLIKA URL'] = slikca_tag.get("src") if slikca_tag else ''
+    product_data['SLIKA URL'] = listing["SLIKA URL"]
     product_data['Cena / EM (brez DDV)'] = convert_price_to_without_vat(cena, DDV_RATE)
 
     return product_data
 
 
+def get_product_details(listing, group_name, query_date):
+    """Pridobi podrobnosti o izdelku."""
+    if not worth_fetching(listing, group_name): return None
+    log.item(f"    - Zajemanje podrobnosti za: {listing['Opis']}", url=listing["URL"], category=group_name)
+
+    t0 = time.perf_counter()
+    details = fetch_detail(_fetcher, listing["URL"], extract_product_details, STREAM_FIELDS)
+    return finish_product(listing, details, group_name, query_date, round((time.perf_counter() - t0) * 1000))
+
+
+def sub_category_name(sub_cat_url):
+    return sub_cat_url.strip('/').split('/')[-1].replace('-', ' ').capitalize()
+
+
+# --- Vmesnik za ceniki.worker (deljena vrsta opravil) ---
+
+def crawl_work():
+    return [(name, url) for name, urls in MERKUR_CATEGORIES.items() for url in urls]
+
+
+def crawl_discover(group):
+    return get_products_from_category(group[1])
+
+
+def crawl_detail(group, listing):
+    return get_product_details(listing, sub_category_name(group[1]), datetime.now().strftime("%d/%m/%Y"))
+
+
+def crawl_save(records):
+    output_filepath, json_filepath, _log_filepath = create_output_and_log_paths(SHOP_NAME)
+    save_merged(records, json_filepath, output_filepath)
+
+
+def save_merged(records, json_filepath, output_filepath):
+    existing = []
+    if os.path.exists(json_filepath):
+        with open(json_filepath, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    merged = list({d.get('URL'): d for d in existing + records}.values())
+    save_to_json(merged, json_filepath)
+    save_to_excel(merged, output_filepath)
+
+
+# --- Vmesnik za ceniki.reparse (ponovni zajem iz arhiva) ---
+
+def reparse_record(page, record):
+    return dict(record, **extract_product_details(page))
+
+
+def reparse_save(records, json_filepath):
+    save_merged(records, json_filepath, base_path(json_filepath) + '.xlsx')
+
+
+# --- Vmesnik za ceniki.sampling (hitri indeks cen iz vzorca) ---
+
+def sample_records(skupina, records):
+    # Cena je na seznamu: preberemo sezname skupine namesto strani izdelkov.
+    urls = [url for _name, url in crawl_work() if sub_category_name(url) == skupina]
+    listed = {d['URL']: d for url in urls for d in get_products_from_category(url)}
+    return [dict(r, **listed[r['URL']]) for r in records if r['URL'] in listed]
+
+
+# --- Vmesnik za ceniki.refresh (osvežitev cen znanih izdelkov) ---
+
+def price_records(skupina, records):
+    # Cena je na seznamu, kot pri vzorčenju; cena brez DDV se izračuna šele v finish_product.
+    return [dict(r, **{'Cena / EM (brez DDV)': convert_price_to_without_vat(r['Cena / EM (z DDV)'], DDV_RATE)})
+            for r in sample_records(skupina, records)]
+
+
 # --- Glavna funkcija ---
 
 def main():
-    global _log_file, _global_item_counter
+    global _global_item_counter
     output_filepath, json_filepath, log_filepath = create_output_and_log_paths(SHOP_NAME)
     try:
-        _log_file = open(log_filepath, 'w', encoding='utf-8')
+        log.setup(SHOP_NAME, log_filepath, items=_options.log_items)
     except Exception as e:
         print(f"CRITICAL ERROR: Ni mogoče ustvariti log datoteke: {e}")
         return
 
     log_and_print(f"--- Zagon zajemanja podatkov iz {SHOP_NAME} ---", to_file=True)
+    if _options.sample:
+        sampling.run(SHOP_NAME, json_filepath, sample_records, _options.sample, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.refresh_prices:
+        refresh.run(SHOP_NAME, json_filepath, price_records, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.profile:
+        profiling.start(SHOP_NAME, profiling.profile_dir(json_filepath))
+    if _options.trace:
+        trace.start(SHOP_NAME, profiling.profile_dir(json_filepath))
+    if _options.archive:
+        _fetcher.archive = RawArchive(archive_dir(json_filepath), SHOP_NAME)
     all_products_data = []
     
-    # Preverimo, če že obstaja datoteka in naložimo obstoječe
-    if os.path.exists(output_filepath):
+    # Preverimo, če že obstaja datoteka in naložimo obstoječe (JSON prednostno)
+    if os.path.exists(json_filepath) or os.path.exists(output_filepath):
         try:
-            existing_df = pd.read_excel(output_filepath)
-            all_products_data = existing_df.to_dict(orient='records')
-            if not existing_df.empty and 'Zap' in existing_df.columns:
-                 # Varno branje max vrednosti
-                numeric_zaps = pd.to_numeric(existing_df['Zap'], errors='coerce').dropna()
-                if not numeric_zaps.empty:
-                     _global_item_counter = int(numeric_zaps.max())
+            if os.path.exists(json_filepath):
+                with open(json_filepath, 'r', encoding='utf-8') as f:
+                    all_products_data = json.load(f)
+            else:
+                all_products_data = read_excel_records(output_filepath)
+            numeric_zaps = [z for z in (_zap_value(d) for d in all_products_data) if z is not None]
+            if numeric_zaps:
+                _global_item_counter = int(max(numeric_zaps))
             log_and_print(f"Naloženi obstoječi podatki. Števec 'Zap' nastavljen na {_global_item_counter}.",
                           to_file=True)
         except Exception as e:
@@ -251,89 +395,95 @@ def main():
 
     query_date = datetime.now().strftime("%d/%m/%Y")
 
+    pending_file = pending_path(json_filepath)
+    work, resumed = resume_work(pending_file, json_filepath, crawl_work)
+    if resumed:
+        log_and_print(f"Nadaljujem {resumed} nedokončanih podkategorij.", to_file=True)
+
+    # Pripravimo set obstoječih URL-jev za hitrejše iskanje
+    existing_urls = {d.get('URL') for d in all_products_data if d.get('URL')}
+    sched = Scheduler(Deadline.from_options(_options), log=log_and_print, skip=existing_urls,
+                      key=lambda listing: listing["URL"],
+                      scores=change_scores(json_filepath) if _options.priority else None)
+    health = HealthMonitor.for_run(json_filepath)
+    cache = PageCache(cache_path(json_filepath)) if _options.page_cache else None
+    new_data = []
+    queued = set()
+
+    def save_batch(batch):
+        # Teče v niti za shranjevanje: new_data do saver.close() spreminja le ta funkcija.
+        new_data.extend(batch)
+        save_to_json(all_products_data + new_data, json_filepath)
+        save_to_excel(all_products_data + new_data, output_filepath)
+
+    saver = BackgroundSaver(save_batch, log=log_and_print)
     try:
-        for main_category_name, subcategory_urls in MERKUR_CATEGORIES.items():
-            log_and_print(f"\n--- Obdelujem glavno kategorijo: {main_category_name} ---", to_file=True)
-            for sub_cat_url in subcategory_urls:
-                sub_cat_name = sub_cat_url.strip('/').split('/')[-1]
-                group_name_for_excel = sub_cat_name.replace('-', ' ').capitalize()
-
-                log_and_print(f"\n  -- Začenjam obdelavo podkategorije: {group_name_for_excel} --", to_file=True)
-
-                stariprvi = "star"
-                n = 1
-                new_data_for_category = []
-                # Pripravimo set obstoječih URL-jev za hitrejše iskanje
-                existing_urls = {d.get('URL') for d in all_products_data if d.get('URL')}
-
-                while True:
-                    paginated_url = f"{sub_cat_url}?p={n}#section-products"
-                    log_and_print(f"    Obdelujem stran {n}: {paginated_url}", to_file=True)
-
-                    html_content = get_page_content(paginated_url)
-                    if not html_content: break
-
-                    soup1 = BeautifulSoup(html_content, 'lxml')
-                    item_container = soup1.find("div", class_="list-items")
-                    if not item_container: break
-
-                    izdelek_list = item_container.find_all("div", class_="item")
-                    if not izdelek_list: break
-
-                    noviprvi = izdelek_list[0].h3.text.strip() if izdelek_list[0].h3 else None
-                    if n > 1 and noviprvi == stariprvi:
-                        log_and_print(f"      Vsebina strani {n} se ponavlja. Zaključujem.", to_file=True)
-                        break
-                    stariprvi = noviprvi
-
-                    for i in izdelek_list:
-                        link_tag = i.find("a")
-                        if not (link_tag and link_tag.get("href")): continue
-
-                        product_url = link_tag.get("href")
-                        if product_url in existing_urls: continue
-
-                        # Podatke posredujemo v funkcijo
-                        details = get_product_details(product_url, group_name_for_excel, query_date, i)
-
-                        if details:
-                            new_data_for_category.append(details)
-                            # Dodamo v set, da ne podvajamo znotraj istega teka
-                            existing_urls.add(product_url)
-                            
-                            if len(new_data_for_category) % 5 == 0:
-                                save_to_excel(all_products_data + new_data_for_category, output_filepath)
-
-                        is_ci = os.environ.get("GITHUB_ACTIONS", "").lower() == "true"
-                        if is_ci:
-                            time.sleep(random.uniform(0.7, 2.5))   # hitreje na GitHubu
-                        else:
-                            time.sleep(random.uniform(2.0, 20.0))  # počasneje lokalno
-
-                    if not soup1.select_one('a.next'): break
-                    n += 1
-
-                if new_data_for_category:
-                    all_products_data.extend(new_data_for_category)
-                    save_to_json(all_products_data, json_filepath)
-        save_to_excel(all_products_data, output_filepath)
-
+        current_category = None
+        for main_category_name, sub_cat_url in work:
+            if not sched.discovering(): break
+            if main_category_name != current_category:
+                current_category = main_category_name
+                log_and_print(f"\n--- Obdelujem glavno kategorijo: {main_category_name} ---", to_file=True)
+            group_name = sub_category_name(sub_cat_url)
+            log_and_print(f"\n  -- Seznam podkategorije: {group_name} --", to_file=True)
+            # Isti izdelek je lahko v več podkategorijah: v vrsto gre le enkrat.
+            found = get_products_from_category(sub_cat_url)
+            health.listing((main_category_name, sub_cat_url), len(found))
+            listings = [l for l in found if l["URL"] not in queued and worth_fetching(l, group_name)]
+            queued.update(l["URL"] for l in listings)
+            sched.add((main_category_name, sub_cat_url), listings)
+        log_and_print(f"Za zajem {sched.pending_tasks()} izdelkov v {len(sched.groups)} podkategorijah.", to_file=True)
+        health.save_counts()
+
+        is_ci = os.environ.get("GITHUB_ACTIONS", "").lower() == "true"
+
+        def write(group, listing, details, elapsed_ms):
+            if listing["URL"] in existing_urls: return
+            details = finish_product(listing, details, sub_category_name(group[1]), query_date, elapsed_ms)
+
+            if details:
+                # Dodamo v set, da ne podvajamo znotraj istega teka
+                existing_urls.add(listing["URL"])
+                saver.put(details)
+                health.record(details)
+
+        pipeline.run(
+            sched, lambda group, listing: (listing["URL"], ()), _fetcher, extract_product_details, write,
+            STREAM_FIELDS, _options.fetch_workers, _options.parse_workers,
+            # hitreje na GitHubu, počasneje lokalno
+            delay=(lambda: random.uniform(0.7, 2.5)) if is_ci else (lambda: random.uniform(2.0, 20.0)),
+            requeue=sched.requeue, cache=cache,
+        )
+
+        left = sched.unfinished(work)
+        if left: save_pending(pending_file, left, reason="deadline", json_path=json_filepath)
+        else: clear_pending(pending_file, json_filepath)
+
+    except CircuitOpenError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"\n{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason=str(e), json_path=json_filepath)
+    except ExtractionHealthError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"\n{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason="health", json_path=json_filepath)
+        return 2
     except KeyboardInterrupt:
         log_and_print("\nSkripta prekinjena. Shranjujem zajete podatke...", to_file=True)
     except Exception as e:
-        log_and_print(f"\nNEPRIČAKOVANA NAPAKA: {e}", to_file=True)
-        import traceback
-        traceback.print_exc(file=_log_file)
+        log.exception(f"\nNEPRIČAKOVANA NAPAKA: {e}")
         # ZAMENJAVA MESSAGEBOX S PRINTOM
         print(f"Nepričakovana napaka: {e}. Podrobnosti so v logu.")
     finally:
-        save_to_json(all_products_data, json_filepath)
-        save_to_excel(all_products_data, output_filepath)
+        saver.close()
         log_and_print("\n--- Zajemanje zaključeno ---", to_file=True)
         print(f"Zaključeno. Podatki so v: {output_filepath} in {json_filepath}")
-        if _log_file:
-            _log_file.close()
+        if cache: cache.close(log=log_and_print)
+        if _fetcher.archive: _fetcher.archive.close(log=log_and_print)
+        profiling.stop(log=log_and_print)
+        trace.stop(log=log_and_print)
+        log.shutdown()
 
 # --- ZAGON BREZ GUI ---
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,4 +1,3 @@
-import pandas as pd
 import os
 import sys
 from datetime import datetime
@@ -6,13 +5,24 @@ import time
 import random
 import re
 import json
-import requests
-from bs4 import BeautifulSoup
+
+from ceniki import log, options, pipeline, profiling, refresh, sampling, trace
+from ceniki.archive import RawArchive, archive_dir
+from ceniki.export import export_records, read_excel_records, selected_formats, base_path
+from ceniki.fetch import Fetcher, CircuitOpenError, fetch_detail, parse_html
+from ceniki.health import ExtractionHealthError, HealthMonitor
+from ceniki.pagecache import PageCache, cache_path
+from ceniki.pagesize import PageSize
+from ceniki.persist import BackgroundSaver
+from ceniki.pending import pending_path, resume_work, save_pending, clear_pending, saved_keys
+from ceniki.priority import change_scores
+from ceniki.schedule import Deadline, Scheduler
 
 # --- Konfiguracija ---
 SHOP_NAME = "OBI"
 BASE_URL = "https://www.obi.si"
 DDV_RATE = 0.22
+ENCODING = "utf-8"  # če strežnik ne pošlje charset v Content-Type
 
 # Kategorije za OBI
 OBI_CATEGORIES = {
@@ -42,24 +52,19 @@ OBI_CATEGORIES = {
     ]
 }
 
-_log_file = None
 _global_item_counter = 0
 
+_options = options.parse_args()
+# JSON vedno piše save_data (iz njega nadaljujemo), ostali formati po izbiri.
+_export_formats = [f for f in selected_formats(_options) if f != "json"]
+
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
 ]
 
 def log_and_print(message, to_file=True):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    full_message = f"[{timestamp}] {message}"
-    print(full_message)
-    if to_file and _log_file:
-        try:
-            _log_file.write(full_message + '\n')
-            _log_file.flush()
-        except Exception as e:
-            print(f"Log Error: {e}")
+    log.info(message, to_file=to_file)
 
 def create_output_paths(shop_name):
     """Ustvari poti za JSON/Excel in log.
@@ -87,6 +92,7 @@ def create_output_paths(shop_name):
     print(f"Log pot: {log_path}")
     return json_path, excel_path, log_path
 
+@profiling.phase("persist")
 def save_data(new_data, json_path, excel_path):
     if not new_data: return
     all_data = []
@@ -99,8 +105,7 @@ def save_data(new_data, json_path, excel_path):
         except: pass
     elif os.path.exists(excel_path):
         try:
-            df = pd.read_excel(excel_path)
-            all_data = df.to_dict(orient='records')
+            all_data = read_excel_records(excel_path)
         except: pass
 
     # 2. Združi (ključ je URL)
@@ -119,27 +124,16 @@ def save_data(new_data, json_path, excel_path):
         log_and_print(f"Shranjen JSON.", to_file=True)
     except: pass
 
-    # 4. Shrani Excel
-    try:
-        df = pd.DataFrame(final_list)
-        cols = ["Skupina", "Zap", "Oznaka / naziv", "EAN", "Opis", "EM", "Valuta", "DDV", "Proizvajalec",
-                "Veljavnost od", "Dobava", "Cena / EM (z DDV)", "Akcijska cena / EM (z DDV)",
-                "Cena / EM (brez DDV)", "Akcijska cena / EM (brez DDV)", "URL", "SLIKA URL"]
-        for c in cols:
-            if c not in df.columns: df[c] = ''
-        df[cols].to_excel(excel_path, index=False)
-        log_and_print(f"Shranjen Excel.", to_file=True)
-    except: pass
+    # 4. Ostali izvozi (xlsx, csv, ... po izbiri)
+    export_records(final_list, base_path(excel_path), _export_formats, log=log_and_print)
+
+_fetcher = Fetcher(user_agents=USER_AGENTS, timeout=20, encoding=ENCODING, log=log_and_print,
+                   hedge=_options.hedge)
+# Število izdelkov na strani seznama (limit=, kot pri Magentu); preveri se med zajemom.
+_page_size = PageSize("limit", (96, 48), log=log_and_print)
 
 def get_page_content(url):
-    headers = {'User-Agent': random.choice(USER_AGENTS)}
-    try:
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException as e:
-        log_and_print(f"Error {url}: {e}", to_file=True)
-        return None
+    return _fetcher.get(url)
 
 def convert_price_to_without_vat(price_str, vat_rate):
     if not price_str: return ""
@@ -149,16 +143,162 @@ def convert_price_to_without_vat(price_str, vat_rate):
         return f"{val:.2f}".replace('.', ',')
     except: return ""
 
+# Polja, ki jih bere extract_product_details (za delni prenos s STREAM_DETAILS=1)
+STREAM_FIELDS = {
+    "Opis": "div.product-basics-info.part-1",
+    "Oznaka / naziv": "div.product-id",
+}
+
+@profiling.phase("extract")
+def extract_product_details(page):
+    """Opis in šifra s strani izdelka (cena je že na seznamu)."""
+    s2 = parse_html(page, 'html.parser')
+    info = s2.find("div", class_="product-basics-info part-1")
+    sid = s2.find("div", class_="product-id")
+    return {'Opis': info.h1.text.strip() if info and info.h1 else '',
+            'Oznaka / naziv': sid.text.strip() if sid else ''}
+
+@profiling.phase("discovery")
+def get_products_from_category(cat, category_url, date):
+    """Izdelki podkategorije s podatki, ki so že na seznamu (cena, EM, slika)."""
+    products = []
+    sub_name = category_url.strip('/').split('/')[-1]
+    log_and_print(f"  Podkategorija: {sub_name}", to_file=True)
+
+    n = 1
+    stariprvi = "star"
+
+    while True:
+        p_url = _page_size.url(f"{category_url}?p={n}")
+        log_and_print(f"    Stran {n}: {p_url}", to_file=True)
+        # Premor pred vsako stranjo seznama, tudi med kategorijami.
+        trace.sleep(random.uniform(1.0, 2.0))
+        page = get_page_content(p_url)
+        if not page: break
+
+        soup = parse_html(page, 'lxml')
+        container = soup.find("div", class_="list-items list-category-products")
+        items = container.find_all("div", class_="item") if container else []
+        if n == 1 and not _page_size.first_page(len(items), bool(soup.select_one('a.next'))):
+            return get_products_from_category(cat, category_url, date)
+        if not items: break
+        log.event("listing_page", url=p_url, page=n, products=len(items))
+
+        # Preverjanje ponavljanja (OBI včasih vrti isto stran)
+        noviprvi = items[0].h4.text if items[0].h4 else None
+        if n > 1 and noviprvi == stariprvi:
+            log_and_print("    Stran se ponavlja. Konec kategorije.", to_file=True)
+            break
+        stariprvi = noviprvi
+
+        for i in items:
+            a = i.find("a")
+            if not a: continue
+            url = a.get("href")
+
+            data = {"Skupina": cat, "Zap": 0, "Veljavnost od": date,
+                    "Valuta": "EUR", "DDV": "22", "EM": "kos", "URL": url}
+
+            # Pridobi ceno takoj iz seznama (hitreje)
+            price_span = i.find("span", class_="price")
+            if price_span:
+                c = re.findall(r'[\d\.,]+', price_span.text)
+                if c: data['Cena / EM (z DDV)'] = c[0]
+
+                # Poskus pridobitve EM iz teksta (npr. "€/m2")
+                try:
+                    unit_text = re.search(r'\s*/\s*(.*)$', price_span.parent.text.strip()).group(1)
+                    data['EM'] = unit_text
+                except: pass
+
+            data['Cena / EM (brez DDV)'] = convert_price_to_without_vat(data.get('Cena / EM (z DDV)'), DDV_RATE)
+
+            img = i.find("img")
+            data['SLIKA URL'] = img.get("src") if img else ''
+            products.append(data)
+
+        if not soup.select_one('a.next'): break
+        n += 1
+    return products
+
+def finish_product(data, details, cat, elapsed_ms):
+    """Podatkom s seznama doda detajle s strani izdelka (Opis, Šifra)."""
+    global _global_item_counter
+    log.event("product", category=cat, url=data['URL'], ok=bool(details), elapsed_ms=elapsed_ms)
+    _global_item_counter += 1
+    data = dict(data, Zap=_global_item_counter)
+    if details:
+        data.update(details)
+    return data
+
+def get_product_details(data, cat):
+    t0 = time.perf_counter()
+    details = fetch_detail(_fetcher, data['URL'], extract_product_details, STREAM_FIELDS)
+    return finish_product(data, details, cat, round((time.perf_counter() - t0) * 1000))
+
+# --- Vmesnik za ceniki.worker (deljena vrsta opravil) ---
+
+def crawl_work():
+    return [(cat, u) for cat, urls in OBI_CATEGORIES.items() for u in urls]
+
+def crawl_discover(group):
+    return get_products_from_category(group[0], group[1], datetime.now().strftime("%d/%m/%Y"))
+
+def crawl_detail(group, data):
+    time.sleep(random.uniform(1.0, 2.0)) # OBI zahteva počasnejši tempo
+    return get_product_details(data, group[0])
+
+def crawl_save(records):
+    json_path, excel_path, _log_path = create_output_paths(SHOP_NAME)
+    save_data(records, json_path, excel_path)
+
+# --- Vmesnik za ceniki.reparse (ponovni zajem iz arhiva) ---
+
+def reparse_record(page, record):
+    return dict(record, **extract_product_details(page))
+
+def reparse_save(records, json_path):
+    save_data(records, json_path, base_path(json_path) + '.xlsx')
+
+# --- Vmesnik za ceniki.sampling (hitri indeks cen iz vzorca) ---
+
+def sample_records(skupina, records):
+    # Cena je na seznamu: preberemo sezname skupine namesto strani izdelkov.
+    date = datetime.now().strftime("%d/%m/%Y")
+    listed = {d['URL']: d for u in OBI_CATEGORIES.get(skupina, [])
+              for d in get_products_from_category(skupina, u, date)}
+    return [dict(r, **listed[r['URL']]) for r in records if r['URL'] in listed]
+
+# --- Vmesnik za ceniki.refresh (osvežitev cen znanih izdelkov) ---
+
+def price_records(skupina, records):
+    # Cena (z DDV in brez) je že na seznamu, kot pri vzorčenju.
+    return sample_records(skupina, records)
+
 def main():
-    global _log_file, _global_item_counter
+    global _global_item_counter
     # Naključen zamik za varnost
     time.sleep(random.uniform(0, 2) if os.environ.get("GITHUB_ACTIONS","").lower()=="true" else random.randint(1, 10))
     
     json_path, excel_path, log_path = create_output_paths(SHOP_NAME)
-    try: _log_file = open(log_path, 'w', encoding='utf-8')
+    try: log.setup(SHOP_NAME, log_path, items=_options.log_items)
     except: return
 
     log_and_print(f"--- Zagon {SHOP_NAME} ---", to_file=True)
+    if _options.sample:
+        sampling.run(SHOP_NAME, json_path, sample_records, _options.sample, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.refresh_prices:
+        refresh.run(SHOP_NAME, json_path, price_records, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.profile:
+        profiling.start(SHOP_NAME, profiling.profile_dir(json_path))
+    if _options.trace:
+        trace.start(SHOP_NAME, profiling.profile_dir(json_path))
+    if _options.archive:
+        _fetcher.archive = RawArchive(archive_dir(json_path), SHOP_NAME)
 
     # Naloži števec
     if os.path.exists(json_path):
@@ -169,91 +309,63 @@ def main():
         except: pass
 
     date = datetime.now().strftime("%d/%m/%Y")
-    buffer = []
+    saver = BackgroundSaver(lambda batch: save_data(batch, json_path, excel_path), log=log_and_print)
+
+    pending_file = pending_path(json_path)
+    work, resumed = resume_work(pending_file, json_path, crawl_work)
+    skip = saved_keys(json_path) if resumed else ()
+    if resumed:
+        log_and_print(f"Nadaljujem {resumed} nedokončanih podkategorij.", to_file=True)
 
+    sched = Scheduler(Deadline.from_options(_options), log=log_and_print, skip=skip, key=lambda d: d['URL'],
+                      scores=change_scores(json_path) if _options.priority else None)
+    health = HealthMonitor.for_run(json_path)
+    cache = PageCache(cache_path(json_path)) if _options.page_cache else None
     try:
-        for cat, urls in OBI_CATEGORIES.items():
-            log_and_print(f"--- {cat} ---", to_file=True)
-            for u in urls:
-                sub_name = u.strip('/').split('/')[-1]
-                log_and_print(f"  Podkategorija: {sub_name}", to_file=True)
-                
-                n = 1
-                stariprvi = "star"
-                
-                while True:
-                    p_url = f"{u}?p={n}"
-                    log_and_print(f"    Stran {n}: {p_url}", to_file=True)
-                    html = get_page_content(p_url)
-                    if not html: break
-                    
-                    soup = BeautifulSoup(html, 'lxml')
-                    container = soup.find("div", class_="list-items list-category-products")
-                    if not container: break
-                    
-                    items = container.find_all("div", class_="item")
-                    if not items: break
-                    
-                    # Preverjanje ponavljanja (OBI včasih vrti isto stran)
-                    noviprvi = items[0].h4.text if items[0].h4 else None
-                    if n > 1 and noviprvi == stariprvi:
-                        log_and_print("    Stran se ponavlja. Konec kategorije.", to_file=True)
-                        break
-                    stariprvi = noviprvi
-
-                    for i in items:
-                        a = i.find("a")
-                        if not a: continue
-                        url = a.get("href")
-                        
-                        _global_item_counter += 1
-                        data = {"Skupina": cat, "Zap": _global_item_counter, "Veljavnost od": date,
-                                "Valuta": "EUR", "DDV": "22", "EM": "kos", "URL": url}
-
-                        # Pridobi ceno takoj iz seznama (hitreje)
-                        price_span = i.find("span", class_="price")
-                        if price_span:
-                            c = re.findall(r'[\d\.,]+', price_span.text)
-                            if c: data['Cena / EM (z DDV)'] = c[0]
-                            
-                            # Poskus pridobitve EM iz teksta (npr. "€/m2")
-                            try:
-                                unit_text = re.search(r'\s*/\s*(.*)$', price_span.parent.text.strip()).group(1)
-                                data['EM'] = unit_text
-                            except: pass
-
-                        data['Cena / EM (brez DDV)'] = convert_price_to_without_vat(data.get('Cena / EM (z DDV)'), DDV_RATE)
-                        
-                        img = i.find("img")
-                        data['SLIKA URL'] = img.get("src") if img else ''
-                        
-                        # Dodatni detajli (Opis, Šifra)
-                        time.sleep(random.uniform(1.0, 2.0)) # OBI zahteva počasnejši tempo
-                        d_html = get_page_content(url)
-                        if d_html:
-                            s2 = BeautifulSoup(d_html, "html.parser")
-                            info = s2.find("div", class_="product-basics-info part-1")
-                            data['Opis'] = info.h1.text.strip() if info and info.h1 else ''
-                            sid = s2.find("div", class_="product-id")
-                            data['Oznaka / naziv'] = sid.text.strip() if sid else ''
-                        
-                        buffer.append(data)
-                        if len(buffer) >= 5:
-                            save_data(buffer, json_path, excel_path)
-                            buffer = []
-
-                    if not soup.select_one('a.next'): break
-                    n += 1
-
-                if buffer:
-                    save_data(buffer, json_path, excel_path)
-                    buffer = []
+        current_cat = None
+        for cat, u in work:
+            if not sched.discovering(): break
+            if cat != current_cat:
+                current_cat = cat
+                log_and_print(f"--- {cat} ---", to_file=True)
+            products = get_products_from_category(cat, u, date)
+            health.listing((cat, u), len(products))
+            sched.add((cat, u), products)
+        log_and_print(f"Za zajem {sched.pending_tasks()} izdelkov v {len(sched.groups)} podkategorijah.", to_file=True)
+        health.save_counts()
+
+        def write(group, data, details, elapsed_ms):
+            det = finish_product(data, details, group[0], elapsed_ms)
+            saver.put(det)
+            health.record(det)
+
+        # OBI zahteva počasnejši tempo
+        pipeline.run(sched, lambda group, data: (data['URL'], ()), _fetcher, extract_product_details, write,
+                     STREAM_FIELDS, _options.fetch_workers, _options.parse_workers,
+                     delay=lambda: random.uniform(1.0, 2.0), requeue=sched.requeue, cache=cache)
+
+        left = sched.unfinished(work)
+        if left: save_pending(pending_file, left, reason="deadline", json_path=json_path)
+        else: clear_pending(pending_file, json_path)
 
+    except CircuitOpenError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason=str(e), json_path=json_path)
+    except ExtractionHealthError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason="health", json_path=json_path)
+        return 2
     except Exception as e:
         log_and_print(f"NAPAKA: {e}", to_file=True)
     finally:
-        save_data([], json_path, excel_path)
-        if _log_file: _log_file.close()
+        saver.close()
+        if cache: cache.close(log=log_and_print)
+        if _fetcher.archive: _fetcher.archive.close(log=log_and_print)
+        profiling.stop(log=log_and_print)
+        trace.stop(log=log_and_print)
+        log.shutdown()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -1,4 +1,3 @@
-import pandas as pd
 import os
 import sys
 from datetime import datetime
@@ -6,13 +5,25 @@ import time
 import random
 import re
 import json
-import requests
-from bs4 import BeautifulSoup
+
+from ceniki import log, options, pipeline, profiling, refresh, sampling, trace
+from ceniki.archive import RawArchive, archive_dir
+from ceniki.export import export_records, read_excel_records, selected_formats, base_path
+from ceniki.fetch import Fetcher, CircuitOpenError, fetch_detail, parse_html
+from ceniki.health import ExtractionHealthError, HealthMonitor
+from ceniki.listingcache import ListingCache, listings_path
+from ceniki.pagecache import PageCache, cache_path
+from ceniki.pagesize import PageSize
+from ceniki.persist import BackgroundSaver
+from ceniki.pending import pending_path, resume_work, save_pending, clear_pending, saved_keys
+from ceniki.priority import change_scores
+from ceniki.schedule import Deadline, Scheduler
 
 # --- Konfiguracija ---
 SHOP_NAME = "Tehnoles"
 BASE_URL = "https://www.tehnoles.si"
 DDV_RATE = 0.22
+ENCODING = "utf-8"  # če strežnik ne pošlje charset v Content-Type
 
 # Kategorije za Tehnoles
 TEHNOLES_CATEGORIES = {
@@ -33,18 +44,14 @@ TEHNOLES_CATEGORIES = {
     ]
 }
 
-_log_file = None
 _global_item_counter = 0
 
+_options = options.parse_args()
+# JSON vedno piše save_data (iz njega nadaljujemo), ostali formati po izbiri.
+_export_formats = [f for f in selected_formats(_options) if f != "json"]
+
 def log_and_print(message, to_file=True):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    full_message = f"[{timestamp}] {message}"
-    print(full_message)
-    if to_file and _log_file:
-        try:
-            _log_file.write(full_message + '\n')
-            _log_file.flush()
-        except: pass
+    log.info(message, to_file=to_file)
 
 def create_output_paths(shop_name):
     """Create output paths.
@@ -70,6 +77,7 @@ def create_output_paths(shop_name):
     log_path = os.path.join(daily_dir, f"{shop_name}_Scraping_Log_{datetime.now().strftime('%H-%M-%S')}.txt")
     return json_path, excel_path, log_path
 
+@profiling.phase("persist")
 def save_data(new_data, json_path, excel_path):
     if not new_data: return
     all_data = []
@@ -81,8 +89,7 @@ def save_data(new_data, json_path, excel_path):
         except: pass
     elif os.path.exists(excel_path):
         try:
-            df = pd.read_excel(excel_path)
-            all_data = df.to_dict(orient='records')
+            all_data = read_excel_records(excel_path)
         except: pass
 
     # 2. Združi
@@ -100,25 +107,17 @@ def save_data(new_data, json_path, excel_path):
         log_and_print(f"Shranjen JSON.", to_file=True)
     except: pass
 
-    # 4. Shrani Excel
-    try:
-        df = pd.DataFrame(final_list)
-        cols = ["Skupina", "Zap", "Oznaka / naziv", "EAN", "Opis", "EM", "Valuta", "DDV", "Proizvajalec",
-                "Veljavnost od", "Dobava", "Cena / EM (z DDV)", "Akcijska cena / EM (z DDV)",
-                "Cena / EM (brez DDV)", "Akcijska cena / EM (brez DDV)", "URL", "SLIKA URL"]
-        for c in cols:
-            if c not in df.columns: df[c] = ''
-        df[cols].to_excel(excel_path, index=False)
-        log_and_print(f"Shranjen Excel.", to_file=True)
-    except: pass
+    # 4. Ostali izvozi (xlsx, csv, ... po izbiri)
+    export_records(final_list, base_path(excel_path), _export_formats, log=log_and_print)
+
+_fetcher = Fetcher(headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'},
+                   timeout=20, encoding=ENCODING, log=log_and_print, hedge=_options.hedge)
+
+# Število izdelkov na strani seznama; trgovina ga ne oglašuje, zato se preveri med zajemom.
+_page_size = PageSize("pagesize", (100, 50), log=log_and_print)
 
 def get_page_content(url):
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'}
-    try:
-        response = requests.get(url, headers=headers, timeout=20)
-        response.raise_for_status()
-        return response.text
-    except: return None
+    return _fetcher.get(url)
 
 def convert_price_to_without_vat(price_str, vat_rate):
     if not price_str: return ""
@@ -128,39 +127,67 @@ def convert_price_to_without_vat(price_str, vat_rate):
         return f"{val:.2f}".replace('.', ',')
     except: return ""
 
-def get_product_links_from_category(category_url):
+@profiling.phase("discovery")
+def get_product_links_from_category(category_url, listings=None):
     all_links = []
+    pages = []
+    pager_text = None
     page = 1
     while True:
-        url = f"{category_url}?pagenum={page}"
+        url = _page_size.url(f"{category_url}?pagenum={page}")
         log_and_print(f"  Stran {page}: {url}", to_file=True)
+        # Premor pred vsako stranjo seznama, tudi med kategorijami.
+        trace.sleep(random.uniform(2.0, 5.0))
         html = get_page_content(url)
-        if not html: break
+        if not html:
+            pages = None
+            break
         
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = parse_html(html, 'html.parser')
         products = soup.select('li.wrapper_prods.category')
+        if page == 1 and not _page_size.first_page(len(products), bool(soup.select_one('a.PagerPrevNextLink'))):
+            return get_product_links_from_category(category_url, listings)
         if not products: break
+        log.event("listing_page", url=url, page=page, products=len(products))
         
+        page_links = []
         for item in products:
             a = item.select_one('.name a')
             if a and a.get('href'):
                 full = BASE_URL + a['href']
-                all_links.append(full)
+                page_links.append(full)
+        if page == 1 and listings:
+            # Skupnega števila izdelkov trgovina ne navaja; spremembo dolžine seznama pokaže oštevilčenje strani.
+            pager = soup.select_one('a.PagerPrevNextLink')
+            pager_text = pager.parent.get_text(" ", strip=True) if pager else None
+            cached = listings.reuse(category_url, page_links, pager_text, _page_size.size)
+            if cached is not None:
+                log_and_print(f"  Seznam nespremenjen, {len(cached)} povezav iz prejšnjega zajema.", to_file=True)
+                return cached
+        pages.append(page_links)
+        all_links.extend(page_links)
         
         if not soup.select_one('a.PagerPrevNextLink'): break
         page += 1
-        time.sleep(random.uniform(2.0, 5.0))
-    return list(set(all_links))
+    links = list(set(all_links))
+    if listings and pages: listings.store(category_url, pages, links, pager_text, _page_size.size)
+    return links
 
-def get_product_details(url, cat, date):
-    global _global_item_counter
-    log_and_print(f"    - Detajli: {url}", to_file=True)
-    html = get_page_content(url)
-    if not html: return None
-    soup = BeautifulSoup(html, 'html.parser')
+# Polja, ki jih bere extract_product_details (za delni prenos s STREAM_DETAILS=1)
+STREAM_FIELDS = {
+    "Opis": "h1.productInfo",
+    "Oznaka / naziv": ".listing.stockMargin",
+    "EM": ".listing.stockMargin",
+    # Akcijske cene večina izdelkov nima; .product-info (kot pri Kalcerju) objame obe različici cene.
+    "Cena / EM (z DDV)": ".product-info",
+    "SLIKA URL": "a.lightbox-image",
+}
 
-    _global_item_counter += 1
-    data = {"Skupina": cat, "Zap": _global_item_counter, "Veljavnost od": date, "Valuta": "EUR", "DDV": "22",
+@profiling.phase("extract")
+def extract_product_details(page, url, cat, date):
+    soup = parse_html(page, 'html.parser')
+
+    data = {"Skupina": cat, "Zap": 0, "Veljavnost od": date, "Valuta": "EUR", "DDV": "22",
             "URL": url, "SLIKA URL": "", "Opis": "", "Oznaka / naziv": "", "EM": "KOS", "Cena / EM (z DDV)": ""}
 
     h1 = soup.select_one('h1.productInfo')
@@ -189,17 +216,97 @@ def get_product_details(url, cat, date):
 
     return data
 
+def finish_product(data, url, cat, elapsed_ms):
+    global _global_item_counter
+    log.event("product", category=cat, url=url, ok=bool(data), elapsed_ms=elapsed_ms)
+    if not data: return None
+
+    _global_item_counter += 1
+    data['Zap'] = _global_item_counter
+    return data
+
+def get_product_details(url, cat, date):
+    log.item(f"    - Detajli: {url}", url=url, category=cat)
+    t0 = time.perf_counter()
+    data = fetch_detail(_fetcher, url, lambda page: extract_product_details(page, url, cat, date), STREAM_FIELDS)
+    return finish_product(data, url, cat, round((time.perf_counter() - t0) * 1000))
+
+def sub_category_name(category_url):
+    # Izluščimo ime podkategorije iz URL-ja
+    return category_url.split('/')[-1].split('-c-')[0]
+
+# --- Vmesnik za ceniki.worker (deljena vrsta opravil) ---
+
+def crawl_work():
+    return [(cat, u) for cat, urls in TEHNOLES_CATEGORIES.items() for u in urls]
+
+def crawl_discover(group):
+    return get_product_links_from_category(group[1])
+
+def crawl_detail(group, link):
+    return get_product_details(link, sub_category_name(group[1]), datetime.now().strftime("%d/%m/%Y"))
+
+def crawl_save(records):
+    json_path, excel_path, _log_path = create_output_paths(SHOP_NAME)
+    save_data(records, json_path, excel_path)
+
+# --- Vmesnik za ceniki.reparse (ponovni zajem iz arhiva) ---
+
+def reparse_record(page, record):
+    return extract_product_details(page, record['URL'], record.get('Skupina', ''), record.get('Veljavnost od', ''))
+
+def reparse_save(records, json_path):
+    save_data(records, json_path, base_path(json_path) + '.xlsx')
+
+# --- Vmesnik za ceniki.sampling (hitri indeks cen iz vzorca) ---
+
+def sample_records(skupina, records):
+    return sampling.refetch(_fetcher, records, reparse_record)
+
+# --- Vmesnik za ceniki.refresh (osvežitev cen znanih izdelkov) ---
+
+# Polja, ki jih bere extract_prices (osvežitev cen s prenosom do cene)
+PRICE_STREAM_FIELDS = {"Cena / EM (z DDV)": STREAM_FIELDS["Cena / EM (z DDV)"]}
+
+@profiling.phase("extract")
+def extract_prices(page, record):
+    """Samo cena s strani izdelka, brez ostalih polj."""
+    soup = parse_html(page, 'html.parser')
+    p = soup.select_one('span.productSpecialPrice')
+    if not p: p = soup.select_one('span.priceColor')
+    m = re.search(r'([\d\.,]+)', p.get_text(strip=True)) if p else None
+    if not m: return None
+    cena = m.group(1).strip()
+    return {"Cena / EM (z DDV)": cena, "Cena / EM (brez DDV)": convert_price_to_without_vat(cena, DDV_RATE)}
+
+def price_records(skupina, records):
+    return refresh.refetch(_fetcher, records, extract_prices, PRICE_STREAM_FIELDS)
+
 def main():
-    global _log_file, _global_item_counter
+    global _global_item_counter
     # Keep a small jitter locally; on GitHub Actions avoid wasting minutes.
     if os.environ.get("GITHUB_ACTIONS", "").lower() == "true" or os.environ.get("CI"):
         time.sleep(random.uniform(0.2, 1.0))
     else:
         time.sleep(random.randint(1, 10))
     json_path, excel_path, log_path = create_output_paths(SHOP_NAME)
-    try: _log_file = open(log_path, 'w', encoding='utf-8')
+    try: log.setup(SHOP_NAME, log_path, items=_options.log_items)
     except: return
     log_and_print(f"--- Zagon {SHOP_NAME} ---", to_file=True)
+    if _options.sample:
+        sampling.run(SHOP_NAME, json_path, sample_records, _options.sample, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.refresh_prices:
+        refresh.run(SHOP_NAME, json_path, price_records, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.profile:
+        profiling.start(SHOP_NAME, profiling.profile_dir(json_path))
+    if _options.trace:
+        trace.start(SHOP_NAME, profiling.profile_dir(json_path))
+    if _options.archive:
+        _fetcher.archive = RawArchive(archive_dir(json_path), SHOP_NAME)
 
     if os.path.exists(json_path):
         try:
@@ -209,33 +316,63 @@ def main():
         except: pass
 
     date = datetime.now().strftime("%d/%m/%Y")
-    buffer = []
+    saver = BackgroundSaver(lambda batch: save_data(batch, json_path, excel_path), log=log_and_print)
+
+    pending_file = pending_path(json_path)
+    work, resumed = resume_work(pending_file, json_path, crawl_work)
+    skip = saved_keys(json_path) if resumed else ()
+    if resumed:
+        log_and_print(f"Nadaljujem {resumed} nedokončanih podkategorij.", to_file=True)
 
+    sched = Scheduler(Deadline.from_options(_options), log=log_and_print, skip=skip,
+                      scores=change_scores(json_path) if _options.priority else None)
+    health = HealthMonitor.for_run(json_path)
+    listings = ListingCache(listings_path(json_path)) if _options.listing_cache else None
+    cache = PageCache(cache_path(json_path), fresh={"Veljavnost od": date}) if _options.page_cache else None
     try:
-        for cat, urls in TEHNOLES_CATEGORIES.items():
-            log_and_print(f"\n--- {cat} ---", to_file=True)
-            for u in urls:
-                # Izluščimo ime podkategorije iz URL-ja
-                sub_name = u.split('/')[-1].split('-c-')[0]
-                links = get_product_links_from_category(u)
-                
-                for link in links:
-                    det = get_product_details(link, sub_name, date)
-                    if det:
-                        buffer.append(det)
-                        if len(buffer) >= 5:
-                            save_data(buffer, json_path, excel_path)
-                            buffer = []
-                    time.sleep(random.uniform(2.0, 5.0))
-                
-                if buffer:
-                    save_data(buffer, json_path, excel_path)
-                    buffer = []
+        current_cat = None
+        for cat, u in work:
+            if not sched.discovering(): break
+            if cat != current_cat:
+                current_cat = cat
+                log_and_print(f"\n--- {cat} ---", to_file=True)
+            links = get_product_links_from_category(u, listings)
+            health.listing((cat, u), len(links))
+            sched.add((cat, u), links)
+        log_and_print(f"Za zajem {sched.pending_tasks()} izdelkov v {len(sched.groups)} podkategorijah.", to_file=True)
+        health.save_counts()
+
+        def write(group, link, data, elapsed_ms):
+            det = finish_product(data, link, sub_category_name(group[1]), elapsed_ms)
+            if det: saver.put(det)
+            health.record(det)
+
+        pipeline.run(sched, lambda group, link: (link, (link, sub_category_name(group[1]), date)), _fetcher,
+                     extract_product_details, write, STREAM_FIELDS, _options.fetch_workers, _options.parse_workers,
+                     delay=lambda: random.uniform(2.0, 5.0), requeue=sched.requeue, cache=cache)
+
+        left = sched.unfinished(work)
+        if left: save_pending(pending_file, left, reason="deadline", json_path=json_path)
+        else: clear_pending(pending_file, json_path)
+    except CircuitOpenError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason=str(e), json_path=json_path)
+    except ExtractionHealthError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason="health", json_path=json_path)
+        return 2
     except Exception as e:
         log_and_print(f"NAPAKA: {e}", to_file=True)
     finally:
-        save_data([], json_path, excel_path)
-        if _log_file: _log_file.close()
+        saver.close()
+        if cache: cache.close(log=log_and_print)
+        if listings: listings.close(log=log_and_print)
+        if _fetcher.archive: _fetcher.archive.close(log=log_and_print)
+        profiling.stop(log=log_and_print)
+        trace.stop(log=log_and_print)
+        log.shutdown()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
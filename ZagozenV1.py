@@ -1,6 +1,3 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
 import re
 import time
 import random
@@ -9,10 +6,24 @@ import sys
 import json
 from datetime import datetime
 
+from ceniki import log, options, pipeline, profiling, refresh, sampling, trace
+from ceniki.archive import RawArchive, archive_dir
+from ceniki.export import export_records, read_excel_records, selected_formats, base_path
+from ceniki.fetch import Fetcher, CircuitOpenError, fetch_detail, parse_html
+from ceniki.health import ExtractionHealthError, HealthMonitor
+from ceniki.listingcache import ListingCache, listings_path
+from ceniki.pagecache import PageCache, cache_path
+from ceniki.pagesize import PageSize, reported_total
+from ceniki.persist import BackgroundSaver
+from ceniki.pending import pending_path, resume_work, save_pending, clear_pending, saved_keys
+from ceniki.priority import change_scores
+from ceniki.schedule import Deadline, Scheduler
+
 # --- Konfiguracija ---
 SHOP_NAME = "Zagozen"
 BASE_URL = "https://eshop-zagozen.si/"
 DDV_RATE = 0.22  # Stopnja DDV (22%)
+ENCODING = "utf-8"  # če strežnik ne pošlje charset v Content-Type
 
 CATEGORIES = {
     "vodovod": [
@@ -46,22 +57,16 @@ CATEGORIES = {
 }
 
 # --- Globalne spremenljivke ---
-_log_file = None
 _global_item_counter = 0
 
+_options = options.parse_args()
+# JSON vedno piše save_data (iz njega nadaljujemo), ostali formati po izbiri.
+_export_formats = [f for f in selected_formats(_options) if f != "json"]
+
 # --- Standardne pomožne funkcije ---
 
 def log_and_print(message, to_file=True):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    full_message = f"[{timestamp}] {message}"
-    print(full_message)
-    if to_file and _log_file:
-        try:
-            _log_file.write(full_message + '\n')
-            _log_file.flush()
-        except Exception as e:
-            print(f"NAPAKA: Ni mogoče zapisati v log datoteko: {e}")
-
+    log.info(message, to_file=to_file)
 
 def create_output_paths(shop_name):
     """Create output paths in a CI-friendly way.
@@ -88,6 +93,7 @@ def create_output_paths(shop_name):
     return json_path, excel_path, log_path
 
 
+@profiling.phase("persist")
 def save_data(new_data, json_path, excel_path):
     if not new_data:
         log_and_print("Ni novih podatkov za shranjevanje.", to_file=True)
@@ -104,8 +110,7 @@ def save_data(new_data, json_path, excel_path):
             print(f"Napaka pri branju JSON: {e}")
     elif os.path.exists(excel_path):
         try:
-            df_existing = pd.read_excel(excel_path)
-            all_data = df_existing.to_dict(orient='records')
+            all_data = read_excel_records(excel_path)
         except Exception as e:
             print(f"Napaka pri branju Excel: {e}")
 
@@ -139,61 +144,53 @@ def save_data(new_data, json_path, excel_path):
     except Exception as e:
         log_and_print(f"Napaka pri shranjevanju JSON: {e}", to_file=True)
 
-    # 5. SHRANI EXCEL
-    try:
-        df = pd.DataFrame(final_list)
-        desired_columns = [
-            "Skupina", "Zap", "Oznaka / naziv", "EAN", "Opis", "EM", "Valuta", "DDV",
-            "Proizvajalec", "Veljavnost od", "Dobava",
-            "Cena / EM (z DDV)", "Akcijska cena / EM (z DDV)",
-            "Cena / EM (brez DDV)", "Akcijska cena / EM (brez DDV)",
-            "URL", "SLIKA URL"
-        ]
-        
-        for col in desired_columns:
-            if col not in df.columns:
-                df[col] = ''
-        
-        df = df[desired_columns]
-        df.to_excel(excel_path, index=False)
-        log_and_print(f"Shranjeno v Excel: {excel_path}", to_file=True)
-    except Exception as e:
-        log_and_print(f"Napaka pri shranjevanju Excel: {e}", to_file=True)
+    # 5. OSTALI IZVOZI (xlsx, csv, ... po izbiri)
+    export_records(final_list, base_path(excel_path), _export_formats, log=log_and_print)
+
+
+_fetcher = Fetcher(
+    user_agents=[
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.88 Safari/537.36',
+        'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0.3 Safari/605.1.15',
+    ],
+    timeout=15,
+    encoding=ENCODING,
+    log=log_and_print,
+    hedge=_options.hedge,
+)
+
+# Magento: limit= (privzeto 12 izdelkov na stran, dovoljene vrednosti določi trgovina).
+_page_size = PageSize("limit", (96, 36), log=log_and_print)
 
 
 def get_page_content(url):
-    headers = {
-        'User-Agent': random.choice([
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/100.0.4896.88 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0.3 Safari/605.1.15',
-        ])
-    }
-    try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        return response.text
-    except requests.exceptions.RequestException as e:
-        log_and_print(f"Napaka pri dostopu do URL-ja {url}: {e}", to_file=True)
-        return None
+    return _fetcher.get(url)
 
 
-def get_product_links_from_subcategory(category_slug, subcategory_slug):
+@profiling.phase("discovery")
+def get_product_links_from_subcategory(category_slug, subcategory_slug, listings=None):
     all_product_links = []
+    pages = []
+    total = None
     page = 1
     
     log_and_print(f"\n--- Zajemanje iz: {subcategory_slug} ---", to_file=True)
 
     while True:
         if page == 1:
-            url = f"{BASE_URL}{category_slug}/{subcategory_slug}"
+            url = _page_size.url(f"{BASE_URL}{category_slug}/{subcategory_slug}")
         else:
-            url = f"{BASE_URL}{category_slug}/{subcategory_slug}?p={page}"
+            url = _page_size.url(f"{BASE_URL}{category_slug}/{subcategory_slug}?p={page}")
 
         log_and_print(f"  Preverjam stran {page}: {url}", to_file=True)
-        html_content = get_page_content(url)
-        if not html_content: break
+        # Premor pred vsako stranjo seznama, tudi med kategorijami.
+        trace.sleep(random.uniform(2.0, 5.0))
+        html = get_page_content(url)
+        if not html:
+            pages = None
+            break
 
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = parse_html(html, 'html.parser')
 
         # Preveri, če ni izdelkov
         no_products = soup.find('p', class_='note-msg')
@@ -204,22 +201,40 @@ def get_product_links_from_subcategory(category_slug, subcategory_slug):
         if not product_grid: break
 
         product_items = product_grid.find_all('li', class_='item')
+        next_page = soup.select_one('div.pages a.next, div.pages a.i-next')
+        if page == 1:
+            if not _page_size.first_page(len(product_items), bool(next_page)):
+                return get_product_links_from_subcategory(category_slug, subcategory_slug, listings)
+            amount = soup.select_one('.toolbar .amount, p.amount')
+            total = reported_total(amount.get_text()) if amount else None
         if not product_items: break
+        log.event("listing_page", url=url, page=page, products=len(product_items))
 
+        page_links = []
         for li in product_items:
             link_tag = li.find('a', class_='product-image')
             if link_tag and 'href' in link_tag.attrs:
-                all_product_links.append(link_tag['href'])
+                page_links.append(link_tag['href'])
+        if page == 1 and listings:
+            cached = listings.reuse(f"{category_slug}/{subcategory_slug}", page_links, total, _page_size.size)
+            if cached is not None:
+                log_and_print(f"  Seznam nespremenjen, {len(cached)} povezav iz prejšnjega zajema.", to_file=True)
+                return cached
+        pages.append(page_links)
+        all_product_links.extend(page_links)
 
         log_and_print(f"  Najdenih {len(product_items)} izdelkov na strani {page}.", to_file=True)
 
         # Naslednja stran
-        next_page = soup.select_one('div.pages a.next, div.pages a.i-next')
         if not next_page: break
 
         page += 1
-        time.sleep(random.uniform(2.0, 5.0))
 
+    # Prekinjen seznam (pages = None) ne pove ničesar o velikosti strani.
+    if pages is not None and not _page_size.complete(len(set(all_product_links)), total):
+        return get_product_links_from_subcategory(category_slug, subcategory_slug, listings)
+    if listings and pages:
+        listings.store(f"{category_slug}/{subcategory_slug}", pages, all_product_links, total, _page_size.size)
     return all_product_links
 
 
@@ -239,14 +254,20 @@ def clean_price_string(price_str):
     return price_str.replace('€', '').replace('\xa0', '').replace('.', '').strip()
 
 
-def get_product_details(product_url, category_name, subcategory_name, query_date):
-    global _global_item_counter
-    log_and_print(f"  - Zajemanje podrobnosti za: {product_url}", to_file=True)
+# Polja, ki jih bere extract_product_details (za delni prenos s STREAM_DETAILS=1)
+STREAM_FIELDS = {
+    "Opis": "div.product-name",
+    "Oznaka / naziv": "div.sku",
+    "Dobava": "div.sku",
+    "Cena / EM (z DDV)": "div.price-box",
+    "EM": "div.em",
+    "SLIKA URL": ".product-img-box",
+}
 
-    html_content = get_page_content(product_url)
-    if not html_content: return None
 
-    soup = BeautifulSoup(html_content, 'html.parser')
+@profiling.phase("extract")
+def extract_product_details(page, product_url, category_name, query_date):
+    soup = parse_html(page, 'html.parser')
 
     product_data = {
         "Skupina": category_name, "Zap": "", "Oznaka / naziv": "", "EAN": "",
@@ -274,9 +295,6 @@ def get_product_details(product_url, category_name, subcategory_name, query_date
         if dobava_span:
             product_data["Dobava"] = dobava_span.get_text(strip=True).replace('Dobava:', '').strip()
 
-    _global_item_counter += 1
-    product_data["Zap"] = _global_item_counter
-
     # Cene
     price_box = soup.find('div', class_='price-box')
     if price_box:
@@ -317,10 +335,109 @@ def get_product_details(product_url, category_name, subcategory_name, query_date
     return product_data
 
 
+def finish_product(product_data, product_url, subcategory_name, elapsed_ms):
+    global _global_item_counter
+    log.event("product", category=subcategory_name, url=product_url, ok=bool(product_data), elapsed_ms=elapsed_ms)
+    if not product_data: return None
+
+    _global_item_counter += 1
+    product_data["Zap"] = _global_item_counter
+    return product_data
+
+
+def get_product_details(product_url, category_name, subcategory_name, query_date):
+    log.item(f"  - Zajemanje podrobnosti za: {product_url}", url=product_url, category=subcategory_name)
+
+    t0 = time.perf_counter()
+    product_data = fetch_detail(
+        _fetcher, product_url,
+        lambda page: extract_product_details(page, product_url, category_name, query_date),
+        STREAM_FIELDS,
+    )
+    return finish_product(product_data, product_url, subcategory_name, round((time.perf_counter() - t0) * 1000))
+
+
+# --- Vmesnik za ceniki.worker (deljena vrsta opravil) ---
+
+def crawl_work():
+    return [(cat_slug, sub_slug) for cat_slug, subcats in CATEGORIES.items() for sub_slug in subcats]
+
+
+def crawl_discover(group):
+    return sorted(set(get_product_links_from_subcategory(*group)))
+
+
+def crawl_detail(group, link):
+    cat_slug, sub_slug = group
+    return get_product_details(link, cat_slug.replace('-', ' ').capitalize(), sub_slug,
+                               datetime.now().strftime("%d/%m/%Y"))
+
+
+def crawl_save(records):
+    json_path, excel_path, _log_path = create_output_paths(SHOP_NAME)
+    save_data(records, json_path, excel_path)
+
+
+# --- Vmesnik za ceniki.reparse (ponovni zajem iz arhiva) ---
+
+
+def reparse_record(page, record):
+    return extract_product_details(page, record['URL'], record.get('Skupina', ''), record.get('Veljavnost od', ''))
+
+
+def reparse_save(records, json_path):
+    save_data(records, json_path, base_path(json_path) + '.xlsx')
+
+
+# --- Vmesnik za ceniki.sampling (hitri indeks cen iz vzorca) ---
+
+def sample_records(skupina, records):
+    return sampling.refetch(_fetcher, records, reparse_record)
+
+
+# --- Vmesnik za ceniki.refresh (osvežitev cen znanih izdelkov) ---
+
+# Polja, ki jih bere extract_prices (osvežitev cen s prenosom do cene)
+PRICE_STREAM_FIELDS = {"Cena / EM (z DDV)": "div.price-box", "Dobava": "div.sku"}
+
+
+@profiling.phase("extract")
+def extract_prices(page, record):
+    """Samo cene in dobava s strani izdelka, brez ostalih polj."""
+    soup = parse_html(page, 'html.parser')
+    price_box = soup.find('div', class_='price-box')
+    if not price_box: return None
+    data = {"Cena / EM (z DDV)": "", "Akcijska cena / EM (z DDV)": "", "Dobava": ""}
+
+    special_p = price_box.find('p', class_='special-price')
+    old_p = price_box.find('p', class_='old-price')
+    regular_span = price_box.find('span', class_='regular-price')
+    if special_p:
+        p_val = special_p.find('span', class_='price')
+        if p_val: data["Akcijska cena / EM (z DDV)"] = clean_price_string(p_val.get_text(strip=True))
+        p_old = old_p.find('span', class_='price') if old_p else None
+        if p_old: data["Cena / EM (z DDV)"] = clean_price_string(p_old.get_text(strip=True))
+    elif regular_span:
+        p_val = regular_span.find('span', class_='price')
+        if p_val: data["Cena / EM (z DDV)"] = clean_price_string(p_val.get_text(strip=True))
+    data["Cena / EM (brez DDV)"] = convert_price_with_vat_to_without_vat(data["Cena / EM (z DDV)"], DDV_RATE)
+    data["Akcijska cena / EM (brez DDV)"] = convert_price_with_vat_to_without_vat(
+        data["Akcijska cena / EM (z DDV)"], DDV_RATE)
+
+    sku_div = soup.find('div', class_='sku')
+    dobava_span = sku_div.find('span', class_='dobava') if sku_div else None
+    if dobava_span: data["Dobava"] = dobava_span.get_text(strip=True).replace('Dobava:', '').strip()
+    return data
+
+
+def price_records(skupina, records):
+    return refresh.refetch(_fetcher, records, extract_prices, PRICE_STREAM_FIELDS)
+
+
 # --- Glavna funkcija ---
 
 def main():
-    global _log_file, _global_item_counter
+    global _global_item_counter
     
     # Avoid wasting GitHub Actions minutes on long random startup sleeps
     if os.environ.get("GITHUB_ACTIONS", "").lower() == "true":
@@ -330,12 +447,26 @@ def main():
     json_path, excel_path, log_path = create_output_paths(SHOP_NAME)
 
     try:
-        _log_file = open(log_path, 'w', encoding='utf-8')
+        log.setup(SHOP_NAME, log_path, items=_options.log_items)
     except Exception as e:
         print(f"CRITICAL ERROR: {e}")
         return
 
     log_and_print(f"--- Zagon {SHOP_NAME} ---", to_file=True)
+    if _options.sample:
+        sampling.run(SHOP_NAME, json_path, sample_records, _options.sample, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.refresh_prices:
+        refresh.run(SHOP_NAME, json_path, price_records, log=log_and_print)
+        log.shutdown()
+        return
+    if _options.profile:
+        profiling.start(SHOP_NAME, profiling.profile_dir(json_path))
+    if _options.trace:
+        trace.start(SHOP_NAME, profiling.profile_dir(json_path))
+    if _options.archive:
+        _fetcher.archive = RawArchive(archive_dir(json_path), SHOP_NAME)
 
     # Naloži števec
     if os.path.exists(json_path):
@@ -348,47 +479,73 @@ def main():
         except: pass
 
     query_date = datetime.now().strftime("%d/%m/%Y")
-    all_data_buffer = []
-
+    saver = BackgroundSaver(lambda batch: save_data(batch, json_path, excel_path), log=log_and_print)
+
+    pending_file = pending_path(json_path)
+    work, resumed = resume_work(pending_file, json_path, crawl_work)
+    skip = saved_keys(json_path) if resumed else ()
+    if resumed:
+        log_and_print(f"Nadaljujem {resumed} nedokončanih podkategorij.", to_file=True)
+
+    sched = Scheduler(Deadline.from_options(_options), log=log_and_print, skip=skip,
+                      scores=change_scores(json_path) if _options.priority else None)
+    health = HealthMonitor.for_run(json_path)
+    listings = ListingCache(listings_path(json_path)) if _options.listing_cache else None
+    cache = PageCache(cache_path(json_path), fresh={"Veljavnost od": query_date}) if _options.page_cache else None
     try:
-        for cat_slug, subcats in CATEGORIES.items():
-            cat_name = cat_slug.replace('-', ' ').capitalize()
-            log_and_print(f"\n--- Kategorija: {cat_name} ---", to_file=True)
-
-            for sub_slug in subcats:
-                links = get_product_links_from_subcategory(cat_slug, sub_slug)
-                links = sorted(list(set(links))) # Unikatni
-
-                for i, link in enumerate(links):
-                    # Tu bi lahko preverili, če že imamo URL v bazi, 
-                    # ampak ker nimamo baze v pomnilniku, raje zajemamo vse in save_data združi.
-                    
-                    details = get_product_details(link, cat_name, sub_slug, query_date)
-                    if details:
-                        all_data_buffer.append(details)
-                        
-                        if len(all_data_buffer) >= 5:
-                            save_data(all_data_buffer, json_path, excel_path)
-                            all_data_buffer = [] # sprazni
-                    
-                    time.sleep(random.uniform(2.0, 5.0))
-                
-                # Shrani po koncu podkategorije
-                if all_data_buffer:
-                    save_data(all_data_buffer, json_path, excel_path)
-                    all_data_buffer = []
-
+        current_cat = None
+        for cat_slug, sub_slug in work:
+            if not sched.discovering(): break
+            if cat_slug != current_cat:
+                current_cat = cat_slug
+                log_and_print(f"\n--- Kategorija: {cat_slug.replace('-', ' ').capitalize()} ---", to_file=True)
+            links = get_product_links_from_subcategory(cat_slug, sub_slug, listings)
+            health.listing((cat_slug, sub_slug), len(links))
+            sched.add((cat_slug, sub_slug), sorted(set(links)))  # Unikatni
+        log_and_print(f"Za zajem {sched.pending_tasks()} izdelkov v {len(sched.groups)} podkategorijah.", to_file=True)
+        health.save_counts()
+
+        # save_data združi po URL-ju, zato ponovno zajeti izdelki ne podvajajo vrstic.
+        def write(group, link, product_data, elapsed_ms):
+            details = finish_product(product_data, link, group[1], elapsed_ms)
+            if details:
+                health.record(details)
+                saver.put(details)
+
+        pipeline.run(
+            sched,
+            lambda group, link: (link, (link, group[0].replace('-', ' ').capitalize(), query_date)),
+            _fetcher, extract_product_details, write, STREAM_FIELDS,
+            _options.fetch_workers, _options.parse_workers,
+            delay=lambda: random.uniform(2.0, 5.0), requeue=sched.requeue, cache=cache,
+        )
+
+        left = sched.unfinished(work)
+        if left: save_pending(pending_file, left, reason="deadline", json_path=json_path)
+        else: clear_pending(pending_file, json_path)
+
+    except CircuitOpenError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason=str(e), json_path=json_path)
+    except ExtractionHealthError as e:
+        left = sched.unfinished(work)
+        log_and_print(f"{e} Preostalih {len(left)} podkategorij shranjenih za nadaljevanje.", to_file=True)
+        save_pending(pending_file, left, reason="health", json_path=json_path)
+        return 2
     except KeyboardInterrupt:
         log_and_print("Prekinjeno.", to_file=True)
     except Exception as e:
-        log_and_print(f"NAPAKA: {e}", to_file=True)
-        import traceback
-        traceback.print_exc(file=_log_file)
+        log.exception(f"NAPAKA: {e}")
     finally:
-        if all_data_buffer:
-            save_data(all_data_buffer, json_path, excel_path)
+        saver.close()
         log_and_print("--- Končano ---", to_file=True)
-        if _log_file: _log_file.close()
+        if cache: cache.close(log=log_and_print)
+        if listings: listings.close(log=log_and_print)
+        if _fetcher.archive: _fetcher.archive.close(log=log_and_print)
+        profiling.stop(log=log_and_print)
+        trace.stop(log=log_and_print)
+        log.shutdown()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Skupni moduli za scraperje cenikov (fetch, shranjevanje, nadaljevanje)."""
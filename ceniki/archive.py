@@ -0,0 +1,139 @@
+"""Raw-response archive, so pages can be re-extracted without crawling again.
+
+With ``--archive``/``ARCHIVE_RAW=1`` every response the ``Fetcher`` returns is
+appended to ``<OUTPUT_DIR>/Ceniki_Archive/<SHOP>/<date>/`` as a WARC/1.1
+``response`` record (URL, timestamp, status line, headers, body). Each
+record is compressed on its own (a separate zstd frame, or gzip member
+when ``zstandard`` is not installed), so any record can be read by seeking
+to its offset. Offsets are listed in the run's ``.idx.jsonl``, one line per
+record. Archive files roll over at ``max_bytes``.
+
+Bodies are stored as the parser saw them, already decoded from gzip/brotli,
+so ``Content-Encoding`` and the transfer headers are left out. A body cut
+short by a streaming fetch carries ``WARC-Truncated: length``.
+"""
+
+import gzip
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+# Glave, ki po dekompresiji telesa ne veljajo več.
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def archive_dir(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/... -> <root>/Ceniki_Archive/<SHOP>/<date>"""
+    date_dir = os.path.dirname(json_path)
+    shop_dir = os.path.dirname(date_dir)
+    root = os.path.dirname(os.path.dirname(shop_dir))
+    return os.path.join(root, "Ceniki_Archive", os.path.basename(shop_dir), os.path.basename(date_dir))
+
+
+def codec(zstd_level=10, gzip_level=6):
+    """(file extension, compress function): zstd when ``zstandard`` is installed, else gzip."""
+    try:
+        import zstandard
+    except ImportError:
+        return ".gz", lambda data: gzip.compress(data, compresslevel=gzip_level)
+    return ".zst", zstandard.ZstdCompressor(level=zstd_level).compress
+
+
+def decompressor(path):
+    if path.endswith(".zst"):
+        import zstandard
+        return lambda data: zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 30)
+    return gzip.decompress
+
+
+def warc_record(url, status, reason, headers, body, encoding=None, truncated=False, when=None):
+    when = when or datetime.now(timezone.utc)
+    http = [f"HTTP/1.1 {status} {reason or ''}".rstrip()]
+    http += [f"{k}: {v}" for k, v in headers.items() if k.lower() not in _DROP_HEADERS]
+    payload = ("\r\n".join(http) + "\r\n\r\n").encode('latin-1', 'replace') + body
+    warc = ["WARC/1.1", "WARC-Type: response", f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+            f"WARC-Date: {when.strftime('%Y-%m-%dT%H:%M:%SZ')}", f"WARC-Target-URI: {url}",
+            "Content-Type: application/http;msgtype=response", f"Content-Length: {len(payload)}"]
+    if encoding:
+        warc.append(f"WARC-X-Encoding: {encoding}")
+    if truncated:
+        warc.append("WARC-Truncated: length")
+    return ("\r\n".join(warc) + "\r\n\r\n").encode('utf-8') + payload + b"\r\n\r\n"
+
+
+class RawArchive:
+    """Appends responses to rolling compressed WARC files; safe to share between fetch threads."""
+
+    def __init__(self, directory, shop, max_bytes=200 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.stamp = f"{shop}_Arhiv_{datetime.now().strftime('%H-%M-%S')}"
+        self.max_bytes = max_bytes
+        self.ext, self.compress = codec()
+        self.index = open(os.path.join(directory, f"{self.stamp}.idx.jsonl"), 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.part = 0
+        self.file = None
+        self.records = 0
+
+    def _open(self):
+        self.part += 1
+        name = f"{self.stamp}_{self.part:03d}.warc{self.ext}"
+        self.file = open(os.path.join(self.directory, name), 'ab')
+        return name
+
+    def write(self, url, response, body, encoding=None, truncated=False):
+        when = datetime.now(timezone.utc)
+        frame = self.compress(warc_record(url, response.status_code, response.reason, response.headers, body,
+                                          encoding, truncated, when))
+        with self.lock:
+            if self.file is None or (self.file.tell() and self.file.tell() + len(frame) > self.max_bytes):
+                if self.file:
+                    self.file.close()
+                self._open()
+            offset = self.file.tell()
+            self.file.write(frame)
+            self.index.write(json.dumps({
+                "url": url, "status": response.status_code, "date": when.isoformat(timespec='seconds'),
+                "file": os.path.basename(self.file.name), "offset": offset, "length": len(frame),
+                "encoding": encoding, "truncated": truncated}, ensure_ascii=False) + "\n")
+            self.records += 1
+
+    def close(self, log=None):
+        with self.lock:
+            if self.file:
+                self.file.close()
+            self.index.close()
+        if log and self.records:
+            log(f"Arhiv surovih odgovorov: {self.records} zapisov v {self.directory}")
+
+
+def parse_record(data):
+    """Decompressed WARC record -> (warc headers, http headers, body)."""
+    warc_head, _, rest = data.partition(b"\r\n\r\n")
+    warc = dict(line.split(": ", 1) for line in warc_head.decode('utf-8').split("\r\n")[1:])
+    http_head, _, body = rest[:int(warc["Content-Length"])].partition(b"\r\n\r\n")
+    lines = http_head.decode('latin-1').split("\r\n")
+    http = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+    http[":status"] = lines[0]
+    return warc, http, body
+
+
+def read_record(directory, entry):
+    """(warc headers, http headers, body) of the record an index entry points to."""
+    path = os.path.join(directory, entry["file"])
+    with open(path, 'rb') as f:
+        f.seek(entry["offset"])
+        return parse_record(decompressor(path)(f.read(entry["length"])))
+
+
+def iter_index(directory):
+    """Index entries of every run archived in ``directory``, in write order per run."""
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".idx.jsonl"):
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
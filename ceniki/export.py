@@ -0,0 +1,122 @@
+"""Pluggable exporters for the scraped records.
+
+The JSON file is the scripts' working store and is always written by
+``save_data``; everything else is selected with ``--export``/``EXPORT_FORMATS``
+and ``--no-excel``/``EXPORT_EXCEL=0``. pandas, openpyxl and pyarrow are only
+imported inside the exporter that needs them.
+
+Exporters take any re-iterable of records and consume it row by row; the XLSX
+exporter uses openpyxl's write-only workbook, so it holds no worksheet model
+and no DataFrame copy of the records. A ``RecordSource`` lets an exporter
+read a lazily ordered view (Merkur's renumbering) instead of a sorted copy.
+"""
+
+import csv
+import json
+import os
+
+COLUMNS = ["Skupina", "Zap", "Oznaka / naziv", "EAN", "Opis", "EM", "Valuta", "DDV", "Proizvajalec",
+           "Veljavnost od", "Dobava", "Cena / EM (z DDV)", "Akcijska cena / EM (z DDV)",
+           "Cena / EM (brez DDV)", "Akcijska cena / EM (brez DDV)", "URL", "SLIKA URL"]
+
+DEFAULT_FORMATS = ("json", "xlsx")
+
+
+def _row(record):
+    return [record.get(c, '') for c in COLUMNS]
+
+
+def export_json(records, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(list(records), f, ensure_ascii=False, indent=4)
+
+
+def export_jsonl(records, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def export_csv(records, path):
+    # utf-8-sig + ';', da ga slovenski Excel odpre pravilno.
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(COLUMNS)
+        for record in records:
+            writer.writerow(_row(record))
+
+
+def export_xlsx(records, path):
+    from openpyxl import Workbook
+
+    # write_only: vrstice gredo sproti na disk, brez celotnega modela v pomnilniku.
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(COLUMNS)
+    for record in records:
+        ws.append(_row(record))
+    wb.save(path)
+
+
+def export_parquet(records, path):
+    import pandas as pd
+
+    df = pd.DataFrame([_row(r) for r in records], columns=COLUMNS).astype(str)
+    df.to_parquet(path, index=False)
+
+
+EXPORTERS = {
+    "json": (".json", export_json),
+    "jsonl": (".jsonl", export_jsonl),
+    "xlsx": (".xlsx", export_xlsx),
+    "csv": (".csv", export_csv),
+    "parquet": (".parquet", export_parquet),
+}
+
+
+def selected_formats(options):
+    """Formats requested by ``options`` (see ``ceniki.options``), in a stable order."""
+    requested = [f.strip().lower() for f in (options.export or '').split(',') if f.strip()]
+    formats = requested or list(DEFAULT_FORMATS)
+    unknown = [f for f in formats if f not in EXPORTERS]
+    if unknown:
+        raise ValueError(f"Neznani formati izvoza: {', '.join(unknown)}")
+    if not options.excel:
+        formats = [f for f in formats if f != "xlsx"]
+    return list(dict.fromkeys(formats))
+
+
+class RecordSource:
+    """Re-iterable view over ``factory()``; every exporter gets its own pass."""
+
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __iter__(self):
+        return iter(self.factory())
+
+
+def export_records(records, base_path, formats, log=None):
+    """Write ``records`` to ``base_path`` + extension for every format in ``formats``.
+
+    ``records`` must be re-iterable (a list or a ``RecordSource``).
+    """
+    for fmt in formats:
+        ext, exporter = EXPORTERS[fmt]
+        path = base_path + ext
+        try:
+            exporter(records, path)
+            if log: log(f"Shranjen {fmt.upper()}: {path}")
+        except Exception as e:
+            if log: log(f"Napaka pri shranjevanju {fmt.upper()} ({path}): {e}")
+
+
+def read_excel_records(path):
+    """Records from an earlier .xlsx export (fallback when the JSON is missing)."""
+    import pandas as pd
+
+    return pd.read_excel(path).to_dict(orient='records')
+
+
+def base_path(path):
+    return os.path.splitext(path)[0]
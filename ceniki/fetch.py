@@ -0,0 +1,554 @@
+"""Shared HTTP fetch layer for the shop scrapers.
+
+Every request goes through ``Fetcher.get``, which retries transient errors
+(timeouts, connection resets, 429 and 5xx responses) with jittered
+exponential backoff, honours ``Retry-After`` and keeps a circuit breaker per
+host. Once a host's breaker is open, ``get`` raises ``CircuitOpenError``
+immediately so the caller can stop and record the remaining work as pending.
+
+Detail pages can optionally be streamed (``STREAM_DETAILS=1``): the body is
+fed chunk by chunk to ``FieldWatcher`` and the connection is closed as soon as
+every field the shop declared has been seen, see ``fetch_detail``.
+
+Responses are handed to the parser as raw bytes (``Page``) together with the
+charset from ``Content-Type`` or the shop's configured encoding, so requests'
+charset detection never runs and no intermediate str copy is made.
+
+Timeouts follow each host's recent latency (``HostLatency``): once a host
+has answered ``min_samples`` times, the connect and read timeouts shrink to a
+multiple of its observed percentiles, never above the configured values.
+With ``hedge=True`` a request still waiting after the host's p95 gets one
+duplicate on a second connection and the first response wins; hedges are
+limited to ``hedge_ratio`` of the host's requests.
+
+With ``Fetcher.archive`` set (see ``ceniki.archive``) every returned body is
+also written to the raw-response archive.
+
+Sessions use ``_TracingAdapter``, which times name lookup, TCP connect and
+TLS handshake of each new connection for ``ceniki.trace``; while tracing is
+off it behaves exactly like requests' default adapter.
+"""
+
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from html.parser import HTMLParser
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from ceniki import log, profiling, trace
+
+# Statusi, pri katerih ima ponovni poskus smisel.
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+STREAM_DETAILS = os.environ.get("STREAM_DETAILS", "0") == "1"
+
+_CHARSET_RE = re.compile(r'charset\s*=\s*["\']?([\w.:-]+)', re.IGNORECASE)
+
+# Kdaj je bila povezava trenutne zahteve te niti vzpostavljena (za začetek ttfb).
+_wire = threading.local()
+
+
+class Page(NamedTuple):
+    """Raw response body plus the encoding it should be decoded with."""
+    content: bytes
+    encoding: Optional[str]
+
+
+def declared_encoding(content_type):
+    """Charset from a Content-Type header value, or None if it is not declared."""
+    m = _CHARSET_RE.search(content_type or '')
+    return m.group(1) if m else None
+
+
+@profiling.phase("parse")
+def parse_html(page, features='html.parser'):
+    """BeautifulSoup from a ``Page`` without a str round trip or charset sniffing."""
+    return BeautifulSoup(page.content, features, from_encoding=page.encoding)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of a request while the host's circuit breaker is open."""
+
+    def __init__(self, host, retry_at=None):
+        super().__init__(f"Circuit breaker za {host} je odprt.")
+        self.host = host
+        self.retry_at = retry_at
+
+
+class HostBreaker:
+    """Consecutive-failure circuit breaker for a single host.
+
+    closed -> open after ``threshold`` consecutive failures; after ``cooldown``
+    seconds one trial request is let through (half-open). A successful trial
+    closes the breaker, a failed one re-opens it for another cooldown.
+    """
+
+    def __init__(self, threshold=5, cooldown=300.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        return self.state != "open"
+
+    def retry_at(self):
+        if self.opened_at is None:
+            return None
+        return time.time() + max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class HostLatency:
+    """Recent time-to-headers of one host, and the timeouts and hedge delay derived from them."""
+
+    def __init__(self, window=200, min_samples=20, hedge_ratio=0.05):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.hedge_ratio = hedge_ratio
+        self.hedge_tokens = 1.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            # Vsaka zahteva prinese delček žetona; zamujena zahteva ga porabi celega.
+            self.hedge_tokens = min(2.0, self.hedge_tokens + self.hedge_ratio)
+
+    @property
+    def ready(self):
+        return len(self.samples) >= self.min_samples
+
+    def percentile(self, p):
+        with self.lock:
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def timeouts(self, limits, floor=(1.0, 3.0)):
+        """(connect, read) timeouts for this host, capped by the configured ``limits``."""
+        if not self.ready:
+            return limits
+        connect = min(limits[0], max(floor[0], 3 * self.percentile(50)))
+        read = min(limits[1], max(floor[1], 4 * self.percentile(99)))
+        return connect, read
+
+    def take_hedge(self):
+        with self.lock:
+            if self.hedge_tokens < 1.0:
+                return False
+            self.hedge_tokens -= 1.0
+            return True
+
+
+class _TracedConnection:
+    """Records ``dns`` and ``connect`` spans for every new connection while tracing is on."""
+
+    def _new_conn(self):
+        if not trace.enabled():
+            return super()._new_conn()
+        start = trace.now()
+        try:
+            socket.getaddrinfo(self._dns_host, self.port, type=socket.SOCK_STREAM)
+        except OSError:
+            pass  # napako sporoči urllib3 pri povezovanju
+        resolved = trace.now()
+        trace.record("dns", start, resolved, "net", host=self.host)
+        # urllib3 razreši ime znova; odgovor pride iz predpomnilnika razreševalnika.
+        sock = super()._new_conn()
+        self._connected_at = _wire.ready = trace.now()
+        trace.record("connect", resolved, self._connected_at, "net", host=self.host)
+        return sock
+
+
+class _TracedHTTPConnection(_TracedConnection, HTTPConnection):
+    pass
+
+
+class _TracedHTTPSConnection(_TracedConnection, HTTPSConnection):
+    def connect(self):
+        self._connected_at = None
+        super().connect()
+        if self._connected_at is not None and trace.enabled():
+            _wire.ready = trace.now()
+            trace.record("tls", self._connected_at, _wire.ready, "net", host=self.host)
+
+
+class _TracedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TracedHTTPConnection
+
+
+class _TracedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TracedHTTPSConnection
+
+
+class _TracingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TracedHTTPPool, "https": _TracedHTTPSPool}
+
+
+def _new_session():
+    session = requests.Session()
+    session.mount("https://", _TracingAdapter())
+    session.mount("http://", _TracingAdapter())
+    return session
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def parse_retry_after(value):
+    """Return the ``Retry-After`` delay in seconds (delta or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class Fetcher:
+    """requests.Session wrapper with retries, backoff and per-host breakers.
+
+    ``get`` returns a ``Page``, or None for permanent failures (4xx, retries
+    exhausted), and raises ``CircuitOpenError`` when the host is considered dead.
+    ``encoding`` is used when the server does not declare a charset;
+    ``archive`` is an optional ``RawArchive``. ``timeout``/``connect_timeout``
+    are upper bounds once ``adaptive`` timeouts have enough samples.
+    """
+
+    def __init__(self, headers=None, user_agents=None, timeout=20, connect_timeout=5,
+                 retries=4, backoff_base=1.0, backoff_cap=60.0, max_retry_after=300.0,
+                 breaker_threshold=5, breaker_cooldown=300.0, encoding='utf-8', log=None, archive=None,
+                 adaptive=True, hedge=False, hedge_ratio=0.05):
+        self.session = _new_session()
+        self.encoding = encoding
+        self.headers = dict(headers or {})
+        self.user_agents = list(user_agents or [])
+        self.timeout = (connect_timeout, timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.log = log or (lambda message: None)
+        self.archive = archive
+        self.adaptive = adaptive
+        self.hedge = hedge
+        self.hedge_ratio = hedge_ratio
+        self._breakers = {}
+        self._latency = {}
+        self._hedge_pool = None
+        self._hedge_session = None
+
+    def breaker(self, host):
+        if host not in self._breakers:
+            self._breakers[host] = HostBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return self._breakers[host]
+
+    def latency(self, host):
+        if host not in self._latency:
+            self._latency[host] = HostLatency(hedge_ratio=self.hedge_ratio)
+        return self._latency[host]
+
+    def _hedged(self, url, stats, timeout):
+        """GET that sends one duplicate if no response came within the host's p95."""
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(8, thread_name_prefix="ceniki-hedge")
+            self._hedge_session = _new_session()
+        first = self._hedge_pool.submit(self.session.get, url, headers=self._request_headers(), timeout=timeout)
+        delay = stats.percentile(95)
+        done, _ = wait([first], timeout=delay)
+        if done or not stats.take_hedge():
+            return first.result()
+        log.event("hedge", url=url, after_ms=round(delay * 1000))
+        second = self._hedge_pool.submit(self._hedge_session.get, url, headers=self._request_headers(),
+                                         timeout=timeout)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return future.result()
+        raise error
+
+    def _send(self, url, host, stream):
+        stats = self.latency(host)
+        timeout = stats.timeouts(self.timeout) if self.adaptive else self.timeout
+        _wire.ready = None
+        sent = trace.now()
+        try:
+            if self.hedge and not stream and stats.ready:
+                response = self._hedged(url, stats, timeout)
+            else:
+                response = self.session.get(url, headers=self._request_headers(), timeout=timeout, stream=stream)
+        except requests.exceptions.Timeout:
+            # Časovna omejitev je spodnja meja zakasnitve: brez nje bi se meje le zmanjševale.
+            stats.add(timeout[1])
+            trace.record("timeout", sent, cat="net", url=url, limit=timeout[1])
+            raise
+        stats.add(response.elapsed.total_seconds())
+        if trace.enabled():
+            self._trace_response(url, sent, response, stream)
+        return response
+
+    def _trace_response(self, url, sent, response, stream):
+        """``ttfb`` and (for a body that was already read) ``download`` spans of a response."""
+        end = trace.now()
+        headers_at = min(end, sent + response.elapsed.total_seconds())
+        ready = getattr(_wire, 'ready', None) or sent
+        trace.record("ttfb", min(max(sent, ready), headers_at), headers_at, "net", url=url,
+                     status=response.status_code)
+        if not stream:
+            trace.record("download", headers_at, end, "net", url=url, bytes=len(response.content))
+
+    def _request_headers(self):
+        headers = dict(self.headers)
+        if self.user_agents:
+            headers['User-Agent'] = random.choice(self.user_agents)
+        return headers
+
+    def _backoff(self, attempt):
+        # "Full jitter": naključno med 0 in eksponentno mejo.
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _request(self, url, stream=False):
+        """Send GET with retries; return the response, or None on a permanent failure."""
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(host, breaker.retry_at())
+            try:
+                response = self._send(url, host, stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                breaker.record_failure()
+                reason = str(e)
+                delay = self._backoff(attempt)
+            except requests.exceptions.RequestException as e:
+                self.log(f"Napaka pri dostopu do URL-ja {url}: {e}")
+                return None
+            else:
+                status = response.status_code
+                if status < 400:
+                    breaker.record_success()
+                    return response
+                response.close()
+                if status not in RETRY_STATUSES:
+                    # Gostitelj odgovarja, napaka je trajna (npr. 404).
+                    breaker.record_success()
+                    self.log(f"Napaka pri dostopu do URL-ja {url}: HTTP {status}")
+                    return None
+                if status != 429:
+                    breaker.record_failure()
+                reason = f"HTTP {status}"
+                delay = self._backoff(attempt)
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, self.max_retry_after))
+
+            if attempt == self.retries:
+                break
+            if not breaker.allow():
+                raise CircuitOpenError(host, breaker.retry_at())
+            self.log(f"  Ponovni poskus {attempt + 1}/{self.retries} za {url} čez {delay:.1f} s ({reason})")
+            trace.sleep(delay, "backoff", url=url, reason=reason)
+
+        self.log(f"Napaka pri dostopu do URL-ja {url}: {reason} (po {self.retries + 1} poskusih)")
+        return None
+
+    def _encoding(self, response):
+        return declared_encoding(response.headers.get('Content-Type')) or self.encoding
+
+    @profiling.phase("fetch")
+    def get(self, url):
+        response = self._request(url)
+        if response is None:
+            return None
+        page = Page(response.content, self._encoding(response))
+        if self.archive:
+            self.archive.write(url, response, page.content, page.encoding)
+        return page
+
+    @profiling.phase("fetch")
+    def get_streaming(self, url, fields, chunk_size=8192):
+        """Read the body incrementally until every field in ``fields`` was seen.
+
+        Returns ``(page, complete)`` where ``complete`` tells whether the whole
+        body was read. ``(None, False)`` means the caller should fall back to a
+        regular ``get``.
+        """
+        response = self._request(url, stream=True)
+        if response is None:
+            return None, False
+        watcher = FieldWatcher(fields)
+        parts = []
+        complete = True
+        started = trace.now()
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                parts.append(chunk)
+                # Oznake in atributi, ki jih iščemo, so ASCII; latin-1 nikoli ne spodleti.
+                watcher.feed(chunk.decode('latin-1'))
+                if watcher.done:
+                    complete = False
+                    break
+        except requests.exceptions.RequestException as e:
+            self.log(f"  Prekinjen prenos {url}: {e}")
+            return None, False
+        finally:
+            response.close()
+        page = Page(b''.join(parts), self._encoding(response))
+        trace.record("download", started, cat="net", url=url, bytes=len(page.content), complete=complete)
+        if self.archive:
+            self.archive.write(url, response, page.content, page.encoding, truncated=not complete)
+        return page, complete
+
+
+_SELECTOR_RE = re.compile(r'^([\w-]*)((?:[.#][\w-]+)*)(?:\[([\w:-]+)(?:=["\']?([^"\'\]]*)["\']?)?\])?$')
+
+
+def _parse_selector(selector):
+    """Parse a simple ``tag.class#id[attr=value]`` selector into a matcher tuple."""
+    m = _SELECTOR_RE.match(selector.strip())
+    if not m:
+        raise ValueError(f"Nepodprt selektor: {selector}")
+    tag, rest, attr, value = m.groups()
+    classes = set(re.findall(r'\.([\w-]+)', rest or ''))
+    ids = re.findall(r'#([\w-]+)', rest or '')
+    return tag.lower() or None, classes, ids[0] if ids else None, attr, value
+
+
+def _matches(selector, tag, attrs):
+    sel_tag, classes, sel_id, attr, value = selector
+    if sel_tag and sel_tag != tag:
+        return False
+    if classes and not classes <= set((attrs.get('class') or '').split()):
+        return False
+    if sel_id and attrs.get('id') != sel_id:
+        return False
+    if attr:
+        if attr not in attrs:
+            return False
+        if value is not None and attrs.get(attr) != value:
+            return False
+    return True
+
+
+class FieldWatcher(HTMLParser):
+    """Incremental parser that tracks when declared fields are fully received.
+
+    ``fields`` maps a field name to a selector, or to a tuple of alternative
+    selectors in the order the extractor tries them. A field counts as found
+    once an element matching its first selector has been closed, or
+    immediately for void elements such as ``img`` and ``meta``. A later
+    alternative never completes a field: the preferred element may still
+    follow, and the extractor would read it instead.
+    """
+
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+    def __init__(self, fields):
+        super().__init__(convert_charrefs=False)
+        self.pending = {}
+        for name, selectors in fields.items():
+            if isinstance(selectors, str):
+                selectors = (selectors,)
+            self.pending[name] = [_parse_selector(s) for s in selectors]
+        self.found = set()
+        self._open = []  # [ime polja, tag, globina]
+
+    @property
+    def done(self):
+        return not self.pending and not self._open
+
+    def _match_start(self, tag, attrs, void):
+        attrs = dict(attrs)
+        for entry in self._open:
+            if entry[1] == tag:
+                entry[2] += 1
+        for name, selectors in list(self.pending.items()):
+            if _matches(selectors[0], tag, attrs):
+                del self.pending[name]
+                if void:
+                    self.found.add(name)
+                else:
+                    self._open.append([name, tag, 1])
+
+    def handle_starttag(self, tag, attrs):
+        self._match_start(tag, attrs, tag in self.VOID_TAGS)
+
+    def handle_startendtag(self, tag, attrs):
+        self._match_start(tag, attrs, True)
+
+    def handle_endtag(self, tag):
+        for entry in list(self._open):
+            if entry[1] == tag:
+                entry[2] -= 1
+                if entry[2] == 0:
+                    self._open.remove(entry)
+                    self.found.add(entry[0])
+
+
+def fetch_detail(fetcher, url, extract, fields=None, stream=None):
+    """Fetch a detail page and return ``extract(page)``.
+
+    With ``STREAM_DETAILS=1`` (or ``stream=True``) and declared ``fields`` the
+    page is streamed and cut off once all fields were seen; if the extractor
+    then leaves any of them empty, the page is downloaded again in full. The
+    page cache is applied by ``ceniki.pipeline``, which knows the extractor's
+    arguments.
+    """
+    if fields and (STREAM_DETAILS if stream is None else stream):
+        page, complete = fetcher.get_streaming(url, fields)
+        if page is not None:
+            data = extract(page)
+            if complete or (data and all(data.get(name) for name in fields)):
+                return data
+            fetcher.log(f"  Manjkajoča polja v delnem prenosu, prenašam celoten {url}")
+    page = fetcher.get(url)
+    return extract(page) if page else None
@@ -0,0 +1,140 @@
+"""Extraction health check: stop a run as soon as the shop's template has broken.
+
+When a shop changes its HTML the crawl does not fail. It goes on saving
+records with an empty ``Opis`` or price, or listings come back empty on
+the first page. ``HealthMonitor`` watches both and raises
+``ExtractionHealthError`` with a diagnostic, which the shop handles like an
+open circuit breaker: the remaining work is saved as pending and the
+script exits with status 2.
+
+* Fill rates: over the last ``window`` saved records, the share of records
+  with each of ``fields`` filled. Once ``min_records`` records were seen, a
+  field below half of its fill rate in the previous run (or below
+  ``min_fill`` when there is no previous run) fails the check.
+* Listings: product counts per group are remembered in
+  ``<SHOP>_Listing_Counts.json`` next to the daily folders. A group that
+  yields less than ``min_ratio`` of its previous count (if that was at
+  least ``min_expected``), or nothing at all when there is no previous
+  count, is suspicious; ``max_bad_groups`` suspicious groups in a row fail
+  the check.
+"""
+
+import json
+import os
+from collections import deque
+
+from ceniki import log
+from ceniki.priority import PRICE, history_files
+
+FIELDS = ("Opis", PRICE)
+
+
+class ExtractionHealthError(Exception):
+    """Raised when extracted records or listings look like a broken template."""
+
+
+def counts_path(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/... -> <root>/Ceniki_Scraping/<SHOP>/<SHOP>_Listing_Counts.json"""
+    shop_dir = os.path.dirname(os.path.dirname(json_path))
+    return os.path.join(shop_dir, f"{os.path.basename(shop_dir)}_Listing_Counts.json")
+
+
+def fill_rates(records, fields=FIELDS):
+    if not records:
+        return {}
+    return {name: sum(1 for r in records if r.get(name)) / len(records) for name in fields}
+
+
+def _group_key(group):
+    return json.dumps(group, ensure_ascii=False) if not isinstance(group, str) else group
+
+
+class HealthMonitor:
+    def __init__(self, fields=FIELDS, baseline=None, expected=None, window=200, min_records=50, min_fill=0.5,
+                 min_ratio=0.2, min_expected=5, max_bad_groups=3, counts_file=None):
+        self.fields = tuple(fields)
+        self.baseline = dict(baseline or {})
+        self.expected = dict(expected or {})
+        self.window = deque(maxlen=window)
+        self.min_records = min_records
+        self.min_fill = min_fill
+        self.min_ratio = min_ratio
+        self.min_expected = min_expected
+        self.max_bad_groups = max_bad_groups
+        self.counts_file = counts_file
+        self.counts = {}
+        self.bad_groups = []
+
+    @classmethod
+    def for_run(cls, json_path, fields=FIELDS, **kwargs):
+        """Monitor with fill-rate baselines from the shop's previous output and its remembered listing counts."""
+        baseline = {}
+        previous = history_files(json_path)
+        if previous:
+            try:
+                with open(previous[-1][1], 'r', encoding='utf-8') as f:
+                    baseline = fill_rates(json.load(f), fields)
+            except (OSError, ValueError):
+                pass
+        expected = {}
+        path = counts_path(json_path)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    expected = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return cls(fields, baseline, expected, counts_file=path, **kwargs)
+
+    def threshold(self, name):
+        if name in self.baseline:
+            return self.baseline[name] / 2
+        return self.min_fill
+
+    def record(self, data):
+        """Check a saved record; raises ``ExtractionHealthError`` when fill rates collapsed."""
+        if not data:
+            return
+        self.window.append((data.get('URL', ''), {name: bool(data.get(name)) for name in self.fields}))
+        if len(self.window) < self.min_records:
+            return
+        rates = {name: sum(filled[name] for _url, filled in self.window) / len(self.window) for name in self.fields}
+        failing = [name for name in self.fields if rates[name] < self.threshold(name)]
+        if failing:
+            examples = [url for url, filled in reversed(self.window) if not all(filled[n] for n in failing)][:3]
+            self._fail("zapisi", "Izpolnjenost polj v zadnjih {} zapisih: {}. Primeri: {}".format(
+                len(self.window),
+                ", ".join(f"{name} {rates[name]:.0%} (pričakovano vsaj {self.threshold(name):.0%})"
+                          for name in failing),
+                ", ".join(examples)), rates=rates)
+
+    def listing(self, group, count):
+        """Check a group's listing size; raises ``ExtractionHealthError`` after too many suspicious groups."""
+        key = _group_key(group)
+        self.counts[key] = count
+        previous = self.expected.get(key)
+        if previous is not None and previous >= self.min_expected:
+            suspicious = count < self.min_ratio * previous
+        else:
+            suspicious = previous is None and count == 0
+        if not suspicious:
+            self.bad_groups = []
+            return
+        self.bad_groups.append((key, count, previous))
+        log.event("listing_suspicious", group=key, products=count, expected=previous)
+        if len(self.bad_groups) >= self.max_bad_groups:
+            self._fail("seznami", "Zaporedoma {} skupin z (pre)malo izdelki: {}".format(
+                len(self.bad_groups), "; ".join(f"{k}: {c} (prej {p if p is not None else '?'})"
+                                                for k, c, p in self.bad_groups)))
+
+    def _fail(self, kind, message, **fields):
+        log.event("health_abort", kind=kind, message=message, **fields)
+        raise ExtractionHealthError(f"Zajem ustavljen, predloga trgovine se je verjetno spremenila ({kind}). {message}")
+
+    def save_counts(self):
+        """Remember this run's listing counts for the next run (after a run that was not aborted)."""
+        if not self.counts_file or not self.counts:
+            return
+        merged = dict(self.expected, **self.counts)
+        with open(self.counts_file, 'w', encoding='utf-8') as f:
+            json.dump(merged, f, ensure_ascii=False, indent=1)
@@ -0,0 +1,77 @@
+"""Skip walking category listings that did not change since the last run.
+
+For every category the cache keeps the links the last complete walk found,
+in order, a fingerprint of each listing page (a hash of the product links on
+it), the total the shop reported and the page size used. The next run still
+fetches page 1; when its fingerprint, the reported total and the page size
+all match the stored ones, the stored links are reused and pages 2+ are not
+requested. Any difference means a full walk, which then replaces the entry.
+
+Only shops whose listings yield bare links use it: a listing that also
+carries the price (Merkur, OBI) has to be read in full every time.
+
+The store is ``<SHOP>_ListingCache.json`` next to the shop's daily folders,
+written on ``close``; an entry is only stored after a walk that reached the
+last page.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from ceniki import log
+
+
+def listings_path(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/... -> <root>/Ceniki_Scraping/<SHOP>/<SHOP>_ListingCache.json"""
+    shop_dir = os.path.dirname(os.path.dirname(json_path))
+    return os.path.join(shop_dir, f"{os.path.basename(shop_dir)}_ListingCache.json")
+
+
+def fingerprint(links):
+    return hashlib.sha1('\n'.join(links).encode('utf-8')).hexdigest()[:16]
+
+
+class ListingCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def reuse(self, key, first_page, total=None, size=None):
+        """The stored links of an unchanged category, given the links on its first page, else None."""
+        entry = self.entries.get(key)
+        if (entry and entry["pages"] and entry["pages"][0] == fingerprint(first_page)
+                and entry["total"] == total and entry["size"] == size):
+            self.hits += 1
+            self.skipped += len(entry["pages"]) - 1
+            log.event("listing_cached", category=key, products=len(entry["links"]), pages=len(entry["pages"]))
+            return list(entry["links"])
+        self.misses += 1
+        return None
+
+    def store(self, key, pages, links, total=None, size=None):
+        """Remember a complete walk: ``pages`` holds the links found on each listing page."""
+        self.entries[key] = {"pages": [fingerprint(p) for p in pages], "links": list(links), "total": total,
+                             "size": size, "at": time.time()}
+        self.changed = True
+
+    def close(self, log=None):
+        if log and (self.hits or self.misses):
+            log(f"Nespremenjenih seznamov: {self.hits} od {self.hits + self.misses} "
+                f"({self.skipped} strani seznamov preskočenih).")
+        if not self.changed:
+            return
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(self.path + '.tmp', self.path)
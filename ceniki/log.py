@@ -0,0 +1,205 @@
+"""Buffered, structured logging for the scrapers.
+
+The crawl thread only puts log records on a queue (``QueueHandler``); a
+background writer thread formats them and writes to stdout, the text log and a
+JSON-lines event log, flushing in batches (every ``flush_every`` records or
+``flush_interval`` seconds). Per-item lines use the ``ITEM`` level and are off
+by default in CI; structured events carry shop, category, URL and timing
+fields and always go to the JSON-lines file.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+
+ITEM = 15
+logging.addLevelName(ITEM, "ITEM")
+
+_logger = logging.getLogger("ceniki")
+_logger.propagate = False
+_writer = None
+_shop = None
+
+
+def _in_ci():
+    return os.environ.get("GITHUB_ACTIONS", "").lower() == "true" or bool(os.environ.get("CI"))
+
+
+class BatchingHandler(logging.Handler):
+    """Write formatted lines to a stream, flushing only in batches."""
+
+    def __init__(self, stream, flush_every=50, close_stream=False):
+        super().__init__()
+        self.stream = stream
+        self.flush_every = flush_every
+        self.close_stream = close_stream
+        self._pending = 0
+
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + '\n')
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if self._pending:
+            self.stream.flush()
+            self._pending = 0
+
+    def close(self):
+        try:
+            self.flush()
+            if self.close_stream:
+                self.stream.close()
+        finally:
+            super().close()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {"ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+                "level": record.levelname, "shop": _shop}
+        fields = getattr(record, 'fields', None) or {}
+        if not getattr(record, 'structured_only', False):
+            data["msg"] = record.getMessage()
+        data.update(fields)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _TextFilter(logging.Filter):
+    """Keep structured-only events out of text outputs; optionally console-only lines out of files."""
+
+    def __init__(self, is_file):
+        super().__init__()
+        self.is_file = is_file
+
+    def filter(self, record):
+        if getattr(record, 'structured_only', False):
+            return False
+        return not (self.is_file and getattr(record, 'console_only', False))
+
+
+class _Writer(threading.Thread):
+    def __init__(self, q, handlers, flush_interval):
+        super().__init__(name="ceniki-log-writer", daemon=True)
+        self.q = q
+        self.handlers = handlers
+        self.flush_interval = flush_interval
+
+    def _flush(self):
+        for h in self.handlers:
+            h.flush()
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self.q.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush()
+                last_flush = time.monotonic()
+                continue
+            if record is None:
+                break
+            for h in self.handlers:
+                if record.levelno >= h.level:
+                    h.handle(record)
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.monotonic()
+        self._flush()
+
+
+def events_path_for(log_path):
+    """<SHOP>_Scraping_Log_<t>.txt -> <SHOP>_Events_<t>.jsonl"""
+    head, name = os.path.split(log_path)
+    return os.path.join(head, os.path.splitext(name.replace('_Scraping_Log_', '_Events_'))[0] + '.jsonl')
+
+
+def setup(shop, log_path, items=None, level=None, flush_every=50, flush_interval=2.0):
+    """Start the background writer for ``shop``; call ``shutdown()`` at the end of the run."""
+    global _writer, _shop
+    if _writer is not None:
+        shutdown()
+    _shop = shop
+    if items is None:
+        items = not _in_ci()
+    level = logging.getLevelName((level or os.environ.get("LOG_LEVEL") or "INFO").upper())
+    text_level = min(level, ITEM) if items else max(level, logging.INFO)
+
+    fmt = logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+    console = BatchingHandler(sys.stdout, flush_every=flush_every)
+    text_file = BatchingHandler(open(log_path, 'w', encoding='utf-8'), flush_every=flush_every, close_stream=True)
+    events = BatchingHandler(open(events_path_for(log_path), 'w', encoding='utf-8'),
+                             flush_every=flush_every * 4, close_stream=True)
+    for h, is_file in ((console, False), (text_file, True)):
+        h.setFormatter(fmt)
+        h.setLevel(text_level)
+        h.addFilter(_TextFilter(is_file))
+    events.setFormatter(JsonFormatter())
+    events.setLevel(ITEM)
+
+    q = queue.SimpleQueue()
+    _logger.handlers[:] = [logging.handlers.QueueHandler(q)]
+    _logger.setLevel(ITEM)
+    _writer = _Writer(q, [console, text_file, events], flush_interval)
+    _writer.start()
+
+
+def shutdown():
+    """Drain the queue, flush and close all outputs."""
+    global _writer
+    if _writer is None:
+        return
+    _logger.handlers[0].queue.put(None)
+    _writer.join()
+    for h in _writer.handlers:
+        h.close()
+    _logger.handlers[:] = []
+    _writer = None
+
+
+def detach():
+    """Forget a writer inherited through fork; the child then prints directly."""
+    global _writer
+    _writer = None
+    _logger.handlers[:] = []
+
+
+def info(message, to_file=True, **fields):
+    if _writer is None:
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+        return
+    _logger.info(message, extra={"fields": fields, "console_only": not to_file})
+
+
+def item(message, **fields):
+    """Per-item line (shown only with LOG_ITEMS / --log-items)."""
+    if _writer is None:
+        return
+    _logger.log(ITEM, message, extra={"fields": fields})
+
+
+def event(name, **fields):
+    """Structured event for the JSON-lines log only (shop, category, url, timings ...)."""
+    if _writer is None:
+        return
+    fields["event"] = name
+    _logger.log(ITEM, name, extra={"fields": fields, "structured_only": True})
+
+
+def exception(message):
+    """Log ``message`` with the current traceback."""
+    if _writer is None:
+        print(message)
+        return
+    _logger.exception(message)
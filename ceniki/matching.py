@@ -0,0 +1,312 @@
+"""Cross-shop product matching: ``python -m ceniki.matching``.
+
+Reads each shop's latest ``<SHOP>_Podatki_<date>.json`` and groups records
+that describe the same product in different shops. Comparing every pair of
+the combined catalogue is quadratic, so candidates are found through an
+inverted index instead:
+
+* titles (``Opis``) are folded (lowercase, no diacritics, decimal comma ->
+  point), sizes and units (``60x60 cm``, ``25 kg``, ``2,5 l``) are pulled
+  out into a separate set, the rest is split into tokens and trigram
+  shingles,
+* every record is a candidate only for records of *other* shops that share
+  at least one selective token (tokens present in more than ``MAX_DF`` of
+  the catalogue, like "siva" or "ploscica", do not block),
+* candidate pairs are scored by trigram and token overlap, and sizes that
+  contradict each other veto a pair; equal ``EAN`` (only Slovenijales fills
+  it today) is a match on its own.
+
+Each record joins its best counterpart per shop when the choice is mutual, so
+chains of "almost the same" products do not merge, and a group never holds
+two records of one shop.
+
+Groups are kept in ``<OUTPUT_DIR>/Ceniki_Matching/Ceniki_Skupine.sqlite``: a
+product keeps its group ID from run to run as long as it is matched to the
+same products, so the IDs can be used for price comparisons over time. The
+run's groups are also written to ``Ceniki_Skupine_<dd_mm_YYYY>.json``.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+
+# Žeton, ki je v več kot tem deležu izdelkov, ne določa kandidatov.
+MAX_DF = 0.02
+# Največ kandidatov na izdelek (po številu skupnih žetonov).
+MAX_CANDIDATES = 50
+THRESHOLD = 0.55
+WEIGHTS = {"trigrams": 0.6, "tokens": 0.4}
+
+STOPWORDS = {"in", "za", "z", "s", "na", "iz", "od", "do", "ali", "ter", "pri", "po", "v", "x"}
+
+_UNITS = {"mm": "mm", "cm": "cm", "m": "m", "m2": "m2", "m²": "m2", "m3": "m3", "m³": "m3",
+          "kg": "kg", "g": "g", "l": "l", "lit": "l", "ml": "ml", "w": "w", "v": "v", "kos": "kos", "kom": "kos"}
+_NUM = r'\d+(?:\.\d+)?'
+_DIMENSION_RE = re.compile(rf'\b({_NUM})\s*x\s*({_NUM})(?:\s*x\s*({_NUM}))?\s*(mm|cm|m)?\b')
+_MEASURE_RE = re.compile(rf'\b({_NUM})\s*(mm|cm|m2|m3|m|kg|g|ml|lit|l|w|v|kos|kom)\b')
+_DECIMAL_COMMA_RE = re.compile(r'(\d),(\d)')
+_NON_WORD_RE = re.compile(r'[^0-9a-z.]+')
+
+
+def fold(text):
+    """Lowercase, strip diacritics (č -> c), decimal comma -> point."""
+    text = unicodedata.normalize('NFKD', str(text or '').replace('²', '2').replace('³', '3'))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return _DECIMAL_COMMA_RE.sub(r'\1.\2', text)
+
+
+def _number(value):
+    return f"{float(value):g}"
+
+
+def extract_sizes(folded):
+    """Sizes and measures in a folded title -> (set of normalised sizes, title without them)."""
+    sizes = set()
+
+    def dimension(m):
+        parts = [_number(p) for p in m.groups()[:3] if p]
+        sizes.add('x'.join(parts) + (m.group(4) or ''))
+        return ' '
+
+    def measure(m):
+        sizes.add(_number(m.group(1)) + _UNITS[m.group(2)])
+        return ' '
+
+    rest = _DIMENSION_RE.sub(dimension, folded)
+    rest = _MEASURE_RE.sub(measure, rest)
+    return sizes, rest
+
+
+def tokenize(rest):
+    return [t for t in _NON_WORD_RE.sub(' ', rest).replace('.', ' ').split()
+            if len(t) > 1 and t not in STOPWORDS]
+
+
+def trigrams(tokens):
+    return {f"#{t}#"[i:i + 3] for t in tokens for i in range(len(t))}
+
+
+class Item:
+    __slots__ = ("id", "shop", "record", "ean", "sizes", "tokens", "grams")
+
+    def __init__(self, item_id, shop, record):
+        self.id = item_id
+        self.shop = shop
+        self.record = record
+        self.ean = re.sub(r'\D', '', str(record.get('EAN') or '')) or None
+        self.sizes, rest = extract_sizes(fold(record.get('Opis')))
+        self.tokens = set(tokenize(rest))
+        self.grams = trigrams(self.tokens)
+
+    @property
+    def key(self):
+        return self.record.get('URL') or f"{self.record.get('Oznaka / naziv')}|{self.record.get('Opis')}"
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def score(a, b):
+    """Similarity of two items in [0, 1]; 0 when their sizes contradict."""
+    if a.ean and a.ean == b.ean:
+        return 1.0
+    if a.sizes and b.sizes and not (a.sizes & b.sizes):
+        return 0.0
+    return WEIGHTS["trigrams"] * _jaccard(a.grams, b.grams) + WEIGHTS["tokens"] * _jaccard(a.tokens, b.tokens)
+
+
+class MatchIndex:
+    """Inverted index from selective title tokens (and EANs) to items."""
+
+    def __init__(self, items, max_df=None):
+        self.items = items
+        df = Counter(t for item in items for t in item.tokens)
+        limit = max(2, int((max_df or MAX_DF) * len(items)))
+        self.postings = defaultdict(list)
+        for item in items:
+            for t in item.tokens:
+                if df[t] <= limit:
+                    self.postings[t].append(item.id)
+        self.by_ean = defaultdict(list)
+        for item in items:
+            if item.ean:
+                self.by_ean[item.ean].append(item.id)
+
+    def candidates(self, item, limit=MAX_CANDIDATES):
+        """Items of other shops sharing a selective token or the EAN, most shared tokens first."""
+        shared = Counter()
+        for t in item.tokens:
+            shared.update(self.postings.get(t, ()))
+        for other in self.by_ean.get(item.ean, ()) if item.ean else ():
+            shared[other] += len(item.tokens) + 1
+        return [self.items[i] for i, _n in shared.most_common()
+                if self.items[i].shop != item.shop][:limit]
+
+
+def best_matches(items, index, threshold=THRESHOLD):
+    """{item id: {shop: (score, other id)}} with each item's best counterpart per other shop."""
+    best = defaultdict(dict)
+    for item in items:
+        for other in index.candidates(item):
+            s = score(item, other)
+            if s >= threshold and s > best[item.id].get(other.shop, (0.0, None))[0]:
+                best[item.id][other.shop] = (s, other.id)
+    return best
+
+
+def group_items(items, best):
+    """Merge mutual best pairs (highest score first) into groups without two items of one shop."""
+    pairs = set()
+    for a, per_shop in best.items():
+        for s, b in per_shop.values():
+            if best.get(b, {}).get(items[a].shop, (0.0, None))[1] == a:
+                pairs.add((s, min(a, b), max(a, b)))
+
+    parent = list(range(len(items)))
+    shops = [{item.shop} for item in items]
+    scores = [1.0] * len(items)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for s, a, b in sorted(pairs, reverse=True):
+        ra, rb = find(a), find(b)
+        if ra == rb or shops[ra] & shops[rb]:
+            continue
+        parent[rb] = ra
+        shops[ra] |= shops[rb]
+        scores[ra] = min(scores[ra], scores[rb], s)
+
+    groups = defaultdict(list)
+    for item in items:
+        groups[find(item.id)].append(item)
+    return [(members, scores[root]) for root, members in groups.items() if len(members) > 1]
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS product_groups (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    shop TEXT NOT NULL,
+    key TEXT NOT NULL,
+    group_id INTEGER NOT NULL REFERENCES product_groups (id),
+    opis TEXT,
+    ean TEXT,
+    score REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (shop, key)
+);
+CREATE INDEX IF NOT EXISTS members_group ON members (group_id);
+"""
+
+
+class GroupTable:
+    """Persistent cross-shop groups; IDs are reused when members stay together."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.executescript(SCHEMA)
+
+    def update(self, groups, shops):
+        """Store this run's ``groups`` for ``shops``; returns [(group id, members, score)]."""
+        now = time.time()
+        stored = []
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            previous = {(shop, key): gid for shop, key, gid in self.db.execute("SELECT shop, key, group_id FROM members")}
+            self.db.executemany("DELETE FROM members WHERE shop = ?", [(s,) for s in shops])
+            taken = set()
+            for members, s in sorted(groups, key=lambda g: -len(g[0])):
+                votes = Counter(previous[(m.shop, m.key)] for m in members if (m.shop, m.key) in previous)
+                gid = next((g for g, _n in votes.most_common() if g not in taken), None)
+                if gid is None:
+                    gid = self.db.execute("INSERT INTO product_groups (created, updated) VALUES (?, ?)",
+                                          (now, now)).lastrowid
+                else:
+                    self.db.execute("UPDATE product_groups SET updated = ? WHERE id = ?", (now, gid))
+                taken.add(gid)
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO members (shop, key, group_id, opis, ean, score, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(m.shop, m.key, gid, m.record.get('Opis'), m.ean, s, now) for m in members])
+                stored.append((gid, members, s))
+            self.db.execute("DELETE FROM product_groups WHERE id NOT IN (SELECT group_id FROM members)")
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return sorted(stored, key=lambda g: g[0])
+
+
+def latest_outputs(root):
+    """{shop: path} of each shop's newest ``*_Podatki_*.json`` under ``root``/Ceniki_Scraping."""
+    latest = {}
+    for path in glob.glob(os.path.join(root, "Ceniki_Scraping", "*", "*", "*_Podatki_*.json")):
+        shop = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        folder = os.path.basename(os.path.dirname(path))
+        try:
+            day = datetime.strptime(folder, "%Y-%m-%d")
+        except ValueError:
+            continue
+        if shop not in latest or day > latest[shop][0]:
+            latest[shop] = (day, path)
+    return {shop: path for shop, (_day, path) in sorted(latest.items())}
+
+
+def load_items(outputs):
+    items = []
+    for shop, path in outputs.items():
+        with open(path, 'r', encoding='utf-8') as f:
+            for record in json.load(f):
+                if record.get('Opis'):
+                    items.append(Item(len(items), shop, record))
+    return items
+
+
+def match(root, threshold=THRESHOLD, log=print):
+    outputs = latest_outputs(root)
+    items = load_items(outputs)
+    log(f"Izdelkov: {len(items)} iz {len(outputs)} trgovin.")
+    index = MatchIndex(items)
+    groups = group_items(items, best_matches(items, index, threshold))
+
+    out_dir = os.path.join(root, "Ceniki_Matching")
+    os.makedirs(out_dir, exist_ok=True)
+    stored = GroupTable(os.path.join(out_dir, "Ceniki_Skupine.sqlite")).update(groups, list(outputs))
+    rows = [{"Skupina ID": gid, "Trgovina": m.shop, "Ujemanje": round(s, 3), "Opis": m.record.get('Opis'),
+             "Oznaka / naziv": m.record.get('Oznaka / naziv', ''), "EAN": m.record.get('EAN', ''),
+             "Cena / EM (z DDV)": m.record.get('Cena / EM (z DDV)', ''), "EM": m.record.get('EM', ''),
+             "URL": m.record.get('URL', '')}
+            for gid, members, s in stored for m in sorted(members, key=lambda m: m.shop)]
+    path = os.path.join(out_dir, f"Ceniki_Skupine_{datetime.now().strftime('%d_%m_%Y')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=4)
+    log(f"Skupin: {len(stored)} ({len(rows)} izdelkov). Shranjeno: {path}")
+    return stored
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Povezovanje istih izdelkov med trgovinami.")
+    parser.add_argument("--root", default=os.environ.get("OUTPUT_DIR") or ".",
+                        help="mapa z Ceniki_Scraping (privzeto OUTPUT_DIR)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="najmanjša podobnost para")
+    args = parser.parse_args(argv)
+    match(args.root, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Command-line flags shared by all shop scripts.
+
+Every flag has an environment-variable twin so CI (monthly.yml) can set it
+without changing the command line. Unknown arguments are ignored, so the same
+parser works for every entry point.
+"""
+
+import argparse
+import os
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("", "0", "false", "no", "off")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--export", default=os.environ.get("EXPORT_FORMATS", ""),
+                        help="formati izvoza, ločeni z vejico (json,jsonl,xlsx,csv,parquet)")
+    parser.add_argument("--no-excel", dest="excel", action="store_false",
+                        default=env_flag("EXPORT_EXCEL", True),
+                        help="ne piši .xlsx (enako kot EXPORT_EXCEL=0)")
+    parser.add_argument("--log-items", action=argparse.BooleanOptionalAction,
+                        default=env_flag("LOG_ITEMS") if "LOG_ITEMS" in os.environ else None,
+                        help="vrstica v logu za vsak izdelek (privzeto izklopljeno v CI)")
+    parser.add_argument("--profile", action="store_true", default=env_flag("PROFILE"),
+                        help="cProfile po fazah in razčlenitev časa v OUTPUT_DIR/Ceniki_Profiling")
+    parser.add_argument("--trace", action="store_true", default=env_flag("TRACE"),
+                        help="časovnica vseh zahtev (DNS, povezava, TLS, TTFB, prenos, razčlenjevanje, premori) "
+                             "v formatu Chrome trace v OUTPUT_DIR/Ceniki_Profiling")
+    parser.add_argument("--sample", type=int, default=int(os.environ.get("SAMPLE_SIZE") or 0),
+                        help="namesto celotnega zajema oceni indeks cen iz vzorca približno N izdelkov "
+                             "(OUTPUT_DIR/Ceniki_Index)")
+    parser.add_argument("--refresh-prices", action="store_true", default=env_flag("REFRESH_PRICES"),
+                        help="brez iskanja novih izdelkov osveži le cene izdelkov iz zadnjega zajema "
+                             "(OUTPUT_DIR/Ceniki_Prices)")
+    parser.add_argument("--budget-min", type=float, default=float(os.environ.get("SCRAPE_BUDGET_MIN") or 0) or None,
+                        help="časovni proračun v minutah; zajem se prilagodi in shrani pred iztekom")
+    parser.add_argument("--priority", action=argparse.BooleanOptionalAction, default=env_flag("PRIORITY_REFRESH", True),
+                        help="izdelke z večjo verjetnostjo spremembe cene zajemi najprej (PRIORITY_REFRESH)")
+    parser.add_argument("--fetch-workers", type=int, default=int(os.environ.get("FETCH_WORKERS") or 1),
+                        help="število niti za prenos strani izdelkov (vsaka drži premor med zahtevami)")
+    parser.add_argument("--parse-workers", type=int,
+                        default=int(os.environ.get("PARSE_WORKERS") or 0),
+                        help="število procesov za razčlenjevanje HTML; 0 = v glavnem procesu (privzeto)")
+    parser.add_argument("--page-cache", action=argparse.BooleanOptionalAction, default=env_flag("PAGE_CACHE", True),
+                        help="nespremenjenih strani izdelkov ne razčlenjuj znova, uporabi prejšnji zapis (PAGE_CACHE)")
+    parser.add_argument("--listing-cache", action=argparse.BooleanOptionalAction,
+                        default=env_flag("LISTING_CACHE", True),
+                        help="če se prva stran seznama ni spremenila, uporabi povezave prejšnjega zajema (LISTING_CACHE)")
+    parser.add_argument("--archive", action="store_true", default=env_flag("ARCHIVE_RAW"),
+                        help="vse odgovore shrani stisnjene v OUTPUT_DIR/Ceniki_Archive (WARC)")
+    parser.add_argument("--hedge", action="store_true", default=env_flag("HEDGE_REQUESTS"),
+                        help="počasni zahtevi (nad p95 gostitelja) pošlji en dvojnik, velja prvi odgovor")
+    return parser
+
+
+def parse_args(argv=None):
+    args, _unknown = build_parser().parse_known_args(argv)
+    return args
@@ -0,0 +1,166 @@
+"""Skip parsing of detail pages that did not change since the last run.
+
+For every detail URL the cache keeps a hash of the normalised page together
+with the record the shop's ``extract`` made from it. When a fetched page hashes
+to the stored value, the stored record is reused (with the run's ``fresh``
+fields, e.g. ``Veljavnost od``) and the parser is not run at all.
+
+Normalisation drops what changes on every request without changing the
+product: ``<script>``/``<style>`` blocks and comments (no shop reads prices
+from them), hidden form inputs and CSRF meta tags, session IDs and cache-buster
+query parameters, nonces, ISO timestamps and whitespace differences.
+
+Records are only reused by the same version of the extractor and for the
+same extra arguments: the hash of its bytecode (with nested comprehensions
+and lambdas, and the module-level functions it calls, such as the shop's
+price conversion) is stored with each entry together with a hash of the
+arguments, so changing a shop's parsing code invalidates that shop's cache
+and a page listed under another ``Skupina`` is parsed again. Arguments equal
+to one of the ``fresh`` values (the run date) are left out of the key, since
+the reused record takes those fields from ``fresh``.
+
+The store is ``<SHOP>_PageCache.sqlite`` next to the shop's daily folders.
+Lookups are served from memory and may come from any thread; ``put`` and
+``close`` belong to the thread that created the cache.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import re
+import sqlite3
+import time
+import types
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    parser TEXT NOT NULL,
+    record TEXT NOT NULL,
+    at REAL NOT NULL
+);
+"""
+
+_VOLATILE = [
+    (re.compile(rb'<script\b.*?</script\s*>', re.I | re.S), b''),
+    (re.compile(rb'<style\b.*?</style\s*>', re.I | re.S), b''),
+    (re.compile(rb'<!--.*?-->', re.S), b''),
+    (re.compile(rb'<input\b[^>]*\btype\s*=\s*["\']?hidden\b[^>]*>', re.I), b''),
+    (re.compile(rb'<meta\b[^>]*\bname\s*=\s*["\']?csrf[^>]*>', re.I), b''),
+    (re.compile(rb'\bnonce\s*=\s*["\'][^"\']*["\']', re.I), b''),
+    (re.compile(rb'(\b(?:jsessionid|phpsessid|sessionid|sid|csrf[\w-]*|_?token|form_key)\s*[=:]\s*)["\']?[\w%.:+/-]+',
+                re.I), rb'\1'),
+    (re.compile(rb'([?&](?:v|ver|version|t|ts|_)=)[\w.-]+', re.I), rb'\1'),
+    (re.compile(rb'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?'), b''),
+    (re.compile(rb'\s+'), b' '),
+]
+
+
+def normalize(content):
+    for pattern, replacement in _VOLATILE:
+        content = pattern.sub(replacement, content)
+    return content
+
+
+def content_hash(page):
+    return hashlib.sha1(normalize(page.content)).hexdigest()
+
+
+def _const_repr(const):
+    # repr frozenseta je odvisen od naključnega zgoščevanja nizov, zato ga uredimo.
+    if isinstance(const, frozenset):
+        return "frozenset(" + repr(sorted(map(_const_repr, const))) + ")"
+    if isinstance(const, tuple):
+        return "(" + ", ".join(map(_const_repr, const)) + ")"
+    return repr(const)
+
+
+def _hash_code(code, h):
+    """Bytecode, constants and names of ``code`` and its nested code objects, without memory addresses."""
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf-8'))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(const, h)
+        else:
+            h.update(_const_repr(const).encode('utf-8'))
+
+
+def _names(code):
+    yield from code.co_names
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from _names(const)
+
+
+def _hash_function(fn, h, seen):
+    fn = inspect.unwrap(fn)
+    if fn in seen:
+        return
+    seen.add(fn)
+    _hash_code(fn.__code__, h)
+    for name in sorted(set(_names(fn.__code__))):
+        helper = fn.__globals__.get(name)
+        if callable(helper) and isinstance(inspect.unwrap(helper), types.FunctionType):
+            _hash_function(helper, h, seen)
+
+
+def parser_version(extract):
+    """Fingerprint of the extractor and the functions it calls; changes whenever one of them is edited."""
+    h = hashlib.sha1()
+    _hash_function(extract, h, set())
+    return h.hexdigest()[:12]
+
+
+def cache_path(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/<SHOP>_Podatki_<d>.json -> <root>/.../<SHOP>/<SHOP>_PageCache.sqlite"""
+    shop_dir = os.path.dirname(os.path.dirname(json_path))
+    return os.path.join(shop_dir, f"{os.path.basename(shop_dir)}_PageCache.sqlite")
+
+
+class PageCache:
+    def __init__(self, path, fresh=None):
+        self.path = path
+        self.fresh = dict(fresh or {})
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.entries = {url: (digest, parser, record)
+                        for url, digest, parser, record in self.db.execute("SELECT url, digest, parser, record FROM pages")}
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    digest = staticmethod(content_hash)
+
+    def _version(self, extract, args=()):
+        if extract not in self._versions:
+            self._versions[extract] = parser_version(extract)
+        args = [a for a in args if a not in self.fresh.values()]
+        if not args:
+            return self._versions[extract]
+        key = hashlib.sha1(json.dumps(args, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()[:12]
+        return f"{self._versions[extract]}:{key}"
+
+    def get(self, url, digest, extract, args=()):
+        """The stored record for an unchanged page (with ``fresh`` applied), else None."""
+        entry = self.entries.get(url)
+        if entry and entry[0] == digest and entry[1] == self._version(extract, args):
+            self.hits += 1
+            return dict(json.loads(entry[2]), **self.fresh)
+        self.misses += 1
+        return None
+
+    def put(self, url, digest, extract, record, args=()):
+        text = json.dumps(record, ensure_ascii=False)
+        parser = self._version(extract, args)
+        self.entries[url] = (digest, parser, text)
+        self.db.execute("INSERT OR REPLACE INTO pages (url, digest, parser, record, at) VALUES (?, ?, ?, ?, ?)",
+                        (url, digest, parser, text, time.time()))
+
+    def close(self, log=None):
+        if log and (self.hits or self.misses):
+            log(f"Nespremenjenih strani: {self.hits} od {self.hits + self.misses} (razčlenjevanje preskočeno).")
+        self.db.close()
@@ -0,0 +1,89 @@
+"""Largest listing page size a shop honours, negotiated while crawling.
+
+Each shop declares the query parameter and the sizes to try, largest first
+(``PageSize("limit", (100, 50))``); listing URLs then go through ``url()``.
+The first page of every category tells whether the current size works:
+
+* a page with at least ``size`` products: the shop honours it (confirmed),
+* fewer products while there is a next page: the shop ignored or capped the
+  parameter, so the next size is tried,
+* fewer products and no next page (an empty category included): inconclusive,
+  the size stays unconfirmed and the next category's first page decides.
+
+Rejecting a size means the category has to start again (pages 2+ would not
+line up otherwise), so ``first_page`` and ``complete`` return False and the
+shop re-lists the category. When every size has been rejected, ``url()``
+leaves URLs unchanged and the shop's default paging is used, as before.
+
+``complete`` compares what was found with the total the shop reports on the
+listing ("od 400"), if the shop shows one. Shops call it only after a walk
+that reached the last page, and a shortfall under a confirmed size is only
+logged: the size was seen to work, so the listing itself is short.
+"""
+
+import re
+
+from ceniki import log
+
+_TOTAL_RES = [re.compile(r'\bod\s+(?:skupaj\s+|skupno\s+)?(\d[\d.]*)', re.I),
+              re.compile(r'(\d[\d.]*)\s+(?:izdelk|artikl|rezultat)', re.I)]
+
+
+def reported_total(text):
+    """Total item count from a listing summary such as 'Prikazujem 1 do 20 od 400 (20 strani)'."""
+    for pattern in _TOTAL_RES:
+        m = pattern.search(text or '')
+        if m:
+            return int(m.group(1).replace('.', ''))
+    return None
+
+
+class PageSize:
+    def __init__(self, param, sizes, log=None):
+        self.param = param
+        self.candidates = list(sizes)
+        self.confirmed = False
+        self.log = log or (lambda message: None)
+
+    @property
+    def size(self):
+        return self.candidates[0] if self.candidates else None
+
+    def url(self, url):
+        """``url`` with the page-size parameter (before any ``#fragment``)."""
+        if self.size is None:
+            return url
+        base, hash_, fragment = url.partition('#')
+        return f"{base}{'&' if '?' in base else '?'}{self.param}={self.size}{hash_}{fragment}"
+
+    def reject(self, reason):
+        size = self.candidates.pop(0)
+        self.confirmed = False
+        following = f"poskušam {self.param}={self.size}" if self.size else "uporabljam privzeto velikost strani"
+        self.log(f"  {self.param}={size} ne deluje ({reason}); {following}.")
+        log.event("page_size", param=self.param, size=size, ok=False, reason=reason)
+
+    def first_page(self, count, has_next):
+        """Judge the size on a category's first page; False if the category must be listed again."""
+        if self.size is None or self.confirmed:
+            return True
+        if count >= self.size:
+            self.confirmed = True
+            self.log(f"  Trgovina upošteva {self.param}={self.size}.")
+            log.event("page_size", param=self.param, size=self.size, ok=True)
+            return True
+        if has_next:
+            self.reject(f"le {count} izdelkov na strani")
+            return False
+        return True
+
+    def complete(self, found, total):
+        """Check ``found`` against the shop's reported ``total``; False if the category must be listed again."""
+        if total is None or found >= total:
+            return True
+        log.event("listing_incomplete", found=found, total=total, size=self.size)
+        if self.size is not None and not self.confirmed:
+            self.reject(f"najdenih {found} od {total}")
+            return False
+        self.log(f"  Najdenih le {found} od {total} izdelkov, ki jih navaja trgovina.")
+        return True
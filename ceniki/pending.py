@@ -0,0 +1,94 @@
+"""Pending work left over from an aborted run, picked up by the next run.
+
+The store is ``<SHOP>_Pending.json`` next to the shop's daily folders, so a
+run on the next day finds what the previous one left. It names the output
+(``*_Podatki_*.json``) the items belong to. A run on the same day resumes
+just those items into the same output; a run on a later day does them first
+and then the rest of the catalogue, since its output has to be complete on
+its own. An output that was never finished stays listed under ``partial``,
+so ``finished`` keeps it out of sampling and snapshots.
+"""
+
+import json
+import os
+from datetime import datetime
+
+
+def pending_path(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/... -> <root>/Ceniki_Scraping/<SHOP>/<SHOP>_Pending.json"""
+    shop_dir = os.path.dirname(os.path.dirname(json_path))
+    return os.path.join(shop_dir, f"{os.path.basename(shop_dir)}_Pending.json")
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _output(json_path):
+    return os.path.join(os.path.basename(os.path.dirname(json_path)), os.path.basename(json_path))
+
+
+def load_pending(path):
+    """Return the list of pending work items (empty if there is nothing to resume)."""
+    return [tuple(item) if isinstance(item, list) else item for item in _load(path).get('items', [])]
+
+
+def resume_work(path, json_path, crawl):
+    """``(work, resumed)``: the work of this run and how many items of it were left pending.
+
+    ``crawl()`` gives the full list of work items; it is only called when
+    there is nothing to resume or the pending items belong to another day.
+    """
+    work = load_pending(path)
+    if not work:
+        return crawl(), 0
+    if _load(path).get('output') == _output(json_path):
+        return work, len(work)
+    left = set(work)
+    return work + [item for item in crawl() if item not in left], len(work)
+
+
+def saved_keys(json_path, key='URL'):
+    """Keys of the records already in today's JSON store (skipped when resuming)."""
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return {record.get(key) for record in json.load(f)}
+    except (OSError, ValueError):
+        return set()
+
+
+def _partial(state, output):
+    partial = list(state.get('partial', []))
+    if state.get('items') and state.get('output') not in (None, output) and state['output'] not in partial:
+        partial.append(state['output'])
+    return partial
+
+
+def save_pending(path, items, reason="", json_path=None):
+    output = _output(json_path) if json_path else None
+    state = {"saved": datetime.now().isoformat(), "reason": reason, "output": output, "items": list(items),
+             "partial": _partial(_load(path), output)}
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def clear_pending(path, json_path=None):
+    partial = _partial(_load(path), _output(json_path) if json_path else None)
+    if partial:
+        save_pending(path, [], reason="", json_path=json_path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def finished(json_path):
+    """True unless ``json_path`` is an output with work still pending or one that was never finished."""
+    state = _load(pending_path(json_path))
+    output = _output(json_path)
+    return not (state.get('items') and state.get('output') == output) and output not in state.get('partial', [])
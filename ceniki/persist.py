@@ -0,0 +1,96 @@
+"""Saving on a background thread, so the crawl never waits for disk.
+
+The crawl loop hands finished records to ``BackgroundSaver.put``; a writer
+thread collects them and calls the shop's ``save(batch)`` (e.g. ``save_data``
+with the run's paths) once ``batch_size`` records are waiting or ``interval``
+seconds after the first one arrived. The queue is bounded: if saving falls
+that far behind, ``put`` blocks instead of letting records pile up.
+
+``close()`` (also on KeyboardInterrupt and when the run stops at its deadline)
+saves everything still queued before returning. A failed save is logged and
+its records are tried again with the next batch.
+
+While ``ceniki.profiling`` is on there is no writer thread: batches are
+saved by the thread that calls ``put``, so the ``persist`` phase shows up in
+the profile (the profiler samples only the main thread).
+"""
+
+import queue
+import threading
+import time
+
+from ceniki import profiling, trace
+
+_STOP = object()
+
+
+class BackgroundSaver:
+    def __init__(self, save, batch_size=25, interval=30.0, maxsize=500, log=None):
+        self.save = save
+        self.batch_size = batch_size
+        self.interval = interval
+        self.log = log or (lambda message: None)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.pending = []
+        self.saved = 0
+        self.thread = None
+        self._first = None
+        if not profiling.enabled():
+            self.thread = threading.Thread(target=self._run, name="ceniki-saver", daemon=True)
+            self.thread.start()
+
+    def put(self, record):
+        if self.thread is not None:
+            self.queue.put(record)
+            return
+        self.pending.append(record)
+        self._first = self._first or time.monotonic()
+        if len(self.pending) >= self.batch_size or time.monotonic() - self._first >= self.interval:
+            self._flush()
+            self._first = time.monotonic() if self.pending else None
+
+    def _flush(self):
+        if not self.pending:
+            return
+        batch = self.pending
+        try:
+            with trace.span("save", "io", records=len(batch)):
+                self.save(batch)
+        except Exception as e:
+            self.log(f"Napaka pri shranjevanju {len(batch)} zapisov: {e}; poskusim znova z naslednjo skupino.")
+            return
+        self.saved += len(batch)
+        self.pending = []
+
+    def _run(self):
+        first = None
+        while True:
+            timeout = None if first is None else max(0.0, first + self.interval - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush()
+                return
+            if item is not None:
+                self.pending.append(item)
+                first = first or time.monotonic()
+            if len(self.pending) >= self.batch_size or (first and time.monotonic() - first >= self.interval):
+                self._flush()
+                first = time.monotonic() if self.pending else None
+
+    def close(self):
+        """Save everything still queued and stop the writer thread."""
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+        self._flush()
+        if self.pending:
+            self.log(f"Neshranjenih ostaja {len(self.pending)} zapisov.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,254 @@
+"""Pipelined detail crawl: fetch threads -> parser processes -> one writer.
+
+``run`` takes the ``(group, task)`` pairs from a ``Scheduler`` and moves them
+through three stages connected by bounded queues:
+
+* ``fetch_workers`` threads download the pages (I/O-bound, each thread keeps
+  the shop's polite ``delay`` between its requests),
+* a ``ProcessPoolExecutor`` with ``parse_workers`` processes runs the shop's
+  ``extract(page, *args)`` (CPU-bound BeautifulSoup work),
+* the calling thread gets the results and calls ``write`` for each product,
+  so saving and the shop's counters stay single-threaded.
+
+Both queues are bounded, so when parsing falls behind the fetch threads block
+instead of piling up pages in memory. With ``parse_workers=0`` (the default)
+extraction runs in the writer thread (no extra processes). Parser processes
+are started with ``spawn``: by then the log writer, the saver and the fetch
+threads are running, and a forked child could inherit one of their locks
+held.
+
+While ``ceniki.profiling`` is on, ``run`` does everything on the calling
+thread instead (the profiler samples only that thread), so the fetch, parse,
+extract and persist phases stay in the profile.
+
+With a ``PageCache`` the fetch threads hash each page first; unchanged pages
+skip the parser and reuse the stored record.
+
+While ``ceniki.trace`` is on, the parser processes send their spans back
+with each result, and time a stage spends blocked on a full queue or in the
+polite pause is traced as ``queue`` and ``sleep``.
+
+``extract`` and its arguments must be picklable: a module-level function of
+the shop script and plain strings/dicts.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ceniki import log, profiling, trace
+from ceniki.fetch import STREAM_DETAILS
+
+_DONE = object()
+
+
+def _init_parser():
+    # Delavec začne s svežim stanjem (spawn); varovalka, če bi bil vseeno ustvarjen s fork.
+    profiling.detach()
+    trace.detach()
+    log.detach()
+
+
+def _missing(data, fields):
+    return not data or not all(data.get(name) for name in fields)
+
+
+class _Deferred:
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+
+    def result(self):
+        return self.fn(*self.args)
+
+
+class _Ready:
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+class _Traced:
+    """Future of ``trace.collect``: the worker's spans join the trace when the result is read."""
+
+    def __init__(self, future):
+        self.future = future
+
+    def result(self):
+        data, events = self.future.result()
+        trace.merge(events)
+        return data
+
+
+class _Inline:
+    """Stand-in for the pool when ``parse_workers`` is 0: extract in the writer."""
+
+    def submit(self, fn, *args):
+        return _Deferred(fn, args)
+
+    def shutdown(self, cancel_futures=False):
+        pass
+
+
+def _finish(fetcher, extract, url, args, data, fields, stream, complete, cache, digest, cached):
+    """Full download when a streamed page missed fields, then store a freshly parsed record in the cache."""
+    if stream and not complete and _missing(data, fields):
+        log.info(f"  Manjkajoča polja v delnem prenosu, prenašam celoten {url}")
+        page = fetcher.get(url)
+        data = extract(page, *args) if page else None
+        digest = cache.digest(page) if cache and page else None
+        cached = False
+    if digest and data and not cached:
+        cache.put(url, digest, extract, data, args)
+    return data
+
+
+def _serial(tasks, prepare, fetcher, extract, write, fields, delay, requeue, cache):
+    """``run`` on the calling thread only, for profiling."""
+    stream = bool(fields) and STREAM_DETAILS
+    for group, task in tasks:
+        try:
+            url, args = prepare(group, task)
+            log.item(f"    - Detajli: {url}", url=url)
+            t0 = time.perf_counter()
+            page, complete = fetcher.get_streaming(url, fields) if stream else (None, True)
+            if page is None:
+                page, complete = fetcher.get(url), True
+            elapsed = round((time.perf_counter() - t0) * 1000)
+            digest = cache.digest(page) if cache and page else None
+            data = cache.get(url, digest, extract, args) if digest else None
+            cached = data is not None
+            if not cached and page:
+                data = extract(page, *args)
+            data = _finish(fetcher, extract, url, args, data, fields, stream, complete, cache, digest, cached)
+            write(group, task, data, elapsed)
+        except BaseException:
+            if requeue:
+                requeue(group, task)
+            raise
+        if delay:
+            trace.sleep(delay())
+
+
+def run(tasks, prepare, fetcher, extract, write, fields=None, fetch_workers=1, parse_workers=0,
+        delay=None, requeue=None, max_pending=None, cache=None):
+    """Crawl ``tasks`` and call ``write(group, task, data, elapsed_ms)`` for each.
+
+    ``prepare(group, task)`` returns ``(url, args)`` with the extra arguments
+    for ``extract``; ``data`` is None when the page could not be fetched.
+    Exceptions from a stage (e.g. ``CircuitOpenError``) stop the pipeline and
+    are re-raised here; tasks that were taken but not written are handed to
+    ``requeue(group, task)``.
+    """
+    if profiling.enabled():
+        return _serial(tasks, prepare, fetcher, extract, write, fields, delay, requeue, cache)
+    max_pending = max_pending or max(4, 2 * max(parse_workers, fetch_workers))
+    todo = queue.Queue(maxsize=fetch_workers * 2)
+    done = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    inflight = {}
+    lock = threading.Lock()
+    pool = (ProcessPoolExecutor(parse_workers, mp_context=multiprocessing.get_context("spawn"),
+                                initializer=_init_parser) if parse_workers > 0 else _Inline())
+    stream = bool(fields) and STREAM_DETAILS
+
+    def put(q, item):
+        try:
+            q.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        with trace.span("queue", "wait"):
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+        return False
+
+    def produce():
+        try:
+            for n, (group, task) in enumerate(tasks):
+                with lock:
+                    inflight[n] = (group, task)
+                if not put(todo, (n, group, task)):
+                    return
+        except BaseException as e:
+            put(done, ("error", None, e))
+        finally:
+            for _ in range(fetch_workers):
+                put(todo, _DONE)
+
+    def fetch():
+        try:
+            while not stop.is_set():
+                try:
+                    item = todo.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                n, group, task = item
+                url, args = prepare(group, task)
+                log.item(f"    - Detajli: {url}", url=url)
+                t0 = time.perf_counter()
+                if stream:
+                    page, complete = fetcher.get_streaming(url, fields)
+                    if page is None:
+                        page, complete = fetcher.get(url), True
+                else:
+                    page, complete = fetcher.get(url), True
+                elapsed = round((time.perf_counter() - t0) * 1000)
+                digest = cache.digest(page) if cache and page else None
+                cached = cache.get(url, digest, extract, args) if digest else None
+                if cached is not None:
+                    future = _Ready(cached)
+                elif page and trace.enabled():
+                    future = _Traced(pool.submit(trace.collect, extract, page, *args))
+                else:
+                    future = pool.submit(extract, page, *args) if page else None
+                if not put(done, ("page", n, (url, args, future, complete, elapsed, digest, cached is not None))):
+                    return
+                if delay:
+                    trace.sleep(delay())
+        except BaseException as e:
+            put(done, ("error", None, e))
+        finally:
+            put(done, ("fetcher", None, None))
+
+    threads = [threading.Thread(target=produce, name="ceniki-producer", daemon=True)]
+    threads += [threading.Thread(target=fetch, name=f"ceniki-fetch-{i}", daemon=True) for i in range(fetch_workers)]
+    for t in threads:
+        t.start()
+
+    running = fetch_workers
+    try:
+        while running:
+            kind, n, payload = done.get()
+            if kind == "fetcher":
+                running -= 1
+                continue
+            if kind == "error":
+                raise payload
+            url, args, future, complete, elapsed, digest, cached = payload
+            data = future.result() if future else None
+            data = _finish(fetcher, extract, url, args, data, fields, stream, complete, cache, digest, cached)
+            group, task = inflight[n]
+            write(group, task, data, elapsed)
+            with lock:
+                del inflight[n]
+    finally:
+        stop.set()
+        pool.shutdown(cancel_futures=True)
+        for t in threads:
+            t.join(timeout=5)
+        if requeue:
+            with lock:
+                left = sorted(inflight.items(), reverse=True)
+            for _n, (group, task) in left:
+                requeue(group, task)
@@ -0,0 +1,86 @@
+"""Change-likelihood scores for known products, from earlier runs' JSON outputs.
+
+Every ``<SHOP>_Podatki_<date>.json`` in the shop's earlier daily folders is
+one observation of each product in it. A product scores higher when
+
+* its price changed often between observations (volatility),
+* it was last verified long ago (staleness), and
+* it was on promotion the last time (``Akcijska cena``; promotions end).
+
+Scores are in [0, 1]; products never seen before are not in the result and
+are treated as most urgent by ``Scheduler``.
+"""
+
+import glob
+import json
+import os
+from datetime import datetime
+
+WEIGHTS = {"volatility": 0.5, "staleness": 0.3, "promotion": 0.2}
+# Po tolikšnem številu dni brez preverjanja je izdelek "povsem zastarel".
+STALE_DAYS = 60
+
+PRICE = "Cena / EM (z DDV)"
+PROMO = "Akcijska cena / EM (z DDV)"
+
+
+def parse_price(value):
+    """'1.234,56' -> 1234.56; None for empty or unparsable values."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace('.', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def history_files(json_path):
+    """(date, path) of the JSON outputs in the shop's other daily folders, oldest first."""
+    date_dir = os.path.dirname(json_path)
+    shop_dir = os.path.dirname(date_dir)
+    found = []
+    for path in glob.glob(os.path.join(shop_dir, "*", "*_Podatki_*.json")):
+        folder = os.path.basename(os.path.dirname(path))
+        if os.path.abspath(os.path.dirname(path)) == os.path.abspath(date_dir):
+            continue
+        try:
+            found.append((datetime.strptime(folder, "%Y-%m-%d"), path))
+        except ValueError:
+            continue
+    return sorted(found)
+
+
+def load_history(json_path, key='URL'):
+    """{key: [(date, price, promo), ...]} over all earlier runs, oldest first."""
+    history = {}
+    for day, path in history_files(json_path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for record in records:
+            k = record.get(key)
+            if k:
+                history.setdefault(k, []).append((day, parse_price(record.get(PRICE)), parse_price(record.get(PROMO))))
+    return history
+
+
+def score(observations, now=None):
+    now = now or datetime.now()
+    prices = [p if promo is None else promo for _day, p, promo in observations]
+    changes = sum(1 for a, b in zip(prices, prices[1:]) if a != b)
+    # Beta(1, 1) prior: dve opazovanji brez spremembe še nista dokaz stabilnosti.
+    volatility = (changes + 1) / (len(prices) - 1 + 2)
+    staleness = min(1.0, (now - observations[-1][0]).days / STALE_DAYS)
+    promotion = 1.0 if observations[-1][2] is not None else 0.0
+    return (WEIGHTS["volatility"] * volatility + WEIGHTS["staleness"] * staleness
+            + WEIGHTS["promotion"] * promotion)
+
+
+def change_scores(json_path, key='URL'):
+    """Score of every product seen in earlier runs of the shop that writes ``json_path``."""
+    now = datetime.now()
+    return {k: score(obs, now) for k, obs in load_history(json_path, key).items()}
@@ -0,0 +1,190 @@
+"""Optional per-phase profiling (``--profile`` / ``PROFILE=1``).
+
+Code marks its crawl phases with ``phase(name)`` (discovery, fetch, parse,
+extract, persist); it works as a context manager and as a decorator and costs
+nothing while profiling is off. When ``start`` was called, every phase gets its
+own ``cProfile.Profile`` and a sampler thread records which phase (and which
+function) the main thread is in every ``interval`` seconds. ``stop`` writes one
+``.prof`` per phase plus a JSON wall-clock breakdown to
+``<OUTPUT_DIR>/Ceniki_Profiling/<SHOP>/<date>/``.
+
+Independently of profiling, every phase is also a span on the request
+timeline while ``ceniki.trace`` is on, on whichever thread or process ran it.
+
+Phases nest and are reported by their path, so a listing download shows up
+as ``discovery/fetch`` and a detail download as ``fetch``; the profile and the
+timings of a path are exclusive of the phases nested in it.
+"""
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ContextDecorator
+from datetime import datetime
+
+from ceniki import trace
+
+OUTSIDE = "(brez faze)"
+
+_active = None
+
+
+def profile_dir(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/... -> <root>/Ceniki_Profiling/<SHOP>/<date>"""
+    date_dir = os.path.dirname(json_path)
+    shop_dir = os.path.dirname(date_dir)
+    root = os.path.dirname(os.path.dirname(shop_dir))
+    return os.path.join(root, "Ceniki_Profiling", os.path.basename(shop_dir), os.path.basename(date_dir))
+
+
+class Profiler:
+    def __init__(self, shop, out_dir, interval=0.01):
+        self.shop = shop
+        self.out_dir = out_dir
+        self.interval = interval
+        self.main_ident = threading.get_ident()
+        self.profiles = {}
+        self.wall = defaultdict(float)
+        self.calls = Counter()
+        self.samples = Counter()
+        self.frames = defaultdict(Counter)
+        self._stack = []
+        self._since = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="ceniki-profiler", daemon=True)
+
+    def _profile(self, name):
+        if name not in self.profiles:
+            self.profiles[name] = cProfile.Profile()
+        return self.profiles[name]
+
+    def _switch(self, leaving, entering):
+        now = time.perf_counter()
+        if leaving is not None:
+            self._profile(leaving).disable()
+        self.wall[leaving or OUTSIDE] += now - self._since
+        self._since = now
+        if entering is not None:
+            self._profile(entering).enable()
+
+    def push(self, name):
+        parent = self._stack[-1] if self._stack else None
+        path = f"{parent}/{name}" if parent else name
+        self._switch(parent, path)
+        self._stack.append(path)
+        self.calls[path] += 1
+
+    def pop(self):
+        path = self._stack.pop()
+        self._switch(path, self._stack[-1] if self._stack else None)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            stack = self._stack[:]
+            name = stack[-1] if stack else OUTSIDE
+            self.samples[name] += 1
+            frame = sys._current_frames().get(self.main_ident)
+            if frame is not None:
+                code = frame.f_code
+                self.frames[name][f"{os.path.basename(code.co_filename)}:{code.co_name}"] += 1
+
+    def start(self):
+        self.started = datetime.now()
+        self._t0 = self._since = time.perf_counter()
+        self._sampler.start()
+
+    def stop(self):
+        """Stop sampling, write the dumps and return the path of the breakdown."""
+        while self._stack:
+            self.pop()
+        self._switch(None, None)
+        self._stop.set()
+        self._sampler.join()
+        duration = time.perf_counter() - self._t0
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = self.started.strftime('%H-%M-%S')
+        dumps = {}
+        for name, prof in self.profiles.items():
+            path = os.path.join(self.out_dir, f"{self.shop}_{name.replace('/', '-')}_{stamp}.prof")
+            prof.dump_stats(path)
+            dumps[name] = os.path.basename(path)
+
+        total = sum(self.samples.values()) or 1
+        phases = {}
+        for name, count in self.samples.most_common():
+            phases[name] = {
+                "samples": count,
+                "share": round(count / total, 4),
+                "sampled_sec": round(count * self.interval, 2),
+                "wall_sec": round(self.wall.get(name, 0.0), 3),
+                "calls": self.calls.get(name, 0),
+                "prof": dumps.get(name),
+                "top": self.frames[name].most_common(10),
+            }
+        summary = {"shop": self.shop, "started": self.started.isoformat(), "duration_sec": round(duration, 3),
+                   "interval_sec": self.interval, "samples": total, "phases": phases}
+        path = os.path.join(self.out_dir, f"{self.shop}_Profile_{stamp}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return path, summary
+
+
+class phase(ContextDecorator):
+    """Mark a crawl phase: profiled on the main thread once ``start`` was called, traced anywhere."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def _recreate_cm(self):
+        # Svež objekt za vsak klic okrašene funkcije (niti, rekurzija).
+        return phase(self.name)
+
+    def __enter__(self):
+        self._tracked = _active is not None and threading.get_ident() == _active.main_ident
+        if self._tracked:
+            _active.push(self.name)
+        self._span = trace.span(self.name, "phase").__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._span.__exit__(*exc)
+        if self._tracked and _active is not None:
+            _active.pop()
+        return False
+
+
+def enabled():
+    return _active is not None
+
+
+def start(shop, out_dir, interval=0.01):
+    global _active
+    if _active is not None:
+        stop()
+    _active = Profiler(shop, out_dir, interval)
+    _active.start()
+
+
+def detach():
+    """Forget a profiler inherited through fork (pool workers): its sampler does not run there."""
+    global _active
+    _active = None
+
+
+def stop(log=None):
+    """Finish profiling (if it was started) and log a one-line-per-phase summary."""
+    global _active
+    if _active is None:
+        return None
+    profiler, _active = _active, None
+    path, summary = profiler.stop()
+    if log:
+        log(f"Profil ({summary['duration_sec']:.0f} s): {path}")
+        for name, data in summary["phases"].items():
+            log(f"  {name:<18} {data['share'] * 100:5.1f} %  {data['sampled_sec']:8.1f} s  ({data['calls']} klicev)")
+    return path
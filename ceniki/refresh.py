@@ -0,0 +1,112 @@
+"""Price-only refresh of known products (``--refresh-prices`` / ``REFRESH_PRICES=1``).
+
+For a check between full runs: no discovery, no full detail scrape. The
+products come from the shop's latest ``*_Podatki_*.json`` (today's, if a run
+already wrote one), and for each ``Skupina`` the shop returns just their
+current price fields (``PRICE_FIELDS``):
+
+* shops that show the price on the listing (Merkur, OBI) read the group's
+  listing pages, a few requests per group instead of one per product,
+* the others fetch each detail page through ``fetch_detail`` with
+  streaming forced on, so the download stops once the shop's price elements
+  were seen, and run a small extractor that reads only those.
+
+The result is a list of ``URL``, ``Skupina`` and the price fields, with
+``Spremenjeno`` set where a price differs from the base file. It goes to
+``<OUTPUT_DIR>/Ceniki_Prices/<SHOP>/<date>/`` and never into
+``Ceniki_Scraping``, so it is not mistaken for a snapshot. If a host's
+circuit breaker opens, what was refreshed so far is still written, including
+the part of the group that was being refreshed when ``price_records`` yields
+its records one by one (``refetch`` does).
+
+A shop module takes part by defining ``price_records(skupina, records)``,
+which returns or yields the current price fields (with ``URL``) for the
+given stored records and leaves out products that can no longer be fetched.
+"""
+
+import json
+import os
+import random
+from datetime import datetime
+
+from ceniki import trace
+from ceniki.fetch import CircuitOpenError, fetch_detail
+from ceniki.priority import PRICE, PROMO, history_files
+
+PRICE_FIELDS = (PRICE, "Cena / EM (brez DDV)", PROMO, "Akcijska cena / EM (brez DDV)", "Dobava")
+
+
+def prices_dir(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/... -> <root>/Ceniki_Prices/<SHOP>/<date>"""
+    date_dir = os.path.dirname(json_path)
+    shop_dir = os.path.dirname(date_dir)
+    root = os.path.dirname(os.path.dirname(shop_dir))
+    return os.path.join(root, "Ceniki_Prices", os.path.basename(shop_dir), os.path.basename(date_dir))
+
+
+def latest_output(json_path):
+    """Path of the shop's newest output, today's included, or None."""
+    if os.path.exists(json_path):
+        return json_path
+    previous = history_files(json_path)
+    return previous[-1][1] if previous else None
+
+
+def refetch(fetcher, records, extract, fields, delay=(2.0, 5.0)):
+    """Yield ``extract(page, record)`` for each record's detail page, streamed until ``fields`` were seen."""
+    for n, record in enumerate(records):
+        if n:
+            trace.sleep(random.uniform(*delay))
+        data = fetch_detail(fetcher, record['URL'], lambda page: extract(page, record), fields, stream=True)
+        if data:
+            yield dict(data, URL=record['URL'])
+
+
+def run(shop, json_path, price_records, log=print):
+    """Refresh the prices of the latest output's products; returns the path of the result or None."""
+    base_path = latest_output(json_path)
+    if base_path is None:
+        log("Ni prejšnjega zajema s seznamom izdelkov; cen ne morem osvežiti.")
+        return None
+    groups = {}
+    with open(base_path, 'r', encoding='utf-8') as f:
+        for record in json.load(f):
+            if record.get('URL'):
+                groups.setdefault(record.get('Skupina') or '', []).append(record)
+    log(f"Osvežujem cene {sum(len(g) for g in groups.values())} izdelkov v {len(groups)} skupinah "
+        f"({os.path.basename(base_path)}).")
+
+    items, missing, changed, stopped = [], 0, 0, None
+    for skupina, records in groups.items():
+        current = {}
+        try:
+            for r in price_records(skupina, records) or ():
+                if r:
+                    current[r.get('URL')] = r
+        except CircuitOpenError as e:
+            stopped = str(e)
+        for old in records:
+            new = current.get(old['URL'])
+            if new is None:
+                # Po prekinitvi neobdelani izdelki niso manjkajoči.
+                missing += stopped is None
+                continue
+            prices = {name: new[name] for name in PRICE_FIELDS if name in new}
+            differs = any(old.get(name, '') != value for name, value in prices.items())
+            changed += differs
+            items.append(dict({"URL": old['URL'], "Skupina": skupina}, **prices, Spremenjeno=differs))
+        log(f"  {skupina}: {len(current)}/{len(records)}")
+        if stopped:
+            log(f"{stopped} Shranjujem do zdaj osvežene cene.")
+            break
+
+    out_dir = prices_dir(json_path)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{shop}_Cene_{datetime.now().strftime('%H-%M-%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"shop": shop, "date": datetime.now().isoformat(timespec='seconds'), "base": base_path,
+                   "refreshed": len(items), "changed": changed, "missing": missing, "stopped": stopped,
+                   "items": items}, f, ensure_ascii=False, indent=1)
+    log(f"Osveženih cen: {len(items)}, spremenjenih {changed}, manjka {missing}.")
+    log(f"Rezultat: {path}")
+    return path
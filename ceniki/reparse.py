@@ -0,0 +1,138 @@
+"""Re-extract an archived crawl offline: ``python -m ceniki.reparse KalcerV1 2026-10-19``.
+
+Runs the shop's current extraction code over the detail pages stored by
+``--archive`` (see ``ceniki.archive``) and rewrites that day's JSON/XLSX
+outputs, without a single request to the shop. The day's JSON store supplies
+everything a detail page does not contain (category, listing price, ``Zap``,
+``Veljavnost od``), so only records present in it are re-extracted; products
+whose page was not archived, or whose new extraction fails, keep their old
+record.
+
+Pages are spread over a process pool (all cores by default), started with
+``spawn`` like the pipeline's parsers, so no worker inherits the log writer
+thread; each worker writes its own ``*_Reparse_Log_<time>_<pid>.txt``.
+Workers map the archive files into memory and decompress only the frames
+they are handed.
+
+A shop module takes part by defining:
+
+``reparse_record(page, record)``
+    the new record for an archived ``Page``, given the stored ``record``,
+``reparse_save(records, json_path)``
+    write the records to the given day's JSON store and exports.
+"""
+
+import argparse
+import atexit
+import glob
+import importlib
+import json
+import mmap
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from ceniki import log, profiling
+from ceniki.archive import decompressor, iter_index, parse_record
+from ceniki.fetch import Page
+
+_shop = None
+_maps = {}
+
+
+def _init_worker(shop_module, log_path):
+    global _shop
+    # Delavec začne s svežim stanjem (spawn); varovalka, če bi bil vseeno ustvarjen s fork.
+    profiling.detach()
+    log.detach()
+    _shop = importlib.import_module(shop_module)
+    base, ext = os.path.splitext(log_path)
+    log.setup(_shop.SHOP_NAME, f"{base}_{os.getpid()}{ext}")
+    atexit.register(log.shutdown)
+
+
+def _frame(directory, entry):
+    path = os.path.join(directory, entry["file"])
+    if path not in _maps:
+        with open(path, 'rb') as f:
+            _maps[path] = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), decompressor(path))
+    mm, decompress = _maps[path]
+    return decompress(mm[entry["offset"]:entry["offset"] + entry["length"]])
+
+
+def _reparse(job):
+    directory, entry, record = job
+    _warc, _http, body = parse_record(_frame(directory, entry))
+    try:
+        new = _shop.reparse_record(Page(body, entry.get("encoding")), record)
+    except Exception:
+        new = None
+    if not new:
+        return record, False
+    return dict(new, Zap=record.get('Zap')), True
+
+
+def day_paths(root, shop_name, day):
+    """(JSON store, archive directory) of ``shop_name``'s crawl on ``day`` (YYYY-MM-DD)."""
+    stores = glob.glob(os.path.join(root, "Ceniki_Scraping", shop_name, day, f"{shop_name}_Podatki_*.json"))
+    return (stores[0] if stores else None), os.path.join(root, "Ceniki_Archive", shop_name, day)
+
+
+def jobs(directory, records):
+    """One job per stored record that has an archived page (the last, complete one preferred)."""
+    by_url = {r.get('URL'): r for r in records}
+    entries = {}
+    for entry in iter_index(directory):
+        if entry["url"] in by_url and entry.get("status", 200) < 400:
+            previous = entries.get(entry["url"])
+            if previous is None or previous.get("truncated") or not entry.get("truncated"):
+                entries[entry["url"]] = entry
+    # Urejeno po datoteki in odmiku: delavci berejo arhiv zaporedno.
+    ordered = sorted(entries.values(), key=lambda e: (e["file"], e["offset"]))
+    return [(directory, e, by_url[e["url"]]) for e in ordered]
+
+
+def reparse(shop_module, day, root=".", workers=None):
+    shop = importlib.import_module(shop_module)
+    json_path, directory = day_paths(root, shop.SHOP_NAME, day)
+    if not json_path or not os.path.isdir(directory):
+        log.info(f"Za {shop.SHOP_NAME} {day} ni shranjenih podatkov ali arhiva ({directory}).")
+        return 0
+    log_path = os.path.join(os.path.dirname(json_path),
+                            f"{shop.SHOP_NAME}_Reparse_Log_{datetime.now().strftime('%H-%M-%S')}.txt")
+    log.setup(shop.SHOP_NAME, log_path)
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        work = jobs(directory, records)
+        log.info(f"{shop.SHOP_NAME} {day}: {len(work)} od {len(records)} izdelkov ima arhivirano stran.")
+
+        t0 = time.perf_counter()
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(shop_module, log_path)) as pool:
+            results = list(pool.map(_reparse, work, chunksize=max(1, len(work) // (workers * 8))))
+        changed = [r for r, ok in results if ok]
+        log.info(f"Ponovno razčlenjenih {len(changed)} strani ({len(results) - len(changed)} neuspešnih) "
+                 f"v {time.perf_counter() - t0:.1f} s z {workers} procesi.")
+        shop.reparse_save(changed, json_path)
+        return len(changed)
+    finally:
+        log.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ponovni zajem podatkov iz arhiva surovih odgovorov.")
+    parser.add_argument("shop", help="modul trgovine, npr. KalcerV1")
+    parser.add_argument("date", nargs="?", default=datetime.now().strftime("%Y-%m-%d"), help="dan zajema (YYYY-MM-DD)")
+    parser.add_argument("--root", default=os.environ.get("OUTPUT_DIR") or ".",
+                        help="mapa s Ceniki_Scraping in Ceniki_Archive (privzeto OUTPUT_DIR)")
+    parser.add_argument("--workers", type=int, default=None, help="število procesov (privzeto vsa jedra)")
+    args, _unknown = parser.parse_known_args(argv)
+    reparse(args.shop, args.date, args.root, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Quick price index from a stratified random sample (``--sample N`` / ``SAMPLE_SIZE``).
+
+Instead of a full crawl, a shop run in sampling mode re-prices about ``N``
+products drawn from the last complete run (the newest earlier
+``*_Podatki_*.json`` that ``pending.finished`` accepts) and compares
+them with the prices stored there:
+
+* strata are the ``Skupina`` values; their sizes ``N_h`` are the product
+  counts of that run, i.e. what the shop's listings held at the time,
+* every stratum gets ``minimum`` draws (needed for a variance) and the rest
+  of ``N`` is allocated in proportion to ``N_h`` (largest remainders),
+* the draw is a simple random sample within each stratum, seeded by the day,
+  so a rerun on the same day asks for the same products.
+
+The index of a stratum is the Jevons index (geometric mean of price ratios,
+effective price = promotional price when there is one). The shop index
+combines strata with weights ``N_h / N``; the 95 % intervals use the normal
+approximation with the finite-population correction, and strata with a
+single priced product borrow the pooled within-stratum variance.
+
+The result goes to ``<OUTPUT_DIR>/Ceniki_Index/<SHOP>/<date>/`` and never
+into ``Ceniki_Scraping``, so it is not mistaken for a snapshot. If a host's
+circuit breaker opens, the index of the products priced so far is still
+written, with the reason under ``stopped``; ``sample_records`` may yield its
+records one by one (``refetch`` does) so that a stratum cut short counts too.
+
+A shop module takes part by defining ``sample_records(skupina, records)``,
+which returns the current records for the given stored ones (products that
+can no longer be fetched are left out). Shops that read prices from detail
+pages use ``refetch``; the others read the stratum's listings.
+"""
+
+import json
+import math
+import os
+import random
+from datetime import datetime
+from statistics import NormalDist
+
+from ceniki import trace
+from ceniki.fetch import CircuitOpenError
+from ceniki.pending import finished
+from ceniki.priority import PRICE, PROMO, history_files, parse_price
+
+Z95 = NormalDist().inv_cdf(0.975)
+
+
+def index_dir(json_path):
+    """<root>/Ceniki_Scraping/<SHOP>/<date>/... -> <root>/Ceniki_Index/<SHOP>/<date>"""
+    date_dir = os.path.dirname(json_path)
+    shop_dir = os.path.dirname(date_dir)
+    root = os.path.dirname(os.path.dirname(shop_dir))
+    return os.path.join(root, "Ceniki_Index", os.path.basename(shop_dir), os.path.basename(date_dir))
+
+
+def last_full_snapshot(json_path):
+    """(date, path) of the newest earlier run that finished, or None."""
+    for day, path in reversed(history_files(json_path)):
+        if finished(path):
+            return day, path
+    return None
+
+
+def effective_price(record):
+    promo = parse_price(record.get(PROMO))
+    return promo if promo else parse_price(record.get(PRICE))
+
+
+def allocate(sizes, n, minimum=2):
+    """{stratum: draws}: ``minimum`` each, the rest of ``n`` in proportion to ``sizes``, never above a size."""
+    plan = {k: min(size, minimum) for k, size in sizes.items()}
+    left = n - sum(plan.values())
+    while left > 0:
+        room = {k: sizes[k] - plan[k] for k in sizes if sizes[k] > plan[k]}
+        if not room:
+            break
+        total = sum(sizes[k] for k in room)
+        shares = {k: left * sizes[k] / total for k in room}
+        extra = {k: min(room[k], int(shares[k])) for k in room}
+        # Največji ostanki dobijo še po enega, dokler ni razdeljeno vse.
+        for k in sorted(room, key=lambda k: shares[k] - int(shares[k]), reverse=True):
+            if sum(extra.values()) >= left:
+                break
+            if extra[k] < room[k]:
+                extra[k] += 1
+        if not any(extra.values()):
+            break
+        for k, e in extra.items():
+            plan[k] += e
+        left -= sum(extra.values())
+    return plan
+
+
+def _mean_var(values):
+    mean = sum(values) / len(values)
+    var = sum((v - mean) ** 2 for v in values) / (len(values) - 1) if len(values) > 1 else None
+    return mean, var
+
+
+def _interval(log_index, se):
+    if se is None:
+        return None
+    return [round(100 * math.exp(log_index - Z95 * se), 2), round(100 * math.exp(log_index + Z95 * se), 2)]
+
+
+def price_index(pairs, sizes):
+    """Jevons index per stratum and overall, with 95 % intervals.
+
+    ``pairs`` maps a stratum to the (old, new) effective prices of its sampled
+    products, ``sizes`` to its population size ``N_h``.
+    """
+    logs = {k: [math.log(new / old) for old, new in p if old and new] for k, p in pairs.items()}
+    logs = {k: v for k, v in logs.items() if v}
+    stats = {k: _mean_var(v) for k, v in logs.items()}
+    dof = sum(len(v) - 1 for v in logs.values())
+    pooled = sum((len(logs[k]) - 1) * var for k, (_m, var) in stats.items() if var is not None) / dof if dof else None
+
+    strata = {}
+    total = sum(sizes[k] for k in logs)
+    overall, overall_var = 0.0, 0.0
+    for k, (mean, var) in sorted(stats.items()):
+        n, size = len(logs[k]), sizes[k]
+        var = var if var is not None else pooled
+        se = math.sqrt(max(0.0, 1 - n / size) * var / n) if var is not None else None
+        strata[k] = {"index": round(100 * math.exp(mean), 2), "ci95": _interval(mean, se), "priced": n,
+                     "size": size, "changed": sum(1 for v in logs[k] if abs(v) > 1e-9)}
+        weight = size / total
+        overall += weight * mean
+        overall_var = None if se is None or overall_var is None else overall_var + (weight * se) ** 2
+    if not strata:
+        return {"index": None, "ci95": None, "categories": {}}
+    se = math.sqrt(overall_var) if overall_var is not None else None
+    return {"index": round(100 * math.exp(overall), 2), "ci95": _interval(overall, se), "categories": strata}
+
+
+def refetch(fetcher, records, extract, delay=(2.0, 5.0)):
+    """Yield ``extract(page, record)`` for each record's current detail page, with the shop's pause between requests."""
+    for n, record in enumerate(records):
+        if n:
+            trace.sleep(random.uniform(*delay))
+        page = fetcher.get(record['URL'])
+        data = extract(page, record) if page else None
+        if data:
+            yield data
+
+
+def run(shop, json_path, sample_records, size, log=print, minimum=2):
+    """Sample, re-price and write the index; returns the path of the result or None."""
+    base = last_full_snapshot(json_path)
+    if base is None:
+        log("Ni dokončanega celotnega zajema za primerjavo; indeksa ne morem izračunati.")
+        return None
+    base_day, base_path = base
+    with open(base_path, 'r', encoding='utf-8') as f:
+        population = {}
+        for record in json.load(f):
+            if record.get('URL') and effective_price(record):
+                population.setdefault(record.get('Skupina') or '', []).append(record)
+    sizes = {k: len(v) for k, v in population.items()}
+    plan = allocate(sizes, size, minimum)
+    log(f"Vzorec {sum(plan.values())} od {sum(sizes.values())} izdelkov v {len(plan)} skupinah "
+        f"(osnova: {base_day:%Y-%m-%d}).")
+
+    rng = random.Random(os.path.basename(os.path.dirname(json_path)))
+    pairs, items, missing, stopped = {}, [], 0, None
+    for skupina in sorted(plan):
+        chosen = rng.sample(population[skupina], plan[skupina])
+        current = {}
+        try:
+            for r in sample_records(skupina, chosen) or ():
+                if r:
+                    current[r.get('URL')] = r
+        except CircuitOpenError as e:
+            stopped = str(e)
+        for old in chosen:
+            new = current.get(old['URL'])
+            if new is None and stopped:
+                # Po prekinitvi neobdelani izdelki niso manjkajoči.
+                continue
+            new_price = effective_price(new) if new else None
+            if new_price is None:
+                missing += 1
+            pairs.setdefault(skupina, []).append((effective_price(old), new_price))
+            items.append({"Skupina": skupina, "URL": old['URL'], "old": effective_price(old), "new": new_price})
+        log(f"  {skupina}: {len(current)}/{len(chosen)}")
+        if stopped:
+            log(f"{stopped} Indeks izračunam iz do zdaj vzorčenih izdelkov.")
+            break
+
+    result = price_index(pairs, sizes)
+    out_dir = index_dir(json_path)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{shop}_Indeks_{datetime.now().strftime('%H-%M-%S')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(dict({"shop": shop, "date": datetime.now().isoformat(timespec='seconds'), "base": base_path,
+                        "base_date": base_day.strftime('%Y-%m-%d'), "sampled": len(items), "missing": missing,
+                        "stopped": stopped},
+                       **result, items=items), f, ensure_ascii=False, indent=2)
+    if result["index"] is not None:
+        ci = result["ci95"]
+        log(f"Indeks cen {shop}: {result['index']:.2f}" + (f" (95 % IZ {ci[0]:.2f}–{ci[1]:.2f})" if ci else "")
+            + f", manjka {missing} od {len(items)} izdelkov.")
+    log(f"Rezultat: {path}")
+    return path
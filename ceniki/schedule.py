@@ -0,0 +1,157 @@
+"""Deadline-aware ordering of the crawl work.
+
+``run_all.py`` passes each script's time budget down as ``SCRAPE_DEADLINE``
+(a Unix timestamp); a script started on its own can be given a budget with
+``--budget-min``/``SCRAPE_BUDGET_MIN``. Without either, the crawl runs as
+before.
+
+Scripts first run discovery (listing pages) for every subcategory and hand the
+found products to ``Scheduler.add``; iterating the scheduler then yields the
+detail work. As long as the remaining work (products left x observed time per
+product) fits in the remaining budget, subcategories are done one after
+another; once it does not, the scheduler switches to round-robin so every
+subcategory gets covered before any of them goes deep. It stops early enough
+to leave ``Deadline.margin`` seconds for the final save, and ``unfinished``
+returns the subcategories to record as pending.
+
+With ``scores`` (see ``ceniki.priority``) each subcategory's products are
+queued most-likely-changed first, and once every subcategory has been covered
+the round-robin gives way to global score order.
+"""
+
+import os
+import time
+from collections import deque
+
+# Discovery ustavimo, ko je porabljena ta polovica proračuna; preostanek je za detajle.
+DISCOVERY_SHARE = 0.5
+
+
+class Deadline:
+    def __init__(self, at, margin=120.0):
+        self.at = at
+        self.margin = margin
+        self.started = time.time()
+
+    @classmethod
+    def from_options(cls, options):
+        """Deadline from ``SCRAPE_DEADLINE`` or ``options.budget_min``; None if there is no budget."""
+        at = os.environ.get("SCRAPE_DEADLINE")
+        if at:
+            return cls(float(at))
+        if getattr(options, "budget_min", None):
+            return cls(time.time() + options.budget_min * 60)
+        return None
+
+    def remaining(self):
+        """Seconds left before the final save has to start."""
+        return self.at - self.margin - time.time()
+
+    def used_share(self):
+        total = self.at - self.margin - self.started
+        return 1.0 if total <= 0 else 1.0 - max(0.0, self.remaining()) / total
+
+    def __str__(self):
+        return f"{max(0.0, self.remaining()) / 60:.0f} min"
+
+
+class Scheduler:
+    """Yields ``(group, task)`` pairs so the crawl fits ``deadline``.
+
+    ``group`` is the work item of a subcategory (as stored in the pending file),
+    ``task`` whatever the shop needs to fetch one product. Tasks whose
+    ``key(task)`` is in ``skip`` (already saved today) are dropped, ``scores``
+    maps keys to change-likelihood scores. A task stays queued until the loop
+    body for it returns, so an exception leaves it in ``unfinished``.
+    """
+
+    def __init__(self, deadline=None, log=None, latency=5.0, alpha=0.2, skip=(), key=None, scores=None):
+        self.deadline = deadline
+        self.log = log or (lambda message: None)
+        self.latency = latency
+        self.alpha = alpha
+        self.skip = set(skip)
+        self.key = key or (lambda task: task)
+        self.scores = scores
+        self.groups = {}
+        self.stopped = False
+        self._spread = False
+
+    def score(self, task):
+        # Izdelki brez zgodovine (novi) imajo prednost.
+        return self.scores.get(self.key(task), 1.0)
+
+    def discovering(self):
+        """False once discovery has used up its share of the budget."""
+        if self.deadline is None or self.deadline.used_share() < DISCOVERY_SHARE:
+            return True
+        if not self.stopped:
+            self.stopped = True
+            self.log("Porabljena polovica časa za zajem seznamov; ostale podkategorije ostanejo za naslednji zagon.")
+        return False
+
+    def add(self, group, tasks):
+        tasks = [t for t in tasks if self.key(t) not in self.skip]
+        if self.scores is not None:
+            tasks.sort(key=self.score, reverse=True)
+        self.groups[group] = deque(tasks)
+
+    def pending_tasks(self):
+        return sum(len(q) for q in self.groups.values())
+
+    def estimate(self):
+        return self.pending_tasks() * self.latency
+
+    def observe(self, seconds):
+        self.latency += self.alpha * (seconds - self.latency)
+
+    def _fits(self):
+        return self.deadline is None or self.estimate() <= self.deadline.remaining()
+
+    def _next_spread(self, order, i, covered):
+        """Round-robin position ``i`` -> (group, next i)."""
+        if self.scores is not None and covered.issuperset(g for g in order if self.groups[g]):
+            return max((g for g in order if self.groups[g]), key=lambda g: self.score(self.groups[g][0])), i
+        i %= len(order)
+        while not self.groups[order[i]]:
+            i = (i + 1) % len(order)
+        return order[i], i + 1
+
+    def __iter__(self):
+        order = list(self.groups)
+        covered = set()
+        i = 0
+        last = None
+        while True:
+            now = time.monotonic()
+            if last is not None:
+                self.observe(now - last)
+            active = [g for g in order if self.groups[g]]
+            if not active:
+                return
+            if self.deadline is not None and self.deadline.remaining() < self.latency:
+                self.stopped = True
+                self.log(f"Zmanjkuje časa: {self.pending_tasks()} izdelkov ostane za naslednji zagon.")
+                return
+            if not self._spread and not self._fits():
+                self._spread = True
+                self.log(f"Ocena {self.estimate() / 60:.0f} min za {self.pending_tasks()} izdelkov presega "
+                         f"preostanek ({self.deadline}); zajemam izmenično po podkategorijah.")
+            if self._spread:
+                group, i = self._next_spread(order, i, covered)
+            else:
+                group = active[0]
+            covered.add(group)
+            last = time.monotonic()
+            yield group, self.groups[group][0]
+            self.groups[group].popleft()
+
+    def requeue(self, group, task):
+        """Put back a task that was handed out but not finished (pipeline abort)."""
+        q = self.groups[group]
+        if not q or q[0] is not task:
+            q.appendleft(task)
+
+    def unfinished(self, work):
+        """Work items not fully done: never discovered or with tasks left."""
+        return [g for g in work if g not in self.groups or self.groups[g]]
@@ -0,0 +1,244 @@
+"""Full-text search over the scraped catalogues: ``python -m ceniki.search``.
+
+``index`` loads each shop's latest ``<SHOP>_Podatki_<date>.json`` (see
+``matching.latest_outputs``) into ``<OUTPUT_DIR>/Ceniki_Search/Ceniki_Iskanje.sqlite``:
+one row per product plus an FTS5 index over ``Opis``, ``Proizvajalec``,
+``Oznaka / naziv`` and ``Skupina``. Indexed text is folded the same way as
+for matching (``matching.fold``: lowercase, č/š/ž -> c/s/z, decimal comma ->
+point), and so are queries, so "plosc" finds "Ploščica" and "2,5 l" finds
+"2.5 L". A shop is re-indexed only when its latest output changed.
+
+``query`` and ``serve`` answer searches: every word of the query must match
+the start of a word in one of the indexed fields, results are ranked by
+BM25 (a hit in ``Opis`` or ``Oznaka`` counts more than one in ``Skupina``).
+Ranking scores every match, so a query matching more than ``MAX_RANKED``
+products (a single common word) returns the first matches unranked, marked
+``broad``, and stays in the low milliseconds. Answers are kept in an LRU
+cache until the index is rebuilt. ``serve`` is a
+small local HTTP service::
+
+    GET /search?q=lepilo+za+ploscice&shop=Merkur&limit=20
+
+which returns JSON with the hits, ``broad`` and the lookup time.
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from ceniki.matching import fold, latest_outputs
+
+FIELDS = {"opis": "Opis", "proizvajalec": "Proizvajalec", "oznaka": "Oznaka / naziv", "skupina": "Skupina"}
+# Teže stolpcev za bm25 (v vrstnem redu FIELDS, nato trgovina).
+RANK = "bm25(10.0, 4.0, 8.0, 1.0, 0.0)"
+# Nad tem številom zadetkov rangiranje stane več kot iskanje samo.
+MAX_RANKED = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    shop TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    indexed REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    shop TEXT NOT NULL,
+    url TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_shop ON products (shop);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5 (
+    opis, proizvajalec, oznaka, skupina, trgovina,
+    tokenize = "unicode61 remove_diacritics 2 tokenchars '.'",
+    prefix = '2 3'
+);
+"""
+
+_TERM_RE = re.compile(r'[0-9a-z.]+')
+
+
+def index_path(root):
+    return os.path.join(root, "Ceniki_Search", "Ceniki_Iskanje.sqlite")
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA mmap_size=268435456")
+    db.executescript(SCHEMA)
+    return db
+
+
+def build(root, log=print):
+    """Bring the index up to date with the latest outputs; returns the number of re-indexed shops."""
+    path = index_path(root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = connect(path)
+    known = {shop: (src, mtime) for shop, src, mtime in db.execute("SELECT shop, path, mtime FROM sources")}
+    changed = 0
+    for shop, src in latest_outputs(root).items():
+        mtime = os.path.getmtime(src)
+        if known.get(shop) == (src, mtime):
+            continue
+        with open(src, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("DELETE FROM products_fts WHERE rowid IN (SELECT id FROM products WHERE shop = ?)", (shop,))
+            db.execute("DELETE FROM products WHERE shop = ?", (shop,))
+            for record in records:
+                rowid = db.execute("INSERT INTO products (shop, url, record) VALUES (?, ?, ?)",
+                                   (shop, record.get('URL'), json.dumps(record, ensure_ascii=False))).lastrowid
+                db.execute("INSERT INTO products_fts (rowid, opis, proizvajalec, oznaka, skupina, trgovina) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           (rowid, *(fold(record.get(name)) for name in FIELDS.values()), fold(shop)))
+            db.execute("INSERT OR REPLACE INTO sources (shop, path, mtime, indexed) VALUES (?, ?, ?, ?)",
+                       (shop, src, mtime, time.time()))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        changed += 1
+        log(f"  {shop}: {len(records)} izdelkov iz {os.path.basename(src)}")
+    if changed:
+        db.execute("INSERT INTO products_fts (products_fts) VALUES ('optimize')")
+    db.close()
+    log(f"Iskalni indeks: {path} ({changed} trgovin osveženih)")
+    return changed
+
+
+def fts_query(text, shop=None):
+    """User input -> FTS5 query: every folded word as a quoted prefix term, all required."""
+    terms = [t.strip('.') for t in _TERM_RE.findall(fold(text))]
+    terms = ' '.join(f'"{t}"*' for t in terms if t)
+    if not terms:
+        return ''
+    query = f"{{{' '.join(FIELDS)}}} : ({terms})"
+    return f'{query} AND trgovina : "{fold(shop)}"' if shop else query
+
+
+class Searcher:
+    """Read side of the index, shareable between threads, with an LRU cache of answers."""
+
+    def __init__(self, path, cache_size=1024):
+        self.path = path
+        self.db = connect(path)
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.generation = self._generation()
+
+    def _generation(self):
+        return self.db.execute("SELECT COALESCE(MAX(indexed), 0), COUNT(*) FROM sources").fetchone()
+
+    def search(self, text, shop=None, limit=20):
+        """(hits, broad): stored records plus ``Trgovina`` and ``Ujemanje`` (BM25, None when broad)."""
+        match = fts_query(text, shop)
+        if not match:
+            return [], False
+        key = (match, limit)
+        with self.lock:
+            generation = self._generation()
+            if generation != self.generation:
+                self.cache.clear()
+                self.generation = generation
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            found = self.db.execute("SELECT rowid FROM products_fts WHERE products_fts MATCH ? LIMIT ?",
+                                    (match, MAX_RANKED + 1)).fetchall()
+            broad = len(found) > MAX_RANKED
+            if broad:
+                ranked = [(rowid, None) for (rowid,) in found[:limit]]
+            else:
+                ranked = self.db.execute(f"SELECT rowid, rank FROM products_fts WHERE products_fts MATCH ? "
+                                         f"AND rank MATCH '{RANK}' ORDER BY rank LIMIT ?", (match, limit)).fetchall()
+            stored = {rowid: (shop_name, record) for rowid, shop_name, record in self.db.execute(
+                f"SELECT id, shop, record FROM products WHERE id IN ({','.join('?' * len(ranked))})",
+                [rowid for rowid, _rank in ranked])}
+            hits = [dict(json.loads(stored[rowid][1]), Trgovina=stored[rowid][0],
+                         Ujemanje=None if rank is None else round(-rank, 3)) for rowid, rank in ranked]
+            self.cache[key] = hits, broad
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return hits, broad
+
+
+def _handler(searcher):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path != "/search":
+                self.send_error(404)
+                return
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            t0 = time.perf_counter()
+            try:
+                hits, broad = searcher.search(params.get("q", ""), params.get("shop"), int(params.get("limit") or 20))
+            except (ValueError, sqlite3.Error) as e:
+                self.send_error(400, str(e))
+                return
+            body = json.dumps({"q": params.get("q", ""), "ms": round((time.perf_counter() - t0) * 1000, 2),
+                               "broad": broad, "hits": hits}, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(root, host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), _handler(Searcher(index_path(root))))
+    print(f"Iskanje na http://{host}:{port}/search?q=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Iskanje po zajetih cenikih.")
+    parser.add_argument("--root", default=os.environ.get("OUTPUT_DIR") or ".",
+                        help="mapa z Ceniki_Scraping (privzeto OUTPUT_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("index", help="zgradi ali osveži indeks")
+    q = sub.add_parser("query", help="poišči izdelke")
+    q.add_argument("text", nargs="+")
+    q.add_argument("--shop")
+    q.add_argument("--limit", type=int, default=20)
+    s = sub.add_parser("serve", help="lokalna HTTP storitev za iskanje")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    if args.command == "index":
+        build(args.root)
+    elif args.command == "query":
+        t0 = time.perf_counter()
+        hits, broad = Searcher(index_path(args.root)).search(' '.join(args.text), args.shop, args.limit)
+        for hit in hits:
+            print(f"{hit['Trgovina']:<14} {hit.get('Cena / EM (z DDV)', ''):>10}  {hit.get('Opis', '')}  "
+                  f"{hit.get('URL', '')}")
+        print(f"{len(hits)} zadetkov v {(time.perf_counter() - t0) * 1000:.1f} ms"
+              + (" (preveč zadetkov za razvrščanje, natančneje opišite iskani izdelek)" if broad else ""))
+    else:
+        serve(args.root, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
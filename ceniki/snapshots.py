@@ -0,0 +1,246 @@
+"""Compact history of each shop's catalogue: one base plus per-run deltas.
+
+``python -m ceniki.snapshots add`` takes every finished run under
+``<OUTPUT_DIR>/Ceniki_Scraping`` (outputs with no work left pending) that
+is not stored yet and adds it to ``<OUTPUT_DIR>/Ceniki_Snapshots/<SHOP>/``;
+``restore <SHOP> <YYYY-MM-DD>`` writes a stored day back out as JSON.
+
+Records are keyed by ``URL``. A delta holds only what changed against the
+previous stored run: new records, the changed fields of existing ones and
+the keys that disappeared. Fields with one value across the whole run
+(``Veljavnost od``, ``Valuta``, ``DDV``) are stored once per run, so the new
+date alone does not make every row "changed". Each file is compact JSON
+compressed with zstd (gzip without ``zstandard``, see ``archive.codec``).
+
+Restoring a day reads the base it belongs to and applies the deltas up to
+that day, each in time proportional to its changed rows. A new base is
+written once a chain holds ``max_chain`` deltas or its deltas together
+touched more than ``rebase_ratio`` of the base's rows, which bounds both
+the restore time and how much a lost file can take with it.
+
+Records come back in ``Zap`` order (or the order they were added in when
+there is no ``Zap``); everything else is reproduced exactly.
+"""
+
+import argparse
+import glob
+import json
+import os
+from datetime import datetime
+
+from ceniki.archive import codec, decompressor
+from ceniki.pending import finished
+
+MANIFEST = "manifest.json"
+
+
+def snapshot_dir(root, shop):
+    return os.path.join(root, "Ceniki_Snapshots", shop)
+
+
+def keyed(records):
+    """{key: record} by URL; repeated URLs get a '#n' suffix so no row is lost."""
+    out = {}
+    for record in records:
+        key = record.get('URL') or '#'
+        n = 1
+        while key in out:
+            n += 1
+            key = f"{record.get('URL') or '#'}#{n}"
+        out[key] = record
+    return out
+
+
+def common_fields(records):
+    """Fields present in every record with one and the same value."""
+    if not records:
+        return {}
+    common = dict(records[0])
+    for record in records[1:]:
+        for name in list(common):
+            if name not in record or record[name] != common[name]:
+                del common[name]
+    return common
+
+
+def strip(record, common):
+    return {k: v for k, v in record.items() if k not in common}
+
+
+def diff(old, new):
+    """Delta between two {key: stripped record} states."""
+    added, changed, dropped = {}, {}, {}
+    for key, record in new.items():
+        before = old.get(key)
+        if before is None:
+            added[key] = record
+            continue
+        fields = {k: v for k, v in record.items() if before.get(k, object()) != v}
+        if fields:
+            changed[key] = fields
+        gone = [k for k in before if k not in record]
+        if gone:
+            dropped[key] = gone
+    removed = [key for key in old if key not in new]
+    return {"added": added, "changed": changed, "dropped": dropped, "removed": removed}
+
+
+def apply(state, delta):
+    for key in delta["removed"]:
+        state.pop(key, None)
+    for key, fields in delta["changed"].items():
+        state[key].update(fields)
+    for key, names in delta["dropped"].items():
+        for name in names:
+            state[key].pop(name, None)
+    state.update((key, dict(record)) for key, record in delta["added"].items())
+    return state
+
+
+def _zap(record):
+    try:
+        return int(record.get('Zap'))
+    except (TypeError, ValueError):
+        return None
+
+
+def materialize(state, common):
+    records = [dict(record, **common) for record in state.values()]
+    if records and all(_zap(r) is not None for r in records):
+        records.sort(key=_zap)
+    return records
+
+
+class SnapshotStore:
+    def __init__(self, directory, max_chain=12, rebase_ratio=0.5):
+        self.directory = directory
+        self.max_chain = max_chain
+        self.rebase_ratio = rebase_ratio
+        self.ext, self.compress = codec(zstd_level=19, gzip_level=9)
+        path = os.path.join(directory, MANIFEST)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = []
+
+    def dates(self):
+        return [e["date"] for e in self.entries]
+
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name + self.ext)
+        with open(path, 'wb') as f:
+            f.write(self.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')))
+        return os.path.basename(path)
+
+    def _read(self, name):
+        path = os.path.join(self.directory, name)
+        with open(path, 'rb') as f:
+            return json.loads(decompressor(path)(f.read()))
+
+    def _save_manifest(self):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def _chain(self, date):
+        """Entries from the base ``date`` belongs to up to ``date`` itself."""
+        upto = [e for e in self.entries if e["date"] <= date]
+        if not upto or upto[-1]["date"] != date:
+            raise KeyError(f"Ni posnetka za {date}.")
+        start = max(i for i, e in enumerate(upto) if e["kind"] == "base")
+        return upto[start:]
+
+    def state(self, date):
+        """({key: stripped record}, common fields) of a stored day."""
+        chain = self._chain(date)
+        base = self._read(chain[0]["file"])
+        state, common = base["records"], base["common"]
+        for entry in chain[1:]:
+            delta = self._read(entry["file"])
+            apply(state, delta)
+            common = delta["common"]
+        return state, common
+
+    def load(self, date):
+        return materialize(*self.state(date))
+
+    def add(self, date, records):
+        """Store a run's records (days must be added in order); returns the manifest entry."""
+        if self.entries and date <= self.entries[-1]["date"]:
+            raise ValueError(f"{date} ni za zadnjim shranjenim dnevom {self.entries[-1]['date']}.")
+        common = common_fields(records)
+        new = {key: strip(record, common) for key, record in keyed(records).items()}
+        chain = self._chain(self.entries[-1]["date"]) if self.entries else []
+        touched = sum(e["changed"] for e in chain[1:])
+        if not chain or len(chain) - 1 >= self.max_chain or touched > self.rebase_ratio * chain[0]["rows"]:
+            entry = {"date": date, "kind": "base", "rows": len(new), "changed": len(new),
+                     "file": self._write(f"base_{date}", {"date": date, "common": common, "records": new})}
+        else:
+            old, _common = self.state(chain[-1]["date"])
+            delta = dict(diff(old, new), date=date, common=common)
+            changed = len(delta["added"]) + len(delta["changed"]) + len(delta["dropped"]) + len(delta["removed"])
+            entry = {"date": date, "kind": "delta", "rows": len(new), "changed": changed,
+                     "file": self._write(f"delta_{date}", delta)}
+        self.entries.append(entry)
+        self._save_manifest()
+        return entry
+
+
+def finished_outputs(root):
+    """{shop: [(YYYY-MM-DD, path)]} of the runs under ``root`` that finished, oldest first."""
+    found = {}
+    for path in glob.glob(os.path.join(root, "Ceniki_Scraping", "*", "*", "*_Podatki_*.json")):
+        folder = os.path.basename(os.path.dirname(path))
+        shop = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        try:
+            datetime.strptime(folder, "%Y-%m-%d")
+        except ValueError:
+            continue
+        if finished(path):
+            found.setdefault(shop, []).append((folder, path))
+    return {shop: sorted(runs) for shop, runs in sorted(found.items())}
+
+
+def add_outputs(root, log=print):
+    """Add every finished run that is newer than the shop's last stored day."""
+    for shop, runs in finished_outputs(root).items():
+        store = SnapshotStore(snapshot_dir(root, shop))
+        last = store.dates()[-1] if store.entries else ""
+        for date, path in runs:
+            if date <= last:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            entry = store.add(date, records)
+            size = os.path.getsize(os.path.join(store.directory, entry["file"]))
+            log(f"  {shop} {date}: {entry['kind']}, {entry['changed']} od {entry['rows']} vrstic, "
+                f"{size / 1024:.0f} KiB (JSON {os.path.getsize(path) / 1024:.0f} KiB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Zgodovina cenikov kot osnova in spremembe.")
+    parser.add_argument("--root", default=os.environ.get("OUTPUT_DIR") or ".",
+                        help="mapa z Ceniki_Scraping (privzeto OUTPUT_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("add", help="dodaj dokončane zajeme, ki še niso shranjeni")
+    r = sub.add_parser("restore", help="obnovi zajem izbranega dne")
+    r.add_argument("shop")
+    r.add_argument("date", help="YYYY-MM-DD")
+    r.add_argument("--out", help="izhodna datoteka (privzeto <SHOP>_Podatki_<date>.json)")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        add_outputs(args.root)
+        return
+    records = SnapshotStore(snapshot_dir(args.root, args.shop)).load(args.date)
+    out = args.out or f"{args.shop}_Podatki_{args.date}.json"
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=4)
+    print(f"{len(records)} zapisov: {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Optional request timeline in Chrome trace-event format (``--trace`` / ``TRACE=1``).
+
+While tracing is on, every ``span`` becomes a complete event ("ph": "X") on
+the thread that ran it, so a run opened in ``chrome://tracing`` or
+https://ui.perfetto.dev shows one track per fetch thread, parser process and
+the saver. Spans recorded:
+
+* ``dns``, ``connect``, ``tls`` for every new connection, ``ttfb`` (request
+  sent -> headers) and ``download`` (headers -> body) for every response
+  (``ceniki.fetch``),
+* every ``profiling.phase`` (discovery, fetch, parse, extract, persist), also
+  inside the parser processes,
+* ``sleep`` for the polite pauses, ``backoff`` for retry and Retry-After
+  waits, ``queue`` while a pipeline stage is blocked on a full queue, and
+  ``save`` for each batch the background saver writes.
+
+Events are streamed to ``<SHOP>_Trace_<time>.json`` next to the profile
+dumps (``profiling.profile_dir``) in the trace-event "JSON array" form,
+which viewers accept without the closing bracket, so a run that was killed
+still leaves a readable trace. Timestamps are wall-clock microseconds, which
+lines up events from different processes.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+from datetime import datetime
+
+_active = None
+_collector = None
+_inherited = None
+
+
+def now():
+    return time.time()
+
+
+class Tracer:
+    def __init__(self, path=None, process="ceniki"):
+        self.path = path
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.events = []
+        self.count = 0
+        self._named = set()
+        self.file = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Vrstično medpomnjenje: vsak dogodek je na disku takoj, tudi če proces ubijemo.
+            self.file = open(path, 'w', encoding='utf-8', buffering=1)
+            self.file.write("[\n")
+        self._emit({"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": process}})
+
+    def _emit(self, event):
+        with self.lock:
+            key = (event["pid"], event["tid"])
+            if key not in self._named and "thread" in event:
+                self._named.add(key)
+                self._write({"name": "thread_name", "ph": "M", "pid": key[0], "tid": key[1],
+                             "args": {"name": event["thread"]}})
+            event.pop("thread", None)
+            self._write(event)
+
+    def _write(self, event):
+        self.count += 1
+        if self.file is None:
+            self.events.append(event)
+        else:
+            self.file.write(json.dumps(event, ensure_ascii=False, default=str) + ",\n")
+
+    def add(self, name, start, end, cat="crawl", args=None):
+        event = {"name": name, "cat": cat, "ph": "X", "ts": round(start * 1e6),
+                 "dur": max(0, round((end - start) * 1e6)), "pid": self.pid, "tid": threading.get_native_id(),
+                 "thread": threading.current_thread().name}
+        if args:
+            event["args"] = args
+        self._emit(event)
+
+    def merge(self, events):
+        for event in events:
+            self._emit(dict(event))
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                # Zadnji zapis brez vejice, da je datoteka tudi veljaven JSON.
+                self.file.write(json.dumps({"name": "trace_end", "ph": "i", "s": "g", "pid": self.pid, "tid": 0,
+                                            "ts": round(now() * 1e6)}) + "\n]\n")
+                self.file.close()
+                self.file = None
+
+
+def enabled():
+    return _active is not None
+
+
+def record(name, start, end=None, cat="crawl", **args):
+    """Add a span that was timed elsewhere (``start``/``end`` from ``now()``)."""
+    if _active is not None:
+        _active.add(name, start, now() if end is None else end, cat, args or None)
+
+
+class span(ContextDecorator):
+    """Time a block as a trace span; a no-op while tracing is off."""
+
+    def __init__(self, name, cat="crawl", **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def _recreate_cm(self):
+        return span(self.name, self.cat, **self.args)
+
+    def __enter__(self):
+        self._start = now() if _active is not None else None
+        return self
+
+    def __exit__(self, *exc):
+        if self._start is not None:
+            record(self.name, self._start, cat=self.cat, **self.args)
+        return False
+
+
+def sleep(seconds, name="sleep", **args):
+    """``time.sleep`` that shows up on the timeline."""
+    with span(name, "wait", seconds=round(seconds, 3), **args):
+        time.sleep(seconds)
+
+
+def collect(fn, *args):
+    """Run ``fn(*args)`` in a pool worker and return ``(result, events)`` for ``merge``.
+
+    In the tracing process itself (inline parsing) the spans are recorded
+    directly and the event list is empty.
+    """
+    global _active, _collector
+    if _active is not None:
+        return fn(*args), []
+    if _collector is None:
+        # Nit delavca ima sicer ime glavne niti (ali ob fork niti, ki je proces ustvarila).
+        threading.current_thread().name = "parser"
+        _collector = Tracer(process="parser")
+    _active = _collector
+    try:
+        return fn(*args), _collector.events
+    finally:
+        _active = None
+        _collector.events = []
+
+
+def merge(events):
+    if _active is not None and events:
+        _active.merge(events)
+
+
+def start(shop, out_dir):
+    global _active
+    if _active is not None:
+        stop()
+    stamp = datetime.now().strftime('%H-%M-%S')
+    _active = Tracer(os.path.join(out_dir, f"{shop}_Trace_{stamp}.json"), process=shop)
+
+
+def detach():
+    """Forget a tracer inherited through fork (pool workers): its file belongs to the parent."""
+    global _active, _inherited
+    # Objekt obdržimo: ob sproščanju bi v datoteko izpraznil še medpomnilnik starša.
+    _inherited, _active = _active, None
+
+
+def stop(log=None):
+    """Close the trace file (if tracing was started) and return its path."""
+    global _active
+    if _active is None:
+        return None
+    tracer, _active = _active, None
+    tracer.close()
+    if log:
+        log(f"Časovnica zahtev ({tracer.count} dogodkov): {tracer.path}")
+    return tracer.path
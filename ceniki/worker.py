@@ -0,0 +1,129 @@
+"""Queue worker for any shop module: ``python -m ceniki.worker KalcerV1 --seed``.
+
+Start as many workers as the shop tolerates, on one machine (sharing the
+SQLite file) or on several (``--queue-url`` pointing at
+``python -m ceniki.workqueue serve``). ``--seed`` queues the shop's
+subcategories (already queued ones are kept, so every worker may pass it);
+``--save`` writes the collected records to the shop's usual outputs once the
+queue is drained.
+
+A shop module takes part by defining:
+
+``crawl_work()``
+    the list of subcategory work items (JSON-serializable),
+``crawl_discover(group)``
+    the products found on that subcategory's listing pages,
+``crawl_detail(group, task)``
+    the record for one product, or None,
+``crawl_save(records)``
+    write records to the shop's JSON store and exports.
+"""
+
+import argparse
+import importlib
+import os
+import random
+import socket
+import time
+
+from ceniki import log
+from ceniki.fetch import CircuitOpenError
+from ceniki.workqueue import RemoteQueue, WorkQueue, default_path
+
+
+def task_key(task):
+    return task if isinstance(task, str) else task["URL"]
+
+
+def _group(value):
+    # JSON nam vrne seznam; skripte pričakujejo terko kot v main().
+    return tuple(value) if isinstance(value, list) else value
+
+
+def run(shop, queue, worker, lease_sec=300.0, max_attempts=3, delay=(2.0, 5.0)):
+    """Process tasks until none are ready or leased; return the number handled."""
+    name = shop.SHOP_NAME
+    handled = 0
+    idle = 0
+    while True:
+        task = queue.lease(name, worker, lease_sec, max_attempts)
+        if task is None:
+            counts = queue.counts(name)
+            if not counts.get("ready") and not counts.get("leased"):
+                return handled
+            # Drugi delavci še delajo ali čakamo na ponovni poskus.
+            time.sleep(min(30.0, 2.0 + idle))
+            idle += 1
+            continue
+        idle = 0
+        group = _group(task["group"])
+        try:
+            if task["kind"] == "listing":
+                found = shop.crawl_discover(group)
+                added = queue.put_details(name, task["group"], [(task_key(t), t, 0.0) for t in found])
+                log.info(f"Seznam {group}: {len(found)} izdelkov, {added} novih opravil.")
+                queue.ack(task["id"], worker)
+            else:
+                queue.ack(task["id"], worker, shop.crawl_detail(group, task["task"]))
+            handled += 1
+        except CircuitOpenError as e:
+            retry_at = e.retry_at or time.time() + 60
+            queue.release(task["id"], worker, retry_at)
+            log.info(f"{e} Čakam do {time.strftime('%H:%M:%S', time.localtime(retry_at))}.")
+            time.sleep(max(0.0, retry_at - time.time()))
+            continue
+        except Exception as e:
+            log.exception(f"Napaka pri opravilu {task['id']} ({task['kind']}): {e}")
+            queue.fail(task["id"], worker, str(e), 60.0 * (task["attempts"] + 1), max_attempts)
+        time.sleep(random.uniform(*delay))
+
+
+def save(shop, queue):
+    records = queue.results(shop.SHOP_NAME)
+    records = [r for r in records if r]
+    for i, record in enumerate(records, start=1):
+        record['Zap'] = i
+    shop.crawl_save(records)
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Delavec za deljeno vrsto opravil.")
+    parser.add_argument("shop", help="modul trgovine, npr. KalcerV1")
+    parser.add_argument("--queue", default=default_path(), help="pot do SQLite datoteke (WORK_QUEUE)")
+    parser.add_argument("--queue-url", default=os.environ.get("WORK_QUEUE_URL"),
+                        help="naslov 'python -m ceniki.workqueue serve' namesto datoteke")
+    parser.add_argument("--seed", action="store_true", help="dodaj podkategorije trgovine v vrsto")
+    parser.add_argument("--fresh", action="store_true", help="pred --seed pobriši prejšnja opravila trgovine")
+    parser.add_argument("--save", action="store_true", help="ko je vrsta prazna, zapiši rezultate")
+    parser.add_argument("--id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--lease-sec", type=float, default=300.0)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    args, _unknown = parser.parse_known_args(argv)
+
+    shop = importlib.import_module(args.shop)
+    queue = RemoteQueue(args.queue_url) if args.queue_url else WorkQueue(args.queue)
+
+    # Pri oddaljeni vrsti --queue ne pove ničesar o tem stroju; logi gredo v OUTPUT_DIR.
+    if args.queue_url:
+        queue_dir = os.environ.get("OUTPUT_DIR") or "."
+    else:
+        queue_dir = os.path.dirname(os.path.abspath(args.queue))
+    log_dir = os.path.join(queue_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    log.setup(shop.SHOP_NAME, os.path.join(log_dir, f"{shop.SHOP_NAME}_Scraping_Log_{args.id}.txt"))
+    try:
+        if args.fresh:
+            queue.clear(shop.SHOP_NAME)
+        if args.seed:
+            log.info(f"V vrsto dodanih {queue.seed(shop.SHOP_NAME, shop.crawl_work())} podkategorij.")
+        handled = run(shop, queue, args.id, args.lease_sec, args.max_attempts)
+        log.info(f"Delavec {args.id}: obdelanih {handled} opravil, stanje {queue.counts(shop.SHOP_NAME)}.")
+        if args.save:
+            log.info(f"Zapisanih {save(shop, queue)} izdelkov.")
+    finally:
+        log.shutdown()
+
+
+if __name__ == "__main__":
+    main()
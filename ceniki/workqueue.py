@@ -0,0 +1,259 @@
+"""Durable work queue for running one shop on several workers.
+
+Tasks live in a SQLite file: one ``listing`` task per subcategory and, once a
+listing was processed, one ``detail`` task per product. Workers ``lease`` a
+task for ``lease_sec`` seconds, then ``ack`` it (storing the scraped record)
+or ``fail`` it (retried with a delay until ``max_attempts``). A lease that
+expires because its worker died makes the task available again and counts
+as an attempt, so a page that keeps killing workers ends up ``failed``; every
+ack is recorded in ``acks``.
+
+Processes on one machine share the file directly; for several machines,
+``python -m ceniki.workqueue serve`` exposes the same methods over HTTP and
+``RemoteQueue`` is the matching client. See ``ceniki.worker``.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    shop TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority REAL NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'ready',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (shop, kind, key)
+);
+CREATE INDEX IF NOT EXISTS tasks_next ON tasks (shop, state, priority DESC, id);
+CREATE TABLE IF NOT EXISTS acks (
+    task_id INTEGER NOT NULL,
+    worker TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    task_id INTEGER PRIMARY KEY,
+    shop TEXT NOT NULL,
+    key TEXT NOT NULL,
+    record TEXT NOT NULL,
+    at REAL NOT NULL
+);
+"""
+
+# Seznami pred detajli, da se delo čim prej razprši med delavce.
+LISTING_PRIORITY = 10.0
+
+
+def default_path():
+    return os.environ.get("WORK_QUEUE") or os.path.join(os.environ.get("OUTPUT_DIR") or ".", "Ceniki_Queue.sqlite")
+
+
+class WorkQueue:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def _put(self, shop, kind, key, payload, priority):
+        now = time.time()
+        cur = self.db.execute(
+            "INSERT OR IGNORE INTO tasks (shop, kind, key, payload, priority, created, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (shop, kind, key, json.dumps(payload, ensure_ascii=False), priority, now, now))
+        return cur.rowcount
+
+    def seed(self, shop, groups):
+        """Queue a listing task per group; groups already queued are left alone."""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            added = sum(self._put(shop, "listing", json.dumps(g, ensure_ascii=False), {"group": g},
+                                  LISTING_PRIORITY) for g in groups)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return added
+
+    def put_details(self, shop, group, tasks):
+        """``tasks``: [(key, task, priority), ...] found on ``group``'s listing."""
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            added = sum(self._put(shop, "detail", key, {"group": group, "task": task}, priority)
+                        for key, task, priority in tasks)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return added
+
+    def lease(self, shop, worker, lease_sec=300.0, max_attempts=3):
+        """Lease the next task, or return None if nothing is available right now."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # Potekel zakup šteje kot poskus; kdor jih je porabil vse, ne pride več na vrsto.
+            self.db.execute(
+                "UPDATE tasks SET state = 'failed', attempts = attempts + 1, error = 'lease expired', "
+                "lease_owner = NULL, lease_until = NULL, updated = ? "
+                "WHERE shop = ? AND state = 'leased' AND lease_until < ? AND attempts + 1 >= ?",
+                (now, shop, now, max_attempts))
+            row = self.db.execute(
+                "SELECT id, kind, payload, attempts + (state = 'leased') FROM tasks WHERE shop = ? AND "
+                "((state = 'ready' AND not_before <= ?) OR (state = 'leased' AND lease_until < ?)) "
+                "ORDER BY priority DESC, id LIMIT 1", (shop, now, now)).fetchone()
+            if row:
+                self.db.execute(
+                    "UPDATE tasks SET state = 'leased', attempts = ?, lease_owner = ?, lease_until = ?, updated = ? "
+                    "WHERE id = ?", (row[3], worker, now + lease_sec, now, row[0]))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        if not row:
+            return None
+        return {"id": row[0], "kind": row[1], "attempts": row[3], **json.loads(row[2])}
+
+    def _finish(self, task_id, worker, state, outcome, record=None, **columns):
+        now = time.time()
+        sets = ", ".join(f"{c} = ?" for c in columns)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            cur = self.db.execute(
+                f"UPDATE tasks SET state = ?, lease_owner = NULL, lease_until = NULL, updated = ?"
+                f"{', ' + sets if sets else ''} WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                (state, now, *columns.values(), task_id, worker))
+            if cur.rowcount:
+                self.db.execute("INSERT INTO acks (task_id, worker, outcome, at) VALUES (?, ?, ?, ?)",
+                                (task_id, worker, outcome, now))
+                if record is not None:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO results (task_id, shop, key, record, at) "
+                        "SELECT id, shop, key, ?, ? FROM tasks WHERE id = ?",
+                        (json.dumps(record, ensure_ascii=False), now, task_id))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return bool(cur.rowcount)
+
+    def ack(self, task_id, worker, record=None):
+        """Mark the task done; False if the lease was lost to another worker meanwhile."""
+        return self._finish(task_id, worker, "done", "ack", record=record)
+
+    def fail(self, task_id, worker, error, delay=60.0, max_attempts=3):
+        row = self.db.execute("SELECT attempts FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        if attempts >= max_attempts:
+            return self._finish(task_id, worker, "failed", "failed", attempts=attempts, error=str(error))
+        return self._finish(task_id, worker, "ready", "retry", attempts=attempts, error=str(error),
+                            not_before=time.time() + delay)
+
+    def release(self, task_id, worker, not_before=0.0):
+        """Give the task back without counting an attempt (e.g. the host's breaker is open)."""
+        return self._finish(task_id, worker, "ready", "release", not_before=not_before or 0.0)
+
+    def counts(self, shop):
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM tasks WHERE shop = ? GROUP BY state", (shop,)))
+
+    def results(self, shop):
+        """Scraped records in the order their tasks were queued."""
+        return [json.loads(r) for (r,) in self.db.execute(
+            "SELECT record FROM results WHERE shop = ? ORDER BY task_id", (shop,))]
+
+    def clear(self, shop):
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.execute("DELETE FROM results WHERE shop = ?", (shop,))
+        self.db.execute("DELETE FROM acks WHERE task_id IN (SELECT id FROM tasks WHERE shop = ?)", (shop,))
+        self.db.execute("DELETE FROM tasks WHERE shop = ?", (shop,))
+        self.db.execute("COMMIT")
+
+
+METHODS = ("seed", "put_details", "lease", "ack", "fail", "release", "counts", "results", "clear")
+
+
+class RemoteQueue:
+    """Client for ``serve``; has the same methods as ``WorkQueue``."""
+
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _call(self, method, *args):
+        request = urllib.request.Request(f"{self.url}/{method}", data=json.dumps(args).encode('utf-8'),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def __getattr__(self, method):
+        if method not in METHODS:
+            raise AttributeError(method)
+        return lambda *args: self._call(method, *args)
+
+
+def serve(path, host="127.0.0.1", port=8765):
+    queue = WorkQueue(path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            method = self.path.strip('/')
+            if method not in METHODS:
+                self.send_error(404)
+                return
+            args = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'[]')
+            try:
+                body = json.dumps(getattr(queue, method)(*args), ensure_ascii=False).encode('utf-8')
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    # Ena povezava na SQLite: zahteve obdelujemo eno za drugo.
+    server = HTTPServer((host, port), Handler)
+    print(f"Vrsta opravil {path} na http://{host}:{port}/")
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deljena vrsta opravil za scraperje.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_serve = sub.add_parser("serve", help="vrsta prek HTTP za delavce na drugih strojih")
+    p_serve.add_argument("--queue", default=default_path())
+    p_serve.add_argument("--host", default="127.0.0.1",
+                         help="naslov za poslušanje; za delavce na drugih strojih npr. 0.0.0.0")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_stats = sub.add_parser("stats", help="stanje opravil za trgovino")
+    p_stats.add_argument("shop")
+    p_stats.add_argument("--queue", default=default_path())
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.queue, args.host, args.port)
+    else:
+        print(json.dumps(WorkQueue(args.queue).counts(args.shop), indent=2))
+
+
+if __name__ == "__main__":
+    main()
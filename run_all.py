@@ -5,6 +5,8 @@ import subprocess
 from datetime import datetime
 from pathlib import Path
 
+from ceniki.snapshots import add_outputs
+
 SCRIPTS = [
     "MerkurV1.py",
     "ObiV1.py",
@@ -15,6 +17,16 @@ SCRIPTS = [
     "PilihBetonV1.py",
 ]
 
+def tail(path: Path, size: int = 4000) -> str:
+    """Zadnjih `size` bajtov datoteke (izhod skripte gre na disk, ne v pomnilnik)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - size))
+            return f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+
 def write_progress(output_dir: str, summary: dict):
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     with open(Path(output_dir) / "run_progress.json", "w", encoding="utf-8") as f:
@@ -27,6 +39,11 @@ def main() -> int:
     # koliko minut max na posamezno skripto
     script_timeout_min = int(os.environ.get("SCRIPT_TIMEOUT_MIN", "45"))
 
+    # --profile / PROFILE=1: vsaka skripta zapiše .prof po fazah v OUTPUT_DIR/Ceniki_Profiling
+    profile = "--profile" in sys.argv[1:] or os.environ.get("PROFILE", "0") == "1"
+    if profile:
+        os.environ["PROFILE"] = "1"
+
     started = datetime.now()
     results = []
 
@@ -34,23 +51,34 @@ def main() -> int:
         "started": started.isoformat(),
         "script_timeout_min": script_timeout_min,
         "output_dir": output_dir,
+        "profile": profile,
         "results": results,
     }
 
     # naredi progress file že takoj
     write_progress(output_dir, summary)
 
+    logs_dir = Path(output_dir) / "logs"
+    logs_dir.mkdir(parents=True, exist_ok=True)
+
     for script in SCRIPTS:
         t0 = datetime.now()
         print(f"\n=== Running: {script} (timeout {script_timeout_min} min) ===", flush=True)
+        stdout_path = logs_dir / f"{Path(script).stem}.stdout.txt"
+        stderr_path = logs_dir / f"{Path(script).stem}.stderr.txt"
+
+        # Skripta dobi rok, da se prilagodi in shrani, preden jo ubijemo.
+        env = dict(os.environ, SCRAPE_DEADLINE=f"{t0.timestamp() + script_timeout_min * 60:.0f}")
 
         try:
-            p = subprocess.run(
-                [sys.executable, script],
-                capture_output=True,
-                text=True,
-                timeout=script_timeout_min * 60,
-            )
+            with open(stdout_path, "wb") as out, open(stderr_path, "wb") as err:
+                p = subprocess.run(
+                    [sys.executable, script],
+                    stdout=out,
+                    stderr=err,
+                    env=env,
+                    timeout=script_timeout_min * 60,
+                )
             status = "ok" if p.returncode == 0 else "error"
             result = {
                 "script": script,
@@ -59,11 +87,11 @@ def main() -> int:
                 "started": t0.isoformat(),
                 "finished": datetime.now().isoformat(),
                 "duration_sec": (datetime.now() - t0).total_seconds(),
-                "stdout_tail": p.stdout[-4000:],
-                "stderr_tail": p.stderr[-4000:],
+                "stdout_tail": tail(stdout_path),
+                "stderr_tail": tail(stderr_path),
             }
 
-        except subprocess.TimeoutExpired as e:
+        except subprocess.TimeoutExpired:
             result = {
                 "script": script,
                 "status": "timeout",
@@ -71,8 +99,8 @@ def main() -> int:
                 "started": t0.isoformat(),
                 "finished": datetime.now().isoformat(),
                 "duration_sec": (datetime.now() - t0).total_seconds(),
-                "stdout_tail": (e.stdout or "")[-4000:] if hasattr(e, "stdout") else "",
-                "stderr_tail": (e.stderr or "")[-4000:] if hasattr(e, "stderr") else "",
+                "stdout_tail": tail(stdout_path),
+                "stderr_tail": tail(stderr_path),
             }
             print(f"!!! TIMEOUT: {script}", flush=True)
 
@@ -80,6 +108,12 @@ def main() -> int:
         summary["results"] = results
         write_progress(output_dir, summary)
 
+    # Dokončane zajeme dodaj v zgodovino (osnova + spremembe) v OUTPUT_DIR/Ceniki_Snapshots.
+    try:
+        add_outputs(output_dir)
+    except Exception as e:
+        print(f"!!! Zgodovina posnetkov: {e}", flush=True)
+
     finished = datetime.now()
     final = {
         "started": started.isoformat(),
@@ -87,6 +121,7 @@ def main() -> int:
         "duration_sec": (finished - started).total_seconds(),
         "script_timeout_min": script_timeout_min,
         "output_dir": output_dir,
+        "profile": profile,
         "results": results,
     }
 
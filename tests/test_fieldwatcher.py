@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("bs4")
+
+from ceniki.fetch import FieldWatcher  # noqa: E402
+
+FIELDS = {"naziv": "h1", "cena": ("span.special", ".price"), "slika": "img#main"}
+
+
+def _feed(watcher, *chunks):
+    for chunk in chunks:
+        watcher.feed(chunk)
+    return watcher
+
+
+def test_done_once_every_field_element_was_closed():
+    watcher = _feed(FieldWatcher(FIELDS), '<h1>Deska <b>20 mm</b>', '</h1><img id="main" src="a.jpg">',
+                    '<div><span class="special">9,99</span>')
+    assert watcher.done
+    assert watcher.found == {"naziv", "cena", "slika"}
+
+
+def test_not_done_while_a_field_element_is_still_open():
+    watcher = _feed(FieldWatcher(FIELDS), '<h1>Deska</h1><img id="main"><span class="special">9,')
+    assert not watcher.done
+    _feed(watcher, '<span>99</span>')
+    assert not watcher.done
+    _feed(watcher, '</span>')
+    assert watcher.done
+
+
+def test_lower_priority_selector_does_not_complete_a_field():
+    watcher = _feed(FieldWatcher(FIELDS), '<h1>Deska</h1><img id="main"><p class="price">12,00</p>')
+    assert not watcher.done
+    assert "cena" not in watcher.found
+    _feed(watcher, '<span class="old special">9,99</span>')
+    assert watcher.done
+
+
+def test_self_closing_element_counts_at_once():
+    watcher = _feed(FieldWatcher({"ean": 'meta[itemprop=gtin13]'}), '<meta itemprop="gtin13" content="383" />')
+    assert watcher.done and watcher.found == {"ean"}
+
+
+def test_container_completes_a_field_whose_preferred_element_is_missing():
+    watcher = FieldWatcher({"naziv": "h1", "cena": "div.product-info"})
+    _feed(watcher, '<h1>Deska</h1><div class="product-info"><div class="description">Smreka</div>',
+          '<span class="price-new">12,00</span>')
+    assert not watcher.done
+    _feed(watcher, '</div><div class="related">')
+    assert watcher.done and watcher.found == {"naziv", "cena"}
@@ -0,0 +1,38 @@
+from ceniki.listingcache import ListingCache, listings_path
+
+PAGES = [["/a", "/b"], ["/c"]]
+
+
+def _cache(tmp_path):
+    return ListingCache(listings_path(str(tmp_path / "KALCER" / "2026-10-19" / "KALCER_Podatki_19.json")))
+
+
+def test_path_is_next_to_the_daily_folders(tmp_path):
+    assert _cache(tmp_path).path == str(tmp_path / "KALCER" / "KALCER_ListingCache.json")
+
+
+def test_stored_walk_is_reused_after_reload(tmp_path):
+    (tmp_path / "KALCER").mkdir()
+    cache = _cache(tmp_path)
+    cache.store("Les", PAGES, ["/a", "/b", "/c"], total=3, size=2)
+    cache.close()
+
+    cache = _cache(tmp_path)
+    assert cache.reuse("Les", ["/a", "/b"], total=3, size=2) == ["/a", "/b", "/c"]
+    assert (cache.hits, cache.skipped) == (1, 1)
+
+
+def test_changed_first_page_total_or_size_means_a_full_walk(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("Les", PAGES, ["/a", "/b", "/c"], total=3, size=2)
+    assert cache.reuse("Les", ["/a", "/x"], total=3, size=2) is None
+    assert cache.reuse("Les", ["/a", "/b"], total=4, size=2) is None
+    assert cache.reuse("Les", ["/a", "/b"], total=3, size=50) is None
+    assert cache.reuse("Drugo", ["/a", "/b"], total=3, size=2) is None
+    assert cache.misses == 4
+
+
+def test_nothing_is_written_without_a_stored_walk(tmp_path):
+    cache = _cache(tmp_path)
+    cache.close()
+    assert not (tmp_path / "KALCER").exists()
@@ -0,0 +1,91 @@
+import pytest
+
+from ceniki.pagesize import PageSize, reported_total
+
+
+def test_url_adds_the_parameter_before_the_fragment():
+    sizes = PageSize("limit", (100, 50))
+    assert sizes.url("https://x.si/les") == "https://x.si/les?limit=100"
+    assert sizes.url("https://x.si/les?p=2#top") == "https://x.si/les?p=2&limit=100#top"
+
+
+def test_full_first_page_confirms_the_size():
+    sizes = PageSize("limit", (100, 50))
+    assert sizes.first_page(100, has_next=True)
+    assert sizes.confirmed and sizes.size == 100
+    # Po potrditvi kratka stran ne spremeni ničesar.
+    assert sizes.first_page(3, has_next=True)
+    assert sizes.size == 100
+
+
+def test_short_page_with_a_next_page_rejects_the_size():
+    sizes = PageSize("limit", (100, 50))
+    assert not sizes.first_page(24, has_next=True)
+    assert sizes.size == 50
+    assert not sizes.first_page(24, has_next=True)
+    assert sizes.size is None
+    assert sizes.url("https://x.si/les") == "https://x.si/les"
+    assert sizes.first_page(24, has_next=True)
+
+
+def test_empty_or_short_last_page_is_inconclusive():
+    sizes = PageSize("limit", (100, 50))
+    assert sizes.first_page(0, has_next=False)
+    assert sizes.first_page(7, has_next=False)
+    assert sizes.size == 100 and not sizes.confirmed
+
+
+def test_empty_page_with_a_next_page_rejects_the_size():
+    sizes = PageSize("limit", (100, 50))
+    assert not sizes.first_page(0, has_next=True)
+    assert sizes.size == 50
+
+
+def test_incomplete_listing_rejects_the_size():
+    sizes = PageSize("limit", (100, 50))
+    assert sizes.complete(400, 400)
+    assert sizes.complete(12, None)
+    assert not sizes.complete(200, 400)
+    assert sizes.size == 50
+
+
+def test_reported_total():
+    assert reported_total("Prikazujem 1 do 20 od 1.400 (70 strani)") == 1400
+    assert reported_total("Najdenih 37 izdelkov") == 37
+    assert reported_total("") is None
+
+
+def test_shortfall_under_a_confirmed_size_is_only_logged():
+    sizes = PageSize("limit", (100, 50))
+    assert sizes.first_page(100, has_next=True)
+    assert sizes.complete(380, 400)
+    assert sizes.size == 100 and sizes.confirmed
+
+
+def _listing(start, count, total):
+    items = "".join(f'<div><div class="name"><a href="/p{n}">P{n}</a></div></div>'
+                    for n in range(start, start + count))
+    return (f'<div class="product-list">{items}</div><div class="pagination-results">'
+            f'<div class="text-right">Prikazujem {start} do {start + count - 1} od {total}</div></div>')
+
+
+def test_interrupted_walk_keeps_the_page_size(monkeypatch):
+    pytest.importorskip("requests")
+    pytest.importorskip("bs4")
+    import KalcerV1
+    from ceniki.fetch import Page
+
+    monkeypatch.setattr(KalcerV1, "_page_size", PageSize("limit", (100, 50)))
+    monkeypatch.setattr(KalcerV1.trace, "sleep", lambda seconds: None)
+    requested = []
+
+    def page_content(url):
+        requested.append(url)
+        # Druga stran ne uspe (npr. prekinjena povezava).
+        return Page(_listing(1, 100, 400).encode("utf-8"), "utf-8") if len(requested) == 1 else None
+
+    monkeypatch.setattr(KalcerV1, "get_page_content", page_content)
+    links = KalcerV1.get_product_links_from_category("https://x.si/les?cat=1")
+    assert len(links) == 100
+    assert len(requested) == 2
+    assert KalcerV1._page_size.size == 100
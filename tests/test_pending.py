@@ -0,0 +1,50 @@
+import json
+
+from ceniki.pending import clear_pending, finished, load_pending, pending_path, resume_work, save_pending
+
+CRAWL = [("Les", "/les"), ("Plošče", "/plosce"), ("Vijaki", "/vijaki")]
+
+
+def _output(root, day):
+    path = root / "Ceniki_Scraping" / "KALCER" / day / f"KALCER_Podatki_{day}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return str(path)
+
+
+def test_pending_file_is_shared_by_the_shop_days(tmp_path):
+    first, second = _output(tmp_path, "2026-10-18"), _output(tmp_path, "2026-10-19")
+    assert pending_path(first) == pending_path(second) == str(tmp_path / "Ceniki_Scraping" / "KALCER" /
+                                                              "KALCER_Pending.json")
+
+
+def test_round_trip_keeps_items_as_tuples(tmp_path):
+    output = _output(tmp_path, "2026-10-18")
+    path = pending_path(output)
+    save_pending(path, CRAWL[1:], reason="deadline", json_path=output)
+    assert load_pending(path) == CRAWL[1:]
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["reason"] == "deadline"
+    clear_pending(path, output)
+    assert load_pending(path) == []
+
+
+def test_same_day_resumes_only_the_pending_items(tmp_path):
+    output = _output(tmp_path, "2026-10-18")
+    path = pending_path(output)
+    assert resume_work(path, output, lambda: list(CRAWL)) == (CRAWL, 0)
+    save_pending(path, [CRAWL[2]], json_path=output)
+    assert resume_work(path, output, lambda: list(CRAWL)) == ([CRAWL[2]], 1)
+    assert not finished(output)
+
+
+def test_next_day_does_the_pending_items_first_then_the_rest(tmp_path):
+    first, second = _output(tmp_path, "2026-10-18"), _output(tmp_path, "2026-10-19")
+    path = pending_path(first)
+    save_pending(path, [CRAWL[2]], json_path=first)
+    work, resumed = resume_work(path, second, lambda: list(CRAWL))
+    assert work == [CRAWL[2], CRAWL[0], CRAWL[1]] and resumed == 1
+
+    clear_pending(path, second)
+    assert finished(second)
+    assert not finished(first)
+    assert load_pending(path) == []
@@ -0,0 +1,42 @@
+import pytest
+
+from ceniki.snapshots import SnapshotStore
+
+DAYS = ["2026-10-17", "2026-10-18", "2026-10-19"]
+
+
+def _run(day, prices):
+    return [{"Zap": n, "URL": f"/p{n}", "Cena / EM (z DDV)": price, "Veljavnost od": day, "DDV": "22"}
+            for n, price in enumerate(prices, 1)]
+
+
+RUNS = [_run(DAYS[0], ["1,00", "2,00", "3,00"]),
+        _run(DAYS[1], ["1,00", "2,50", "3,00"]),
+        _run(DAYS[2], ["1,00", "2,50"])]
+
+
+def test_every_day_is_restored_exactly(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    kinds = [store.add(day, records)["kind"] for day, records in zip(DAYS, RUNS)]
+    assert kinds == ["base", "delta", "delta"]
+
+    store = SnapshotStore(str(tmp_path))
+    assert store.dates() == DAYS
+    for day, records in zip(DAYS, RUNS):
+        assert store.load(day) == records
+
+
+def test_a_new_base_is_written_once_the_chain_is_full(tmp_path):
+    store = SnapshotStore(str(tmp_path), max_chain=1)
+    kinds = [store.add(day, records)["kind"] for day, records in zip(DAYS, RUNS)]
+    assert kinds == ["base", "delta", "base"]
+    assert store.load(DAYS[1]) == RUNS[1]
+
+
+def test_days_must_be_added_in_order(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.add(DAYS[1], RUNS[1])
+    with pytest.raises(ValueError):
+        store.add(DAYS[0], RUNS[0])
+    with pytest.raises(KeyError):
+        store.load(DAYS[2])
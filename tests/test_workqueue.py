@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from ceniki.workqueue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.seed("KALCER", [["Les", "/les"]])
+    return queue
+
+
+def test_seeding_twice_keeps_one_task(queue):
+    assert queue.seed("KALCER", [["Les", "/les"]]) == 0
+    assert queue.counts("KALCER") == {"ready": 1}
+
+
+def test_listing_then_details_then_results(queue):
+    task = queue.lease("KALCER", "w1")
+    assert task["kind"] == "listing" and task["group"] == ["Les", "/les"] and task["attempts"] == 0
+    assert queue.lease("KALCER", "w2") is None
+    assert queue.put_details("KALCER", task["group"], [("/a", "/a", 0.0), ("/b", "/b", 0.0)]) == 2
+    assert queue.ack(task["id"], "w1")
+
+    for worker in ("w1", "w2"):
+        detail = queue.lease("KALCER", worker)
+        assert queue.ack(detail["id"], worker, {"URL": detail["task"]})
+    assert queue.counts("KALCER") == {"done": 3}
+    assert queue.results("KALCER") == [{"URL": "/a"}, {"URL": "/b"}]
+
+
+def test_expired_lease_is_handed_out_again_and_counts_an_attempt(queue):
+    first = queue.lease("KALCER", "w1", 0.01)
+    time.sleep(0.02)
+    second = queue.lease("KALCER", "w2", 60.0)
+    assert second["id"] == first["id"] and second["attempts"] == 1
+    # Prvi delavec je zakup izgubil.
+    assert not queue.ack(first["id"], "w1")
+    assert queue.ack(second["id"], "w2")
+
+
+def test_task_fails_once_expired_leases_use_up_the_attempts(queue):
+    for attempts in range(2):
+        assert queue.lease("KALCER", "w", 0.01, max_attempts=2)["attempts"] == attempts
+        time.sleep(0.02)
+    assert queue.lease("KALCER", "w", 0.01, max_attempts=2) is None
+    assert queue.counts("KALCER") == {"failed": 1}
+
+
+def test_fail_retries_after_the_delay_until_max_attempts(queue):
+    task = queue.lease("KALCER", "w")
+    assert queue.fail(task["id"], "w", "timeout", delay=0.0, max_attempts=2)
+    task = queue.lease("KALCER", "w")
+    assert task["attempts"] == 1
+    assert queue.fail(task["id"], "w", "timeout", delay=0.0, max_attempts=2)
+    assert queue.counts("KALCER") == {"failed": 1}
+
+
+def test_release_does_not_count_an_attempt(queue):
+    task = queue.lease("KALCER", "w")
+    assert queue.release(task["id"], "w")
+    assert queue.lease("KALCER", "w")["attempts"] == 0